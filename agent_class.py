@@ -1,52 +1,161 @@
-from llama_index.core.tools import QueryEngineTool, FunctionTool
-from llama_index.core.agent import ReActAgent
-from llama_index.core.memory import ChatMemoryBuffer
-from tools import download_pdf, fetch_arxiv_papers
+import time
+from typing import Optional
+
+from llama_index.core.tools import FunctionTool
+from llama_index.core.agent.workflow import AgentStream, ToolCall, ToolCallResult
+from llama_index.core.query_engine import RetrieverQueryEngine
+from llama_index.core.workflow import Context
+from tools import TOOL_TIMEOUTS, adownload_pdf, afetch_arxiv_papers, download_pdf, fetch_arxiv_papers, with_timeout
+from parallel_react_agent import ParallelReActAgent
+from query_cache import CachedQueryEngine, normalize_query
+from instrumentation import tracer
+from metadata_index import normalize_filters, to_metadata_filters
+from session_memory import SessionMemory
+from singleflight import SingleFlight
 
 class Agent:
-    def __init__(self, index, llm_model, memory=None):
+    def __init__(self, index, llm_model, memory=None, embed_model=None, retriever=None, query_cache=None,
+                 streaming=True, similarity_top_k=5, node_postprocessors=None, retriever_factory=None,
+                 tool_timeouts=None):
         """
         Khởi tạo Agent quản lý quy trình RAG và Tool use.
         
         Args:
             index (VectorStoreIndex): Bộ chỉ mục chứa dữ liệu bài báo (đã được load).
             llm_model (Gemini): Mô hình LLM để suy luận.
-            memory (ChatMemoryBuffer): Bộ nhớ hội thoại (optional).
+            memory (BaseMemory): Bộ nhớ hội thoại (optional, mặc định SessionMemory: giữ nguyên văn vài lượt
+                gần nhất, tóm tắt các lượt cũ, lưu riêng output lớn của tool).
+            embed_model (BaseEmbedding): Mô hình embedding dùng để mã hóa câu hỏi (optional,
+                mặc định dùng embed model của index). Nên truyền CachedEmbedding để cache câu hỏi.
+            retriever (BaseRetriever): Retriever tùy chỉnh (optional, ví dụ NumpyVectorRetriever);
+                mặc định dùng retriever của index.
+            query_cache (QueryResultCache): Cache câu trả lời của RAG tool (optional), nên dùng chung
+                giữa các phiên để câu hỏi lặp lại được trả lời ngay mà không gọi Gemini.
+            streaming (bool): Stream token từ LLM (cần cho stream_chat hiển thị câu trả lời dần dần).
+            similarity_top_k (int): Số chunk lấy từ index mỗi lần tìm (khi không truyền retriever).
+            node_postprocessors (list): Các bước xử lý chunk trước khi gửi cho LLM (optional), ví dụ
+                [LexicalReranker(top_n=3), SentenceCompressor()] với similarity_top_k=50
+                để lấy nhiều ứng viên nhưng chỉ gửi vài chunk tốt nhất.
+            retriever_factory (callable): Nhận dict bộ lọc metadata, trả về retriever chỉ tìm trong các
+                chunk thỏa bộ lọc (hoặc None nếu không có chunk nào), ví dụ
+                PersistentIndexManager.build_filtered_retriever. Mặc định lọc bằng MetadataFilters của index.
+            tool_timeouts (dict): Thời gian tối đa (giây) của từng tool theo tên, ghi đè tools.TOOL_TIMEOUTS
+                (optional). Quá thời gian thì Agent nhận thông báo lỗi và tiếp tục suy luận.
         """
         self.index = index
         self.llm_model = llm_model
+        self.embed_model = embed_model
+        self.retriever = retriever
+        self.query_cache = query_cache
+        self.streaming = streaming
+        self.similarity_top_k = similarity_top_k
+        self.node_postprocessors = node_postprocessors or []
+        self.retriever_factory = retriever_factory
+        self.tool_timeouts = {**TOOL_TIMEOUTS, **(tool_timeouts or {})}
+        # Agent dùng chung cho mọi phiên: câu hỏi RAG giống nhau đang chạy cùng lúc chỉ truy vấn một lần
+        self.query_flight = SingleFlight("rag_query")
         
         # Tạo bộ nhớ để lưu lịch sử hội thoại (do Workflow Agent là stateless)
         # Nếu được truyền vào thì dùng, không thì tạo mới
-        self.memory = memory if memory else ChatMemoryBuffer.from_defaults(token_limit=20000)
+        self.memory = memory if memory else SessionMemory.from_defaults()
         
         # Xây dựng các thành phần của Agent
         self.build_query_engine()
         self.build_rag_tool()
         self.build_pdf_download_tool()
         self.build_fetch_arxiv_tool()
+        self.build_stored_output_tool()
         self.build_agent()
 
     def build_query_engine(self):
         """Tạo 'Động cơ tìm kiếm' từ Index để tra cứu thông tin."""
-        self.query_engine = self.index.as_query_engine(
-            llm=self.llm_model,
-            similarity_top_k=5,  # Lấy 5 tài liệu liên quan nhất mỗi lần tìm
+        if self.retriever is not None:
+            self.query_engine = RetrieverQueryEngine.from_args(
+                self.retriever, llm=self.llm_model, node_postprocessors=self.node_postprocessors
+            )
+        else:
+            kwargs = {"embed_model": self.embed_model} if self.embed_model is not None else {}
+            self.query_engine = self.index.as_query_engine(
+                llm=self.llm_model,
+                similarity_top_k=self.similarity_top_k,  # Mặc định lấy 5 tài liệu liên quan nhất mỗi lần tìm
+                node_postprocessors=self.node_postprocessors,
+                **kwargs,
+            )
+        if self.query_cache is not None:
+            self.query_engine = CachedQueryEngine(query_engine=self.query_engine, cache=self.query_cache)
+
+    def build_filtered_query_engine(self, filters):
+        """
+        Tạo query engine chỉ tìm trong các chunk thỏa bộ lọc metadata.
+
+        Returns:
+            RetrieverQueryEngine: Hoặc None nếu không có chunk nào thỏa bộ lọc.
+        """
+        if self.retriever_factory is not None:
+            retriever = self.retriever_factory(filters)
+        else:
+            kwargs = {"embed_model": self.embed_model} if self.embed_model is not None else {}
+            retriever = self.index.as_retriever(
+                similarity_top_k=self.similarity_top_k, filters=to_metadata_filters(filters), **kwargs
+            )
+        if retriever is None:
+            return None
+        return RetrieverQueryEngine.from_args(retriever, llm=self.llm_model, node_postprocessors=self.node_postprocessors)
+
+    async def query_papers(
+        self,
+        query: str,
+        category: Optional[str] = None,
+        author: Optional[str] = None,
+        published_after: Optional[str] = None,
+        published_before: Optional[str] = None,
+    ) -> str:
+        """
+        Tra cứu RAG trong cơ sở dữ liệu bài báo, có thể lọc theo category/tác giả/ngày đăng
+        (hàm của research_paper_query_tool).
+        """
+        try:
+            filters = normalize_filters({
+                "category": category,
+                "author": author,
+                "published_after": published_after,
+                "published_before": published_before,
+            })
+        except ValueError as e:
+            return f"Invalid filter: {e}"
+        return await self.query_flight.do(
+            (normalize_query(query), tuple(sorted(filters.items()))), self._query_papers, query, filters
         )
 
+    async def _query_papers(self, query, filters):
+        if not filters:
+            return str(await self.query_engine.aquery(query))
+        # Có bộ lọc thì không dùng cache câu trả lời (cache chỉ theo câu hỏi, không theo bộ lọc)
+        query_engine = self.build_filtered_query_engine(filters)
+        if query_engine is None:
+            return f"No papers in the local database match the filters {filters}."
+        return str(await query_engine.aquery(query))
+
     def build_rag_tool(self):
         """Đóng gói Query Engine thành một Tool để Agent sử dụng."""
         # Lưu vào biến rag_tool (khác với tên hàm để tránh lỗi)
-        self.rag_tool = QueryEngineTool.from_defaults(
-            self.query_engine,
+        self.rag_tool = FunctionTool.from_defaults(
+            async_fn=with_timeout(self.query_papers, "research_paper_query_tool",
+                                  self.tool_timeouts.get("research_paper_query_tool")),
             name="research_paper_query_tool",
-            description="A RAG engine with recent research papers.",
+            description=(
+                "A RAG engine with recent research papers. Arguments: query (the question); optional filters "
+                "that restrict the search to matching papers: category (arXiv category, e.g. 'quant-ph'), "
+                "author (author surname), published_after and published_before (dates as YYYY-MM-DD)."
+            ),
         )
 
     def build_pdf_download_tool(self):
         """Tạo Tool cho phép Agent tải file PDF từ link."""
+        # Agent chạy async: dùng bản async (tải trong thread pool của tools) để không chặn event loop
         self.pdf_download_tool = FunctionTool.from_defaults(
-            download_pdf,
+            fn=download_pdf,
+            async_fn=with_timeout(adownload_pdf, "download_pdf_file_tool", self.tool_timeouts.get("download_pdf_file_tool")),
             name="download_pdf_file_tool",
             description="python function that downloads a PDF file by link.",
         )
@@ -55,10 +164,28 @@ class Agent:
         """Tạo Tool cho phép Agent tìm kiếm bài báo trên Arxiv."""
         self.fetch_arxiv_tool = FunctionTool.from_defaults(
             fn=fetch_arxiv_papers, # Dùng hàm import từ tools.py
+            async_fn=with_timeout(afetch_arxiv_papers, "fetch_from_arxiv", self.tool_timeouts.get("fetch_from_arxiv")),
             name="fetch_from_arxiv",
             description="download the {max_results} recent papers regarding the {topic} from arxiv",
         )
 
+    async def read_stored_output(self, ctx: Context, ref: str) -> str:
+        """Đọc lại output đầy đủ mà bộ nhớ hội thoại đã lưu riêng (hàm của read_stored_output)."""
+        memory = await ctx.store.get("memory", default=None)
+        content = memory.resolve(ref) if hasattr(memory, "resolve") else None
+        return content if content is not None else f"No stored output with ref {ref}."
+
+    def build_stored_output_tool(self):
+        """Tạo Tool cho phép Agent đọc lại output lớn của các lượt trước (SessionMemory chỉ giữ tham chiếu)."""
+        self.stored_output_tool = FunctionTool.from_defaults(
+            async_fn=self.read_stored_output,
+            name="read_stored_output",
+            description=(
+                "Returns the full text of an earlier tool output that the conversation history only shows as "
+                "'[stored output <ref>, ...]' with a short preview. Argument: ref (e.g. 'mem-0123456789ab')."
+            ),
+        )
+
     def build_agent(self):
         """Lắp ráp và khởi tạo ReAct Agent."""
         
@@ -68,29 +195,97 @@ class Agent:
         
         RULES:
         1. When asked about a topic, FIRST query the 'research_paper_query_tool' to check if you already have information in your local database.
-        2. IF relevant papers are found locally, use them to answer.
+        2. IF relevant papers are found locally, use them to answer. When the user asks about a category, an author or a time period, pass them as filters of 'research_paper_query_tool'.
         3. IF NOT found locally (or if the user specifically asks for *new* papers), use 'fetch_from_arxiv' to get new papers.
         4. IMPORTANT: Do NOT use 'download_pdf_file_tool' unless the user strictly commands you to "download" or "save" the papers.
         5. Always provide the Title, Summary, and Authors when introducing a paper.
+        6. Older tool outputs may appear as '[stored output <ref>, ...]' followed by a preview. Call 'read_stored_output' with that ref only if you need more than the preview.
+        7. When several tool calls do not depend on each other (e.g. downloading several PDFs), write all of them in the same step as consecutive 'Action:' / 'Action Input:' pairs. They run in parallel and you get one Observation per action, in the same order.
         """
         
-        # Sử dụng class constructor trực tiếp
-        self.agent = ReActAgent(
-            tools=[self.pdf_download_tool, self.rag_tool, self.fetch_arxiv_tool],
+        # Sử dụng class constructor trực tiếp (ReActAgent chạy được nhiều tool song song trong một bước)
+        self.agent = ParallelReActAgent(
+            tools=[self.pdf_download_tool, self.rag_tool, self.fetch_arxiv_tool, self.stored_output_tool],
             llm=self.llm_model,
             verbose=True,
-            streaming=False,     # Tắt streaming để tránh lỗi với Gemini
+            streaming=self.streaming,  # Bật để stream_chat trả token ngay khi Gemini sinh ra
             system_prompt=system_prompt  # Truyền chỉ dẫn vào Agent
         )
 
-    async def chat(self, message: str):
+    async def chat(self, message: str, memory=None):
         """
         Gửi tin nhắn đến Agent và nhận câu trả lời (Bất đồng bộ).
+
+        Args:
+            message (str): Tin nhắn của người dùng.
+            memory (BaseMemory): Bộ nhớ của phiên chat (optional, mặc định self.memory).
+                Workflow Agent không giữ trạng thái, nên một Agent có thể phục vụ nhiều phiên
+                chỉ bằng cách truyền memory riêng của mỗi phiên.
         """
-        # Sử dụng .run() và truyền memory vào để Agent nhớ ngữ cảnh (Logic cũ của bạn)
-        response = await self.agent.run(
-            user_msg=message,
-            memory=self.memory,
-            max_iterations=10    # Giới hạn số bước suy luận để tránh loop vô hạn
-        )
-        return str(response)
\ No newline at end of file
+        # Dùng chung luồng sự kiện với stream_chat để lượt chat luôn được đo thời gian từng bước
+        async for event in self.stream_chat(message, memory=memory):
+            if event["type"] == "answer":
+                return event["text"]
+
+    async def stream_chat(self, message: str, memory=None):
+        """
+        Gửi tin nhắn đến Agent và nhận kết quả dạng stream (async generator).
+        memory: giống chat().
+
+        Yields:
+            dict: Các sự kiện theo thứ tự xảy ra:
+                - {"type": "tool_call", "tool_name": ..., "tool_kwargs": {...}}
+                - {"type": "tool_result", "tool_name": ..., "output": "..."}
+                - {"type": "token", "delta": "..."}: từng phần của câu trả lời cuối cùng
+                - {"type": "answer", "text": "...", "trace": {...}}: câu trả lời đầy đủ (luôn là sự kiện cuối),
+                  kèm bảng thời gian từng bước của lượt chat (TurnTrace.breakdown())
+        """
+        # Span gốc phải có trước khi workflow tạo task, để mọi span con (LLM, tool, truy vấn) thuộc lượt này
+        with tracer.turn("agent.turn") as turn:
+            handler = self.agent.run(
+                user_msg=message,
+                memory=memory if memory is not None else self.memory,
+                max_iterations=10    # Giới hạn số bước suy luận để tránh loop vô hạn
+            )
+            # Mỗi bước ReAct, LLM sinh "Thought: ... Action: ..." hoặc "Thought: ... Answer: ...".
+            # Chỉ phần sau "Answer:" mới là câu trả lời cho người dùng.
+            answer = None
+            try:
+                async for event in self._stream_events(handler):
+                    if event["type"] == "answer":
+                        answer = event
+                    else:
+                        yield event
+            finally:
+                # Người gọi dừng giữa chừng (đóng generator/hủy task): dừng luôn workflow đang chạy
+                if not handler.done():
+                    await handler.cancel_run()
+        answer["trace"] = turn.breakdown()
+        yield answer
+
+    async def _stream_events(self, handler):
+        last_response = ""
+        emitted = 0
+        tool_started = {}  # tool_id -> (thời điểm, perf_counter) khi Agent gọi tool
+        async for event in handler.stream_events():
+            if isinstance(event, AgentStream):
+                if not event.response.startswith(last_response):
+                    emitted = 0  # Bắt đầu một lần gọi LLM mới
+                last_response = event.response
+                marker = last_response.find("Answer:")
+                if marker >= 0:
+                    answer = last_response[marker + len("Answer:"):].lstrip()
+                    if len(answer) > emitted:
+                        yield {"type": "token", "delta": answer[emitted:]}
+                        emitted = len(answer)
+            elif isinstance(event, ToolCallResult):
+                if event.tool_id in tool_started:
+                    start, start_perf = tool_started.pop(event.tool_id)
+                    tracer.record_span(f"tool.{event.tool_name}", start, (time.perf_counter() - start_perf) * 1000)
+                    tracer.incr("tool_calls_total", tool=event.tool_name)
+                yield {"type": "tool_result", "tool_name": event.tool_name, "output": str(event.tool_output)}
+            elif isinstance(event, ToolCall):
+                tool_started[event.tool_id] = (time.time(), time.perf_counter())
+                yield {"type": "tool_call", "tool_name": event.tool_name, "tool_kwargs": event.tool_kwargs}
+        response = await handler
+        yield {"type": "answer", "text": str(response)}
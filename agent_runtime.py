@@ -0,0 +1,198 @@
+import asyncio
+import functools
+import os
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from agent_class import Agent
+from constants import get_embed_model, get_index_manager, get_llm
+from llm_limiter import ConcurrencyLimitedLLM
+from query_cache import QueryResultCache
+from reranker import SentenceCompressor, build_reranker
+
+
+class BackgroundLoop:
+    def __init__(self, name="agent-runtime-loop"):
+        """
+        Một event loop asyncio chạy mãi trong thread nền (daemon).
+
+        Mọi coroutine của Agent đều chạy trên cùng loop này, nên các client async
+        (Gemini gRPC, aiohttp...) tạo một lần có thể dùng lại giữa các lần chạy lại
+        script của Streamlit mà không cần nest_asyncio.
+        """
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def run(self, coro, timeout=None):
+        """Chạy coroutine trên loop nền và chờ kết quả (gọi được từ bất kỳ thread nào)."""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result(timeout)
+
+    def iterate(self, agen):
+        """
+        Duyệt một async generator chạy trên loop nền như một generator đồng bộ.
+
+        Toàn bộ generator chạy trong một task duy nhất (workflow của LlamaIndex dùng ContextVar,
+        không thể chia mỗi phần tử ra một task riêng); phần tử được chuyển qua một queue.
+        """
+        items = queue.Queue()
+        done = object()
+
+        async def pump():
+            try:
+                async for item in agen:
+                    items.put((item, None))
+            except BaseException as e:
+                items.put((done, e))
+                raise
+            items.put((done, None))
+
+        future = asyncio.run_coroutine_threadsafe(pump(), self.loop)
+        try:
+            while True:
+                item, error = items.get()
+                if item is done:
+                    if error is not None and not isinstance(error, asyncio.CancelledError):
+                        raise error
+                    return
+                yield item
+        finally:
+            # Người gọi dừng giữa chừng: hủy task trên loop nền
+            future.cancel()
+
+    def stop(self):
+        async def cancel_pending():
+            tasks = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+        self.run(cancel_pending())
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join()
+        self.loop.close()
+
+
+class AgentRuntime:
+    def __init__(self, llm_model, embed_model, index_manager, query_cache=None, retriever=None, **agent_kwargs):
+        """
+        Agent dùng chung cho cả process (tạo một lần, dùng cho mọi phiên/người dùng).
+
+        Giữ lâu dài: LLM, embedding, index manager (kết nối Pinecone hoặc index local),
+        index, query engine, các tool và ReActAgent. Mỗi phiên chỉ giữ bộ nhớ hội thoại
+        riêng (chat_memory) và truyền vào chat()/stream_chat().
+
+        Args:
+            llm_model (LLM): Mô hình LLM dùng chung.
+            embed_model (BaseEmbedding): Mô hình embedding dùng chung.
+            index_manager (PersistentIndexManager): Index manager dùng chung (một kết nối vector store).
+            query_cache (QueryResultCache): Cache câu trả lời của RAG tool (optional).
+            retriever (BaseRetriever): Retriever tùy chỉnh (optional).
+            **agent_kwargs: Tham số khác cho Agent (similarity_top_k, node_postprocessors...).
+                Mặc định RAG tool lọc theo metadata bằng index_manager.build_filtered_retriever.
+        """
+        self.llm_model = llm_model
+        self.embed_model = embed_model
+        self.index_manager = index_manager
+        self.query_cache = query_cache
+        self.background = BackgroundLoop()
+        self.index = index_manager.retrieve_index()
+        if hasattr(index_manager, "build_filtered_retriever"):
+            top_k = agent_kwargs.get("similarity_top_k", 5)
+            agent_kwargs.setdefault("retriever_factory", functools.partial(
+                index_manager.build_filtered_retriever, index=self.index, similarity_top_k=top_k, candidate_k=top_k
+            ))
+        self.agent = Agent(
+            self.index,
+            llm_model,
+            embed_model=embed_model,
+            retriever=retriever,
+            query_cache=query_cache,
+            **agent_kwargs,
+        )
+        self._ingest_lock = threading.Lock()
+
+    def chat(self, message, memory):
+        """
+        Gửi tin nhắn của một phiên và chờ câu trả lời (hàm đồng bộ).
+
+        Args:
+            message (str): Tin nhắn của người dùng.
+            memory (BaseMemory): Bộ nhớ hội thoại của phiên (ví dụ SessionMemory).
+        Returns:
+            str: Câu trả lời.
+        """
+        return self.background.run(self.agent.chat(message, memory=memory))
+
+    async def achat(self, message, memory):
+        """
+        Giống chat() nhưng await được từ một event loop khác (ví dụ server HTTP): lượt chat vẫn chạy
+        trên loop nền, nên mọi phiên dùng chung client, semaphore LLM và các lời gọi đang được gộp.
+        Hủy lời chờ (client ngắt kết nối) thì lượt chat cũng bị hủy.
+        """
+        future = asyncio.run_coroutine_threadsafe(self.agent.chat(message, memory=memory), self.background.loop)
+        return await asyncio.wrap_future(future)
+
+    def stream_chat(self, message, memory):
+        """Giống Agent.stream_chat nhưng là generator đồng bộ (dùng trực tiếp trong Streamlit)."""
+        return self.background.iterate(self.agent.stream_chat(message, memory=memory))
+
+    def ingest_uploaded_files(self, file_paths):
+        """Nạp file qua index manager dùng chung (không mở kết nối vector store mới). Trả về (bool, msg)."""
+        with self._ingest_lock:
+            return self.index_manager.ingest_uploaded_files(file_paths)
+
+    def close(self):
+        self.background.stop()
+
+
+def build_runtime(llm_model=None, embed_model=None, index_manager=None, max_llm_concurrency=None):
+    """
+    Dựng AgentRuntime theo cấu hình của app (biến môi trường INDEX_BACKEND, CANDIDATE_K, RERANKER, RERANK_TOP_N).
+
+    Thành phần nào không truyền vào thì lấy từ các factory trong constants. LLM và index manager
+    đều phải gọi mạng khi tạo (Gemini hỏi thông tin model, Pinecone mô tả index) nên được tạo song song.
+
+    Args:
+        llm_model (LLM): LLM (optional, mặc định constants.get_llm()).
+        embed_model (BaseEmbedding): Mô hình embedding (optional, mặc định constants.get_embed_model()).
+        index_manager (PersistentIndexManager): Index manager (optional, mặc định constants.get_index_manager(),
+            dùng embedding mặc định nên khi truyền embed_model khác thì nên truyền cả index_manager).
+        max_llm_concurrency (int): Số lời gọi LLM chạy cùng lúc tối đa, dùng chung cho mọi phiên
+            (None = biến môi trường LLM_MAX_CONCURRENCY, mặc định 8; 0 = không giới hạn).
+    Returns:
+        AgentRuntime
+    """
+    embed_model = embed_model or get_embed_model()
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        llm_future = pool.submit(get_llm) if llm_model is None else None
+        manager_future = pool.submit(get_index_manager) if index_manager is None else None
+        llm_model = llm_future.result() if llm_future else llm_model
+        index_manager = manager_future.result() if manager_future else index_manager
+    if max_llm_concurrency is None:
+        max_llm_concurrency = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+    if max_llm_concurrency > 0:
+        llm_model = ConcurrencyLimitedLLM(llm_model, max_concurrency=max_llm_concurrency)
+    # Cache câu trả lời RAG dùng chung cho mọi phiên/người dùng (tự xóa khi nạp tài liệu mới)
+    query_cache = QueryResultCache(embed_model=embed_model)
+    # Tìm kiếm kết hợp vector + BM25 (bắt được arXiv ID, tên tác giả, thuật ngữ). Luôn dựng retriever kết hợp:
+    # BM25 đọc lại SQLite mỗi câu hỏi, nên tài liệu nạp sau khi khởi động (kể cả từ chỉ mục đang trống) vẫn được tìm;
+    # chỉ mục trống thì BM25 trả về rỗng và kết quả chính là của vector store
+    # Lấy nhiều ứng viên (CANDIDATE_K) rồi rerank trên CPU, chỉ gửi vài chunk tốt nhất (đã rút gọn) cho Gemini
+    candidate_k = int(os.getenv("CANDIDATE_K", "50"))
+    reranker = build_reranker(os.getenv("RERANKER", "lexical"), top_n=int(os.getenv("RERANK_TOP_N", "3")))
+    retriever = index_manager.build_hybrid_retriever(similarity_top_k=candidate_k, candidate_k=candidate_k)
+    return AgentRuntime(
+        llm_model,
+        embed_model,
+        index_manager,
+        query_cache=query_cache,
+        retriever=retriever,
+        similarity_top_k=candidate_k,
+        node_postprocessors=[reranker, SentenceCompressor()],
+    )
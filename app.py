@@ -1,53 +1,137 @@
+import uuid
 import streamlit as st
-import asyncio
-import nest_asyncio
-from agent_class import Agent
-from index_manager import IndexManager
-from constants import GOOGLE_API_KEY, embed_model
-from llama_index.llms.gemini import Gemini
-from llama_index.embeddings.gemini import GeminiEmbedding
-from index_manager_pinecone import IndexManagerPinecone
-from llama_index.core.memory import ChatMemoryBuffer
-
-from index_manager_pinecone import IndexManagerPinecone
-
-# Patch asyncio để tránh lỗi khi chạy lồng trong môi trường có sẵn event loop
-nest_asyncio.apply()
+from instrumentation import setup_instrumentation
+from ingest_jobs import JobQueue
+from ingest_worker import ensure_worker
+from session_memory import SessionMemory, SessionStore
 
 st.set_page_config(page_title="Arxiv Research Agent", page_icon="📚")
 st.title("📚 Arxiv Research Agent")
 
-# 1. Caching Resource cho Index (Dữ liệu nặng)
+# 1. Caching Resource cho Agent (tạo 1 lần cho cả process, dùng chung cho mọi phiên)
 @st.cache_resource
-def load_index_data():
-    """Chỉ load dữ liệu Index 1 lần để tiết kiệm RAM"""
+def load_runtime():
+    """
+    Tạo AgentRuntime một lần: LLM, kết nối Pinecone, index, tool và ReActAgent được dùng lại
+    qua mọi lần chạy lại script. Agent chạy trên event loop nền riêng nên không cần nest_asyncio.
+    """
     try:
-        # Sử dụng embed_model từ constants (đã fix dimension 768)
-        index_manager = IndexManagerPinecone(embed_model, "arxiv-research")
-        index = index_manager.retrieve_index()
-        return index
+        # Ghi span của từng bước (LLM, embedding, truy vấn, tool) ra .cache/traces.jsonl và counter ra .cache/metrics.prom
+        setup_instrumentation()
+        # Import trễ: trang (tiêu đề) hiện ra trước khi nạp Agent/SDK; chỉ SDK của backend đang dùng được nạp
+        from agent_runtime import build_runtime
+
+        return build_runtime()
     except Exception as e:
-        print(f"Index load error: {e}")
+        print(f"Runtime load error: {e}")
         return None
 
-def create_agent(index, memory):
-    """Tạo Agent mới mỗi lần run để gắn đúng Event Loop hiện tại"""
-    # Fix lỗi Loop: Tạo mới LLM instance ngay tại đây thay vì import từ constants
-    llm_model = Gemini(
-        api_key=GOOGLE_API_KEY, 
-        model_name="models/gemini-2.5-flash", 
-        max_tokens=8192
-    )
-    # Truyền memory từ session state vào
-    return Agent(index, llm_model, memory=memory)
+@st.cache_resource
+def load_job_queue():
+    """Hàng đợi job nạp tài liệu (SQLite, dùng chung cho cả process); khởi động worker nền nếu chưa có."""
+    queue = JobQueue()
+    ensure_worker(queue)
+    return queue
+
+@st.cache_resource
+def load_session_store():
+    """Nơi lưu các phiên chat (.cache/sessions.sqlite), dùng chung cho cả process."""
+    return SessionStore()
+
+FILE_ICONS = {"queued": "⏳", "running": "🔄", "done": "✅", "duplicate": "♻️", "failed": "❌"}
+
+def render_ingest_jobs(queue, limit=5):
+    """
+    Hiển thị tiến độ các job nạp tài liệu gần nhất. Khi còn job đang chờ/chạy, vùng này
+    tự vẽ lại mỗi 2 giây (st.fragment) nên phần chat không bị chặn hay chạy lại.
+    """
+    def render():
+        jobs = queue.recent(limit)
+        for job in jobs:
+            done, total = job["progress"]
+            st.progress(done / max(total, 1), text=f"Job #{job['id']}: {job['status']} ({done}/{total} file)")
+            with st.expander("Chi tiết", expanded=job["status"] in ("queued", "running")):
+                for f in job["files"]:
+                    error = f" — {f['error']}" if f["error"] else ""
+                    st.write(f"{FILE_ICONS.get(f['status'], '')} {f['name']}{error}")
+                if job["message"]:
+                    st.caption(job["message"])
+                if job["status"] == "failed" and st.button("Thử lại", key=f"retry_job_{job['id']}"):
+                    queue.retry(job["id"])
+                    ensure_worker(queue)
+                    st.rerun()
+        # Các job vừa xong: chạy lại cả trang một lần để dừng việc tự cập nhật
+        if polling and not any(job["status"] in ("queued", "running") for job in jobs):
+            st.rerun()
+
+    polling = queue.pending_count() > 0
+    st.fragment(render, run_every=2 if polling else None)()
+
+def stream_answer(runtime, prompt, memory, status, placeholder):
+    """
+    Chạy runtime.stream_chat và hiển thị câu trả lời dần dần ngay khi có token mới,
+    các lần gọi tool được ghi vào khung trạng thái.
+
+    Returns:
+        str: Câu trả lời đầy đủ.
+    """
+    answer_text = ""
+    for event in runtime.stream_chat(prompt, memory):
+        if event["type"] == "tool_call":
+            status.update(label=f"🔧 {event['tool_name']}...")
+            status.write(f"🔧 `{event['tool_name']}` {event['tool_kwargs']}")
+        elif event["type"] == "tool_result":
+            status.write(f"✅ `{event['tool_name']}` xong")
+        elif event["type"] == "token":
+            answer_text += event["delta"]
+            placeholder.markdown(answer_text + "▌")
+        elif event["type"] == "answer":
+            answer_text = event["text"]
+            st.session_state.last_trace = event.get("trace")
+    placeholder.markdown(answer_text)
+    return answer_text
+
+def render_trace(container, trace):
+    """
+    Hiển thị thời gian của lượt hỏi gần nhất theo từng bước (LLM, embedding, truy vấn, tool).
+
+    Args:
+        container: Vùng Streamlit để vẽ (st.sidebar.empty()).
+        trace (dict): Kết quả TurnTrace.breakdown() đi kèm sự kiện "answer".
+    """
+    if not trace:
+        return
+    with container.container():
+        st.subheader("⏱️ Lượt hỏi gần nhất")
+        st.write(
+            f"Tổng {trace['total_ms']:.0f} ms · {trace['llm_calls']} lần gọi LLM · "
+            f"{trace['tokens_in']} token vào / {trace['tokens_out']} token ra"
+        )
+        st.dataframe(
+            [{"Bước": s["name"], "Số lần": s["count"], "ms": round(s["total_ms"], 1)} for s in trace["stages"]],
+            hide_index=True,
+        )
 
 # 2. Khởi tạo State ban đầu
-if "messages" not in st.session_state:
-    st.session_state.messages = []
+# Phiên chat được lưu trên ổ cứng và gắn với URL (?session=...): tải lại trang hay khởi động lại app
+# vẫn tiếp tục được cuộc hội thoại cũ
+if "session" not in st.query_params:
+    st.query_params["session"] = uuid.uuid4().hex
 
 # Lưu trữ Chat Memory riêng biệt (không phụ thuộc Agent object)
 if "chat_memory" not in st.session_state:
-    st.session_state.chat_memory = ChatMemoryBuffer.from_defaults(token_limit=20000)
+    st.session_state.chat_memory = SessionMemory.from_defaults(st.query_params["session"], load_session_store())
+
+if "messages" not in st.session_state:
+    st.session_state.messages = st.session_state.chat_memory.transcript()
+
+# 3. Lấy Agent dùng chung (mỗi phiên chỉ giữ st.session_state.chat_memory)
+runtime = load_runtime()
+if runtime is None:
+    st.error("⚠️ Không tìm thấy Index! Hãy chạy file 'build_index.ipynb' để tạo dữ liệu trước.")
+    st.stop()
+
+job_queue = load_job_queue()
 
 # --- SIDEBAR: QUẢN LÝ DỮ LIỆU ---
 with st.sidebar:
@@ -61,41 +145,13 @@ with st.sidebar:
     )
     
     if uploaded_files and st.button("Nạp vào Trí Tuệ"):
-        with st.spinner("Đang đọc và học tài liệu... (Cứ bình tĩnh nhé)"):
-            import os
-            
-            # 1. Lưu file tạm vào ổ cứng để thư viện đọc được
-            temp_dir = "temp_uploads"
-            os.makedirs(temp_dir, exist_ok=True)
-            saved_paths = []
-            
-            for uploaded_file in uploaded_files:
-                file_path = os.path.join(temp_dir, uploaded_file.name)
-                with open(file_path, "wb") as f:
-                    f.write(uploaded_file.getbuffer())
-                saved_paths.append(file_path)
-            
-            # 2. Gọi IndexManagerPinecone để xử lý
-            try:
-                # Tạo manager mới để xử lý upload
-                # Lưu ý: Lúc này hàm khởi tạo sẽ tạo connection tới Pinecone
-                idx_manager = IndexManagerPinecone(embed_model, "arxiv-research")
-                success, msg = idx_manager.ingest_uploaded_files(saved_paths)
-                
-                if success:
-                    st.success(f"✅ {msg}")
-                    # Clear index cache để lần load sau nó cập nhật dữ liệu mới nếu cần
-                    # Tuy nhiên Pinecone là vector store rời, nên query engine sẽ tự tìm thấy data mới.
-                else:
-                    st.error(f"❌ {msg}")
-                    
-            except Exception as e:
-                st.error(f"Lỗi khi xử lý: {e}")
-            
-            # 3. Dọn dẹp file tạm
-            for p in saved_paths:
-                if os.path.exists(p):
-                    os.remove(p)
+        # Chỉ lưu file và gửi job: worker nền (ingest_worker.py) nạp vào index, giao diện không bị treo
+        # và việc nạp vẫn tiếp tục khi trang chạy lại. File đã nạp (trùng hash) được bỏ qua.
+        job_id = job_queue.submit([(f.name, f.getvalue()) for f in uploaded_files])
+        ensure_worker(job_queue)
+        st.toast(f"Đã đưa {len(uploaded_files)} file vào hàng đợi (job #{job_id}).")
+
+    render_ingest_jobs(job_queue)
     
     st.divider()
     
@@ -103,18 +159,12 @@ with st.sidebar:
     if st.button("🗑️ Xóa Lịch Sử Chat", type="primary"):
         st.session_state.messages = []
         st.session_state.chat_memory.reset()
+        st.session_state.last_trace = None
         st.rerun()
 
-# 3. Load Index và Tạo Agent cho Run hiện tại
-index = load_index_data()
-
-if index:
-    # QUAN TRỌNG: Luôn tạo Agent mới cho mỗi lần chạy script
-    # Nhưng dùng lại bộ nhớ cũ (st.session_state.chat_memory)
-    agent = create_agent(index, st.session_state.chat_memory)
-else:
-    st.error("⚠️ Không tìm thấy Index! Hãy chạy file 'build_index.ipynb' để tạo dữ liệu trước.")
-    st.stop()
+    # Thời gian từng bước của lượt hỏi gần nhất (cập nhật ngay sau khi trả lời xong)
+    trace_box = st.sidebar.empty()
+    render_trace(trace_box, st.session_state.get("last_trace"))
 
 # 4. Hiển thị lịch sử chat UI
 for message in st.session_state.messages:
@@ -131,29 +181,15 @@ if prompt := st.chat_input("Ask me anything about research papers!"):
 
         # Xử lý câu trả lời Assistant
     with st.chat_message("assistant"):
-        with st.spinner("Thinking..."):
-            try:
-                # GỌI ASYNC TRỰC TIẾP QUA asyncio.run() ĐÃ PATCH
-                # Vì nest_asyncio.apply() đã được gọi ở đầu, ta có thể dùng loop.run_until_complete an toàn
-                # Hoặc đơn giản hơn: gọi thẳng hàm chat (bên trong agent class đã có cơ chế gọi)
-                
-                # Cách 1: Gọi qua event loop hiện tại (An toàn nhất với Streamlit)
-                loop = asyncio.get_event_loop()
-                answer_text = loop.run_until_complete(agent.chat(prompt))
-                
-                st.markdown(answer_text)
-                
-                # Lưu lịch sử UI
-                st.session_state.messages.append({"role": "assistant", "content": answer_text})
-            except RuntimeError as e:
-                # Nếu loop đã đóng hoặc lỗi loop
-                st.error(f"Async Loop Error: {e}")
-                # Fallback: Tạo loop mới (ít khi cần nhờ nest_asyncio)
-                new_loop = asyncio.new_event_loop()
-                asyncio.set_event_loop(new_loop)
-                answer_text = new_loop.run_until_complete(agent.chat(prompt))
-                st.markdown(answer_text)
-                st.session_state.messages.append({"role": "assistant", "content": answer_text})
-            except Exception as e:
-                import traceback
-                st.error(f"Error details: {traceback.format_exc()}")
+        status = st.status("Thinking...", expanded=False)
+        placeholder = st.empty()
+        try:
+            answer_text = stream_answer(runtime, prompt, st.session_state.chat_memory, status, placeholder)
+            status.update(label="Done", state="complete")
+            render_trace(trace_box, st.session_state.get("last_trace"))
+            # Lưu lịch sử UI
+            st.session_state.messages.append({"role": "assistant", "content": answer_text})
+        except Exception as e:
+            import traceback
+            status.update(label="Error", state="error")
+            st.error(f"Error details: {traceback.format_exc()}")
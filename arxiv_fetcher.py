@@ -0,0 +1,251 @@
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import arxiv
+
+DEFAULT_STORE_PATH = os.path.join(".cache", "arxiv.sqlite")
+
+
+def normalize_topic(topic):
+    """Chuẩn hóa chủ đề tìm kiếm để dùng làm khóa cache."""
+    return re.sub(r"\s+", " ", topic.strip().lower())
+
+
+def arxiv_id_from_url(entry_id):
+    """'http://arxiv.org/abs/2401.01234v2' -> '2401.01234v2'"""
+    return entry_id.rstrip("/").split("/abs/")[-1]
+
+
+def paper_from_result(result):
+    """Chuyển arxiv.Result thành dict (cùng định dạng với tools.fetch_arxiv_papers)."""
+    return {
+        "title": result.title,
+        "authors": [author.name for author in result.authors],
+        "summary": result.summary,
+        "journal_ref": result.journal_ref,
+        "primary_category": result.primary_category,
+        "categories": list(result.categories),
+        "published": result.published.isoformat() if result.published else None,
+        "doi": result.doi,
+        "pdf_url": result.pdf_url,
+        "arxiv_url": result.entry_id,
+        "arxiv_id": arxiv_id_from_url(result.entry_id),
+    }
+
+
+class Throttle:
+    def __init__(self, delay_seconds):
+        """Đảm bảo hai request liên tiếp (từ mọi thread) cách nhau ít nhất delay_seconds."""
+        self.delay_seconds = delay_seconds
+        self._lock = threading.Lock()
+        self._next_time = 0.0
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            sleep_for = self._next_time - now
+            self._next_time = max(now, self._next_time) + self.delay_seconds
+        if sleep_for > 0:
+            time.sleep(sleep_for)
+
+
+class ThrottledClient(arxiv.Client):
+    """arxiv.Client dùng chung một Throttle, để nhiều client chạy song song vẫn tôn trọng giới hạn của arXiv."""
+
+    def __init__(self, throttle, **kwargs):
+        super().__init__(**kwargs)
+        self.throttle = throttle
+
+    def _parse_feed(self, url, first_page=True, _try_index=0):
+        self.throttle.wait()
+        return super()._parse_feed(url, first_page=first_page, _try_index=_try_index)
+
+
+class PaperStore:
+    def __init__(self, path=DEFAULT_STORE_PATH):
+        """
+        Kho metadata bài báo arXiv trên ổ cứng (SQLite).
+
+        Bảng papers lưu metadata theo arXiv ID; bảng queries lưu danh sách ID
+        đã tìm được cho mỗi chủ đề (đã chuẩn hóa) cùng thời điểm tìm.
+        """
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.executescript(
+            """
+            PRAGMA journal_mode=WAL;
+            CREATE TABLE IF NOT EXISTS papers (
+                arxiv_id TEXT PRIMARY KEY, data TEXT NOT NULL, fetched_at REAL NOT NULL);
+            CREATE TABLE IF NOT EXISTS queries (
+                query_key TEXT PRIMARY KEY, ids TEXT NOT NULL, exhausted INTEGER NOT NULL,
+                fetched_at REAL NOT NULL);
+            """
+        )
+
+    def put_papers(self, papers):
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO papers VALUES (?, ?, ?)",
+                [(p["arxiv_id"], json.dumps(p, ensure_ascii=False), now) for p in papers],
+            )
+            self._conn.commit()
+
+    def get_papers(self, arxiv_ids):
+        """Trả về dict arxiv_id -> paper cho các ID có trong kho."""
+        found = {}
+        with self._lock:
+            for start in range(0, len(arxiv_ids), 500):
+                batch = list(arxiv_ids[start:start + 500])
+                placeholders = ",".join("?" * len(batch))
+                for arxiv_id, data in self._conn.execute(
+                    f"SELECT arxiv_id, data FROM papers WHERE arxiv_id IN ({placeholders})", batch
+                ):
+                    found[arxiv_id] = json.loads(data)
+        return found
+
+    def get_latest(self, base_id):
+        """Trả về paper có phiên bản mới nhất của arXiv ID không kèm version ("2401.01234"), hoặc None."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT arxiv_id, data FROM papers WHERE arxiv_id = ? OR arxiv_id LIKE ?", (base_id, base_id + "v%")
+            ).fetchall()
+        if not rows:
+            return None
+        version = lambda arxiv_id: int(arxiv_id.rsplit("v", 1)[1]) if "v" in arxiv_id else 0
+        return json.loads(max(rows, key=lambda row: version(row[0]))[1])
+
+    def put_query(self, query_key, ids, exhausted):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO queries VALUES (?, ?, ?, ?)",
+                (query_key, json.dumps(ids), int(exhausted), time.time()),
+            )
+            self._conn.commit()
+
+    def get_query(self, query_key):
+        """Trả về (ids, exhausted, fetched_at) hoặc None."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT ids, exhausted, fetched_at FROM queries WHERE query_key = ?", (query_key,)
+            ).fetchone()
+        if row is None:
+            return None
+        return json.loads(row[0]), bool(row[1]), row[2]
+
+
+class ArxivFetcher:
+    def __init__(self, store=None, ttl=6 * 3600, delay_seconds=3.0, page_size=100, base_url=None):
+        """
+        Lớp tải metadata arXiv có cache và hỗ trợ tải nhiều chủ đề song song.
+
+        Args:
+            store (PaperStore): Kho metadata (mặc định .cache/arxiv.sqlite).
+            ttl (float): Thời gian (giây) kết quả của một chủ đề được coi là còn mới.
+            delay_seconds (float): Khoảng cách tối thiểu giữa hai request tới arXiv (quy định của arXiv: 3s).
+            page_size (int): Số kết quả mỗi trang khi gọi API.
+            base_url (str): Ghi đè URL API (ví dụ "http://127.0.0.1:8000/api/query?{}" để chạy với feed Atom giả lập).
+        """
+        self.store = store if store is not None else PaperStore()
+        self.ttl = ttl
+        self.page_size = page_size
+        self.base_url = base_url
+        self.throttle = Throttle(delay_seconds)
+        self._local = threading.local()
+
+    def _client(self):
+        # arxiv.Client không an toàn khi dùng chung giữa các thread, nên mỗi thread có một client riêng
+        client = getattr(self._local, "client", None)
+        if client is None:
+            client = ThrottledClient(self.throttle, page_size=self.page_size, delay_seconds=0)
+            if self.base_url:
+                client.query_url_format = self.base_url
+            self._local.client = client
+        return client
+
+    def _cached_ids(self, topic, paper_count):
+        cached = self.store.get_query(normalize_topic(topic))
+        if cached is None:
+            return None
+        ids, exhausted, fetched_at = cached
+        if time.time() - fetched_at > self.ttl:
+            return None
+        if len(ids) >= paper_count or exhausted:
+            return ids[:paper_count]
+        return None
+
+    def iter_pages(self, topic, paper_count):
+        """
+        Tìm bài báo mới nhất theo chủ đề, trả về từng trang (list dict) ngay khi tải xong.
+
+        Args:
+            topic (str): Chủ đề cần tìm.
+            paper_count (int): Tổng số bài báo cần lấy.
+        Yields:
+            list: Các bài báo của một trang (tối đa page_size bài).
+        """
+        ids = self._cached_ids(topic, paper_count)
+        if ids is not None:
+            papers = self.store.get_papers(ids)
+            if len(papers) == len(set(ids)):
+                for start in range(0, len(ids), self.page_size):
+                    yield [papers[i] for i in ids[start:start + self.page_size]]
+                return
+
+        search = arxiv.Search(
+            query=f'all:"{topic}"',
+            max_results=paper_count,
+            sort_by=arxiv.SortCriterion.SubmittedDate,
+        )
+        ids = []
+        page = []
+        for result in self._client().results(search):
+            page.append(paper_from_result(result))
+            if len(page) == self.page_size:
+                self.store.put_papers(page)
+                ids.extend(p["arxiv_id"] for p in page)
+                yield page
+                page = []
+        if page:
+            self.store.put_papers(page)
+            ids.extend(p["arxiv_id"] for p in page)
+            yield page
+        self.store.put_query(normalize_topic(topic), ids, exhausted=len(ids) < paper_count)
+
+    def fetch(self, topic, paper_count):
+        """Tìm bài báo theo chủ đề, trả về list dict (dùng cache nếu còn mới)."""
+        return [paper for page in self.iter_pages(topic, paper_count) for paper in page]
+
+    def fetch_many(self, topics, paper_count, max_workers=4):
+        """
+        Tải nhiều chủ đề song song. Chủ đề đã có trong cache trả về ngay; các request thật
+        tới arXiv vẫn được giãn cách theo delay_seconds.
+
+        Returns:
+            dict: topic -> list bài báo.
+        """
+        topics = list(dict.fromkeys(topics))
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            results = pool.map(lambda topic: self.fetch(topic, paper_count), topics)
+            return dict(zip(topics, results))
+
+    def get_by_ids(self, arxiv_ids):
+        """Lấy metadata theo danh sách arXiv ID, chỉ gọi API cho các ID chưa có trong kho."""
+        found = self.store.get_papers(list(arxiv_ids))
+        missing = [i for i in arxiv_ids if i not in found]
+        if missing:
+            search = arxiv.Search(id_list=missing, max_results=len(missing))
+            papers = [paper_from_result(r) for r in self._client().results(search)]
+            self.store.put_papers(papers)
+            for paper in papers:
+                # Cho phép tra cứu cả ID không kèm version ("2401.01234" -> "2401.01234v2")
+                found[paper["arxiv_id"]] = paper
+                found.setdefault(re.sub(r"v\d+$", "", paper["arxiv_id"]), paper)
+        return [found[i] for i in arxiv_ids if i in found]
@@ -0,0 +1,211 @@
+import asyncio
+import random
+import time
+
+from llama_index.core.schema import MetadataMode
+
+_RATE_LIMIT_MARKERS = ("429", "quota", "resource_exhausted", "rate limit", "too many requests")
+_TRANSIENT_ERRORS = ("ServiceUnavailable", "DeadlineExceeded", "InternalServerError", "ServerError")
+
+
+def is_rate_limit_error(exc):
+    """Nhận diện lỗi vượt quota / rate limit (ví dụ 429 RESOURCE_EXHAUSTED của Gemini)."""
+    if type(exc).__name__ in ("ResourceExhausted", "TooManyRequests", "RateLimitError"):
+        return True
+    text = str(exc).lower()
+    return any(marker in text for marker in _RATE_LIMIT_MARKERS)
+
+
+def is_retryable_error(exc):
+    """Lỗi tạm thời, nên thử lại: rate limit, timeout, lỗi mạng, lỗi 5xx phía server."""
+    if is_rate_limit_error(exc):
+        return True
+    if isinstance(exc, (TimeoutError, ConnectionError, asyncio.TimeoutError)):
+        return True
+    return type(exc).__name__ in _TRANSIENT_ERRORS
+
+
+class TokenBucket:
+    def __init__(self, rate, capacity=None):
+        """
+        Bộ giới hạn tốc độ kiểu token bucket.
+
+        Args:
+            rate (float): Số token được nạp lại mỗi giây.
+            capacity (float): Số token tối đa (cho phép "bùng nổ" ngắn hạn). Mặc định = rate.
+        """
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = None
+
+    @classmethod
+    def per_minute(cls, requests_per_minute, burst=None):
+        return cls(requests_per_minute / 60.0, capacity=burst)
+
+    async def acquire(self, tokens=1.0):
+        """Chờ đến khi đủ token rồi trừ đi."""
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                await asyncio.sleep((tokens - self._tokens) / self.rate)
+
+
+async def retry_async(fn, max_retries=6, base_delay=1.0, max_delay=60.0,
+                      retry_on=is_retryable_error, on_retry=None):
+    """
+    Gọi coroutine fn() và thử lại với exponential backoff (+ jitter) khi gặp lỗi tạm thời.
+
+    Args:
+        fn (callable): Hàm không tham số trả về coroutine.
+        max_retries (int): Số lần thử lại tối đa.
+        base_delay (float): Thời gian chờ lần đầu (giây), nhân đôi sau mỗi lần.
+        max_delay (float): Thời gian chờ tối đa giữa hai lần thử.
+        retry_on (callable): Hàm quyết định lỗi nào được thử lại.
+        on_retry (callable): Gọi với (attempt, exc, delay) trước mỗi lần chờ.
+    """
+    attempt = 0
+    while True:
+        try:
+            return await fn()
+        except Exception as e:
+            if attempt >= max_retries or not retry_on(e):
+                raise
+            delay = min(max_delay, base_delay * (2 ** attempt))
+            delay = delay / 2 + random.uniform(0, delay / 2)
+            attempt += 1
+            if on_retry:
+                on_retry(attempt, e, delay)
+            await asyncio.sleep(delay)
+
+
+class AsyncIngestEngine:
+    def __init__(self, embed_model, vector_store, embed_batch_size=64, max_concurrent_embeds=4,
+                 upsert_batch_size=100, max_concurrent_upserts=4, requests_per_minute=None,
+                 max_retries=6, base_delay=1.0, max_delay=60.0):
+        """
+        Bộ máy nạp dữ liệu bất đồng bộ: embed theo batch và upsert theo batch, song song có giới hạn.
+
+        Args:
+            embed_model (BaseEmbedding): Model embedding (dùng aget_text_embedding_batch).
+            vector_store: Vector store của LlamaIndex (gọi add trong thread pool).
+            embed_batch_size (int): Số chunk mỗi request embedding.
+            max_concurrent_embeds (int): Số request embedding chạy đồng thời tối đa.
+            upsert_batch_size (int): Số vector mỗi lần upsert.
+            max_concurrent_upserts (int): Số lần upsert chạy đồng thời tối đa.
+            requests_per_minute (float): Giới hạn số request embedding mỗi phút (None = không giới hạn).
+            max_retries (int): Số lần thử lại khi gặp lỗi quota/lỗi tạm thời.
+        """
+        self.embed_model = embed_model
+        self.vector_store = vector_store
+        self.embed_batch_size = embed_batch_size
+        self.max_concurrent_embeds = max_concurrent_embeds
+        self.upsert_batch_size = upsert_batch_size
+        self.max_concurrent_upserts = max_concurrent_upserts
+        self.requests_per_minute = requests_per_minute
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    async def aingest(self, batches, on_batch_done=None):
+        """
+        Embed và upsert các batch node.
+
+        Args:
+            batches: Iterable hoặc async iterable các list node (kích thước tùy ý,
+                sẽ được chia lại theo embed_batch_size). Node đã có embedding chỉ được upsert.
+            on_batch_done (callable): Gọi với (nodes, error) sau mỗi batch embed;
+                error là None nếu batch đã được upsert thành công.
+        Returns:
+            dict: Thống kê: số node đã nạp, số node lỗi, số lần thử lại, số request embed/upsert.
+        """
+        stats = {"nodes": 0, "failed_nodes": 0, "retries": 0, "embed_requests": 0, "upsert_requests": 0}
+        bucket = TokenBucket.per_minute(self.requests_per_minute) if self.requests_per_minute else None
+        embed_slots = asyncio.Semaphore(self.max_concurrent_embeds)
+        upsert_slots = asyncio.Semaphore(self.max_concurrent_upserts)
+        tasks = set()
+
+        def count_retry(attempt, exc, delay):
+            stats["retries"] += 1
+            print(f"Loi tam thoi ({type(exc).__name__}), thu lai lan {attempt} sau {delay:.1f}s...")
+
+        async def with_retry(fn):
+            return await retry_async(
+                fn, max_retries=self.max_retries, base_delay=self.base_delay,
+                max_delay=self.max_delay, on_retry=count_retry,
+            )
+
+        async def embed(nodes):
+            if bucket:
+                await bucket.acquire()
+            stats["embed_requests"] += 1
+            texts = [node.get_content(metadata_mode=MetadataMode.EMBED) for node in nodes]
+            return await self.embed_model.aget_text_embedding_batch(texts)
+
+        async def upsert(nodes):
+            async with upsert_slots:
+                stats["upsert_requests"] += 1
+                await asyncio.to_thread(self.vector_store.add, nodes)
+
+        async def process(nodes):
+            error = None
+            try:
+                # Node đã có sẵn embedding (khôi phục từ snapshot) không cần gọi API embedding
+                pending = [node for node in nodes if node.embedding is None]
+                if pending:
+                    embeddings = await with_retry(lambda: embed(pending))
+                    for node, embedding in zip(pending, embeddings):
+                        node.embedding = embedding
+                await asyncio.gather(*[
+                    with_retry(lambda part=nodes[i:i + self.upsert_batch_size]: upsert(part))
+                    for i in range(0, len(nodes), self.upsert_batch_size)
+                ])
+                stats["nodes"] += len(nodes)
+            except Exception as e:
+                error = e
+                stats["failed_nodes"] += len(nodes)
+                print(f"Khong nap duoc {len(nodes)} chunk: {e}")
+            finally:
+                embed_slots.release()
+            if on_batch_done:
+                on_batch_done(nodes, error)
+
+        async def submit(nodes):
+            # Chờ slot trống trước khi nhận batch tiếp theo (back-pressure với nguồn dữ liệu)
+            await embed_slots.acquire()
+            task = asyncio.create_task(process(nodes))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+
+        buffer = []
+        async for batch in _aiter(batches):
+            buffer.extend(batch)
+            while len(buffer) >= self.embed_batch_size:
+                await submit(buffer[:self.embed_batch_size])
+                buffer = buffer[self.embed_batch_size:]
+        if buffer:
+            await submit(buffer)
+        if tasks:
+            await asyncio.gather(*list(tasks))
+        return stats
+
+    def ingest(self, batches, on_batch_done=None):
+        """Phiên bản đồng bộ của aingest (tự tạo event loop)."""
+        return asyncio.run(self.aingest(batches, on_batch_done=on_batch_done))
+
+
+async def _aiter(items):
+    if hasattr(items, "__aiter__"):
+        async for item in items:
+            yield item
+    else:
+        for item in items:
+            yield item
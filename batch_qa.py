@@ -0,0 +1,302 @@
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+from llama_index.core.query_engine import RetrieverQueryEngine
+from llama_index.core.schema import QueryBundle
+
+from instrumentation import setup_instrumentation
+from query_cache import normalize_query
+
+# Trả lời hàng loạt câu hỏi từ file JSONL (không qua giao diện chat), ghi từng kết quả ra JSONL ngay khi xong.
+# Mỗi lô câu hỏi: gộp câu trùng -> embed cả lô bằng một lời gọi batch -> tra cache câu trả lời ->
+# truy vấn index cho cả lô cùng lúc -> tổng hợp câu trả lời song song (tối đa --concurrency lời gọi LLM).
+# File kết quả đồng thời là checkpoint: chạy lại cùng lệnh sau khi bị dừng thì chỉ trả lời các câu còn lại
+# (câu bị lỗi được trả lời lại).
+# Mỗi dòng input là một JSON có id ("id"/"request_id"/"qid", mặc định số dòng) và câu hỏi
+# ("question"/"query"/"prompt", hoặc "title" + "body" như requests.jsonl).
+# Chạy: python batch_qa.py questions.jsonl -o answers.jsonl [--batch-size 32] [--concurrency 8] [--local] [--fake]
+
+ID_FIELDS = ("id", "request_id", "qid")
+QUESTION_FIELDS = ("question", "query", "prompt")
+SOURCE_FIELDS = ("arxiv_id", "title", "file_name", "section", "page_label")
+
+
+def read_questions(path):
+    """
+    Đọc các câu hỏi từ file JSONL.
+
+    Returns:
+        list: Các dict {"id", "question"} theo thứ tự trong file (bỏ dòng lỗi/không có câu hỏi và id trùng).
+    """
+    records, seen = [], set()
+    with open(path, encoding="utf-8") as f:
+        for line_no, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                data = json.loads(line)
+            except ValueError as e:
+                print(f"Bo qua dong {line_no}: JSON loi ({e})")
+                continue
+            record_id = str(next((data[k] for k in ID_FIELDS if data.get(k) is not None), f"line-{line_no}"))
+            question = next((data[k] for k in QUESTION_FIELDS if data.get(k)), None)
+            if question is None:
+                question = "\n\n".join(str(data[k]) for k in ("title", "body") if data.get(k))
+            if not str(question).strip():
+                print(f"Bo qua dong {line_no}: khong co cau hoi")
+                continue
+            if record_id in seen:
+                print(f"Bo qua dong {line_no}: trung id {record_id}")
+                continue
+            seen.add(record_id)
+            records.append({"id": record_id, "question": str(question).strip()})
+    return records
+
+
+def load_checkpoint(path):
+    """
+    Đọc file kết quả của lần chạy trước.
+
+    Dòng ghi dở (process bị dừng giữa lúc ghi) và kết quả lỗi bị bỏ, file được ghi lại chỉ với
+    các kết quả tốt để những câu đó được trả lời lại.
+
+    Returns:
+        set: id của các câu đã trả lời xong.
+    """
+    if not os.path.exists(path):
+        return set()
+    done, kept, dropped = set(), [], 0
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                dropped += 1
+                continue
+            if record.get("error") or "id" not in record:
+                dropped += 1
+                continue
+            done.add(record["id"])
+            kept.append(json.dumps(record, ensure_ascii=False))
+    if dropped:
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write("".join(line + "\n" for line in kept))
+        os.replace(tmp_path, path)
+    return done
+
+
+class ResultWriter:
+    def __init__(self, path):
+        """Ghi nối kết quả vào file JSONL, mỗi kết quả được flush + fsync ngay (an toàn khi bị dừng giữa chừng)."""
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._file = open(path, "a", encoding="utf-8")
+        self._lock = threading.Lock()
+        self.count = 0
+
+    def write(self, record):
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self.count += 1
+
+    def close(self):
+        self._file.close()
+
+
+def source_info(node_with_score):
+    """Thông tin nguồn của một chunk dùng để trả lời (arXiv ID, tiêu đề, file, mục, trang, điểm)."""
+    metadata = node_with_score.node.metadata
+    info = {key: metadata[key] for key in SOURCE_FIELDS if metadata.get(key) not in (None, "")}
+    info["score"] = round(float(node_with_score.score or 0.0), 4)
+    return info
+
+
+class BatchAnswerer:
+    def __init__(self, runtime, concurrency=8):
+        """
+        Trả lời theo lô bằng retriever, bước xử lý chunk (rerank, rút gọn) và cache câu trả lời của AgentRuntime.
+        Chỉ dùng đường RAG (không chạy vòng ReAct của Agent): mỗi câu hỏi tốn một lời gọi LLM.
+
+        Args:
+            runtime (AgentRuntime): Runtime đã dựng (LLM, index, retriever dùng chung).
+            concurrency (int): Số câu hỏi được tổng hợp câu trả lời cùng lúc.
+        """
+        self.runtime = runtime
+        agent = runtime.agent
+        retriever = agent.retriever or runtime.index.as_retriever(
+            similarity_top_k=agent.similarity_top_k, embed_model=runtime.embed_model
+        )
+        self.engine = RetrieverQueryEngine.from_args(
+            retriever, llm=runtime.llm_model, node_postprocessors=agent.node_postprocessors
+        )
+        self.concurrency = concurrency
+        self.stats = {"answered": 0, "errors": 0, "duplicates": 0, "cache_hits": 0,
+                      "embed_s": 0.0, "retrieve_s": 0.0, "synthesize_s": 0.0}
+
+    def embed(self, questions):
+        """Embed cả lô câu hỏi (một lời gọi batch nếu embed model là CachedEmbedding)."""
+        embed_model = self.runtime.embed_model
+        if hasattr(embed_model, "get_query_embedding_batch"):
+            return embed_model.get_query_embedding_batch(questions)
+        return [embed_model.get_query_embedding(question) for question in questions]
+
+    async def answer_batch(self, records, on_result):
+        """
+        Trả lời một lô câu hỏi, gọi on_result(kết quả) cho từng câu ngay khi có câu trả lời.
+
+        Args:
+            records (list): Các dict {"id", "question"}.
+            on_result (callable): Nhận dict {"id", "question", "answer", "sources", "cache"} hoặc {"id", "question", "error"}.
+        """
+        groups = OrderedDict()  # Câu hỏi trùng (sau chuẩn hóa) chỉ trả lời một lần
+        for record in records:
+            groups.setdefault(normalize_query(record["question"]), []).append(record)
+        self.stats["duplicates"] += len(records) - len(groups)
+        questions = [group[0]["question"] for group in groups.values()]
+
+        def emit(group, **result):
+            for record in group:
+                on_result({"id": record["id"], "question": record["question"], **result})
+            key = "errors" if "error" in result else "answered"
+            self.stats[key] += len(group)
+
+        start = time.perf_counter()
+        try:
+            embeddings = await asyncio.to_thread(self.embed, questions)
+        except Exception as e:
+            for group in groups.values():
+                emit(group, error=f"Loi khi embed: {e}")
+            return
+        self.stats["embed_s"] += time.perf_counter() - start
+
+        pending = []
+        cache = self.runtime.query_cache
+        for group, question, embedding in zip(groups.values(), questions, embeddings):
+            if cache is not None:
+                # Embedding vừa được cache theo câu hỏi nên lookup không gọi API
+                cached, hit, cache_embedding, cache_version = await asyncio.to_thread(cache.lookup, question)
+                if cached is not None:
+                    self.stats["cache_hits"] += len(group)
+                    emit(group, answer=cached, sources=[], cache=hit)
+                    continue
+            else:
+                cache_embedding = cache_version = None
+            pending.append((group, QueryBundle(question, embedding=embedding), cache_embedding, cache_version))
+        if not pending:
+            return
+
+        start = time.perf_counter()
+        retrieved = await asyncio.gather(*(self.engine.aretrieve(bundle) for _, bundle, _, _ in pending),
+                                         return_exceptions=True)
+        self.stats["retrieve_s"] += time.perf_counter() - start
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def synthesize(group, bundle, cache_embedding, cache_version, nodes):
+            if isinstance(nodes, Exception):
+                emit(group, error=f"Loi khi truy van index: {nodes}")
+                return
+            async with semaphore:
+                try:
+                    response = await self.engine.asynthesize(bundle, nodes)
+                except Exception as e:
+                    emit(group, error=f"Loi khi tong hop cau tra loi: {e}")
+                    return
+            answer = str(response)
+            if cache is not None:
+                cache.store(bundle.query_str, answer, cache_embedding, cache_version)
+            emit(group, answer=answer, sources=[source_info(node) for node in nodes], cache=None)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(synthesize(group, bundle, cache_embedding, cache_version, nodes)
+                               for (group, bundle, cache_embedding, cache_version), nodes in zip(pending, retrieved)))
+        self.stats["synthesize_s"] += time.perf_counter() - start
+
+
+def build_fake_runtime(index_dir, llm_latency):
+    """Runtime với LLM/embedding giả và index local tạm thời (chạy thử không cần API key)."""
+    from llama_index.core.schema import TextNode
+
+    from agent_runtime import build_runtime
+    from embedding_cache import CachedEmbedding, EmbeddingStore
+    from fakes import FakeEmbedding, FakeReActLLM
+    from index_manager_local import IndexManagerLocal
+
+    embed_model = CachedEmbedding(FakeEmbedding(), store=EmbeddingStore(":memory:"))
+    manager = IndexManagerLocal(embed_model, index_dir=index_dir)
+    nodes = []
+    for i in range(500):
+        node = TextNode(text=f"Paper {i} studies topic {i % 37} with method {i % 11}.", id_=f"node-{i}",
+                        metadata={"arxiv_id": f"2401.{i:05d}", "title": f"Paper {i}"})
+        node.embedding = embed_model.inner.embed(node.text)
+        nodes.append(node)
+    manager.vector_store.add(nodes)
+    return build_runtime(FakeReActLLM(first_token_latency=llm_latency), embed_model, manager)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tra loi hang loat cau hoi tu file JSONL.")
+    parser.add_argument("input", help="File JSONL cau hoi")
+    parser.add_argument("-o", "--output", default="answers.jsonl", help="File JSONL ket qua (cung la checkpoint)")
+    parser.add_argument("--batch-size", type=int, default=32, help="So cau hoi moi lo")
+    parser.add_argument("--concurrency", type=int, default=8, help="So cau hoi tong hop cau tra loi cung luc")
+    parser.add_argument("--limit", type=int, default=None, help="Chi tra loi toi da N cau con lai")
+    parser.add_argument("--local", action="store_true", default=os.getenv("INDEX_BACKEND", "pinecone") == "local",
+                        help="Dung index local (local_index/) thay vi Pinecone")
+    parser.add_argument("--fake", action="store_true", help="Dung LLM/embedding gia va index local tam thoi")
+    parser.add_argument("--fake-latency", type=float, default=0.2, help="Do tre gia lap moi lan goi LLM gia (giay)")
+    args = parser.parse_args()
+
+    records = read_questions(args.input)
+    done = load_checkpoint(args.output)
+    pending = [record for record in records if record["id"] not in done]
+    if args.limit is not None:
+        pending = pending[:args.limit]
+    answered = sum(record["id"] in done for record in records)
+    print(f"{len(records)} cau hoi, {answered} da tra loi ({args.output}), lan nay tra loi {len(pending)} cau")
+    if not pending:
+        return
+
+    setup_instrumentation()
+    tmp_dir = None
+    if args.fake:
+        tmp_dir = tempfile.TemporaryDirectory()
+        runtime = build_fake_runtime(tmp_dir.name, args.fake_latency)
+    else:
+        from agent_runtime import build_runtime
+        from constants import get_index_manager
+
+        runtime = build_runtime(index_manager=get_index_manager("local" if args.local else "pinecone"),
+                                max_llm_concurrency=args.concurrency)
+    answerer = BatchAnswerer(runtime, concurrency=args.concurrency)
+    writer = ResultWriter(args.output)
+    start = time.perf_counter()
+    try:
+        for offset in range(0, len(pending), args.batch_size):
+            runtime.background.run(answerer.answer_batch(pending[offset:offset + args.batch_size], writer.write))
+            elapsed = time.perf_counter() - start
+            print(f"[{writer.count}/{len(pending)}] {elapsed:.1f}s, {writer.count / max(elapsed, 1e-9):.1f} cau/s")
+    except KeyboardInterrupt:
+        print(f"Dung giua chung: da ghi {writer.count} cau, chay lai cung lenh de tiep tuc.")
+    finally:
+        writer.close()
+        runtime.close()
+        if tmp_dir is not None:
+            tmp_dir.cleanup()
+    stats = answerer.stats
+    print(f"Xong {stats['answered']} cau, loi {stats['errors']}, trung {stats['duplicates']}, "
+          f"cache {stats['cache_hits']} | embed {stats['embed_s']:.2f}s, truy van {stats['retrieve_s']:.2f}s, "
+          f"tong hop {stats['synthesize_s']:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+import argparse
+import os
+import statistics
+import time
+
+from llama_index.core.schema import MetadataMode
+from llama_index.core.utils import get_tokenizer
+
+from ingest_manifest import file_sha256
+from ingest_pipeline import iter_parsed_files
+from minhash_dedup import MinHashDeduper
+
+# So sánh cách chia chunk cũ (mỗi trang một Document, cắt cố định 1024/50) với cách chia theo mục
+# (pdf_chunker: bỏ header/footer + tài liệu tham khảo, cắt theo heading) và lọc trùng MinHash.
+# Báo cáo số vector, số token phải embed và thời gian đọc/chia chunk trên papers/ (không gọi API).
+# Chạy: python bench_chunking.py [--papers-dir papers] [--threshold 0.9]
+
+
+def measure(name, jobs, structured, threshold, tokenizer):
+    start = time.perf_counter()
+    nodes = []
+    deduper = MinHashDeduper(threshold) if threshold else None
+    for _, _, file_nodes in iter_parsed_files(jobs, structured=structured):
+        if deduper:
+            deduper.reset()  # Lọc trùng trong từng file, giống IngestPipeline
+            file_nodes = deduper.filter(file_nodes)
+        nodes.extend(file_nodes)
+    elapsed = time.perf_counter() - start
+    tokens = [len(tokenizer(node.get_content(metadata_mode=MetadataMode.EMBED))) for node in nodes]
+    result = {"nodes": len(nodes), "tokens": sum(tokens), "seconds": elapsed,
+              "duplicates": deduper.dropped if deduper else 0}
+    print(f"- {name:20s} {len(nodes):5d} vector | {sum(tokens):7d} token embed "
+          f"(trung binh {statistics.mean(tokens) if tokens else 0:5.0f}/chunk) | "
+          f"{result['duplicates']:3d} chunk trung | {elapsed:5.2f}s")
+    return result, nodes
+
+
+def main():
+    parser = argparse.ArgumentParser(description="So sanh so vector va token embed giua cach chia chunk cu va moi.")
+    parser.add_argument("--papers-dir", default="papers")
+    parser.add_argument("--threshold", type=float, default=0.9, help="Nguong Jaccard MinHash de coi la trung")
+    args = parser.parse_args()
+
+    paths = sorted(
+        os.path.join(args.papers_dir, f) for f in os.listdir(args.papers_dir)
+        if not f.startswith(".") and os.path.isfile(os.path.join(args.papers_dir, f))
+    )
+    jobs = [(path, file_sha256(path)) for path in paths]
+    tokenizer = get_tokenizer()
+    print(f"{len(jobs)} file trong {args.papers_dir}/")
+    base, _ = measure("theo trang (cu)", jobs, False, None, tokenizer)
+    measure("theo muc", jobs, True, None, tokenizer)
+    new, nodes = measure("theo muc + loc trung", jobs, True, args.threshold, tokenizer)
+
+    for label, key in (("vector", "nodes"), ("token embed", "tokens")):
+        saved = base[key] - new[key]
+        print(f"=> Giam {saved} {label} ({saved / max(base[key], 1):.0%})")
+    if nodes:
+        print("\nVi du metadata cua mot chunk:")
+        for key, value in nodes[len(nodes) // 2].metadata.items():
+            print(f"  {key}: {value}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+
+from llama_index.core import VectorStoreIndex
+
+from bm25_index import BM25Index, BM25Retriever, tokenize
+from hybrid_retriever import HybridRetriever
+from ingest_manifest import file_sha256
+from ingest_pipeline import iter_parsed_files
+
+# So sánh recall@k và độ trễ truy vấn của tìm kiếm vector (dense), BM25 và hybrid (RRF) trên papers/.
+# Câu hỏi được sinh tự động từ từng chunk (chunk nguồn là đáp án đúng):
+#   - "keyword": vài thuật ngữ hiếm nhất của chunk (kiểu "Kitaev chain parity")
+#   - "span": một đoạn câu ngắn lấy từ chunk, bỏ bớt từ
+# Chạy: python bench_hybrid.py [--gemini] [--queries 200]
+# Mặc định dùng FakeEmbedding (offline); --gemini dùng embed model thật trong constants.py.
+
+
+def load_nodes(papers_dir):
+    paths = sorted(
+        os.path.join(papers_dir, f) for f in os.listdir(papers_dir)
+        if not f.startswith(".") and os.path.isfile(os.path.join(papers_dir, f))
+    )
+    jobs = [(path, file_sha256(path)) for path in paths]
+    nodes = []
+    for _, _, file_nodes in iter_parsed_files(jobs):
+        nodes.extend(node for node in file_nodes if len(tokenize(node.get_content())) >= 30)
+    return nodes
+
+
+def make_queries(nodes, keyword_index, n_queries, seed=0):
+    """Sinh (câu hỏi, node_id đúng, loại câu hỏi) từ các chunk."""
+    rng = random.Random(seed)
+    df = dict(keyword_index._conn.execute("SELECT term, df FROM terms").fetchall())
+    queries = []
+    for node in rng.sample(nodes, min(n_queries, len(nodes))):
+        tokens = tokenize(node.get_content())
+        words = [t for t in dict.fromkeys(tokens) if t.isalpha() and len(t) > 3]
+        if rng.random() < 0.5 and len(words) >= 3:
+            rare = sorted(words, key=lambda t: df.get(t, 0))[:3]
+            queries.append((" ".join(rare), node.node_id, "keyword"))
+        else:
+            start = rng.randrange(max(1, len(tokens) - 16))
+            span = [t for t in tokens[start:start + 16] if rng.random() > 0.3]
+            queries.append((" ".join(span), node.node_id, "span"))
+    return queries
+
+
+def evaluate(name, retriever, queries, ks):
+    hits = {k: [] for k in ks}
+    latencies = []
+    for query, expected, _ in queries:
+        start = time.perf_counter()
+        results = retriever.retrieve(query)
+        latencies.append(time.perf_counter() - start)
+        ids = [r.node.node_id for r in results]
+        for k in ks:
+            hits[k].append(expected in ids[:k])
+    recalls = " | ".join(f"recall@{k} {sum(hits[k]) / len(queries):.3f}" for k in ks)
+    latencies_ms = sorted(l * 1000 for l in latencies)
+    p95 = latencies_ms[max(0, int(len(latencies_ms) * 0.95) - 1)]
+    print(f"- {name:8s} {recalls} | {statistics.mean(latencies_ms):7.2f} ms (p95 {p95:7.2f} ms)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark dense / BM25 / hybrid retrieval tren papers/.")
+    parser.add_argument("--papers-dir", default="papers")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--candidates", type=int, default=20, help="So ung vien moi retriever truoc khi gop RRF")
+    parser.add_argument("--gemini", action="store_true", help="Dung embed model that (can GOOGLE_API_KEY)")
+    args = parser.parse_args()
+
+    if args.gemini:
+        from constants import embed_model
+    else:
+        from fakes import FakeEmbedding
+        embed_model = FakeEmbedding()
+
+    nodes = load_nodes(args.papers_dir)
+    print(f"Da doc {len(nodes)} chunk tu {args.papers_dir}/")
+    ks = (1, 5, 10)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        keyword_index = BM25Index(os.path.join(tmp_dir, "bm25.sqlite"))
+        start = time.perf_counter()
+        keyword_index.add(nodes)
+        elapsed = time.perf_counter() - start
+        size = sum(os.path.getsize(p) for p in (keyword_index.path, keyword_index.path + "-wal") if os.path.exists(p))
+        print(f"Chi muc BM25: {elapsed:.2f}s, {size / 2**10:.0f} KB tren o cung (ca node_json)")
+        vector_index = VectorStoreIndex(nodes, embed_model=embed_model)
+
+        queries = make_queries(nodes, keyword_index, args.queries)
+        retrievers = {
+            "dense": vector_index.as_retriever(similarity_top_k=max(ks)),
+            "bm25": BM25Retriever(keyword_index, similarity_top_k=max(ks)),
+        }
+        retrievers["hybrid"] = HybridRetriever(
+            [
+                vector_index.as_retriever(similarity_top_k=args.candidates),
+                BM25Retriever(keyword_index, similarity_top_k=args.candidates),
+            ],
+            similarity_top_k=max(ks),
+        )
+        for kind in ("keyword", "span", None):
+            subset = [q for q in queries if kind is None or q[2] == kind]
+            if not subset:
+                continue
+            print(f"\nCau hoi loai {kind or 'tat ca'} ({len(subset)} cau):")
+            for name, retriever in retrievers.items():
+                evaluate(name, retriever, subset, ks)
+
+
+if __name__ == "__main__":
+    main()
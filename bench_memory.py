@@ -0,0 +1,148 @@
+import argparse
+import hashlib
+import json
+import os
+import tempfile
+
+from llama_index.core.memory import ChatMemoryBuffer
+from llama_index.core.tools import FunctionTool
+
+from agent_class import Agent
+from agent_runtime import BackgroundLoop
+from fakes import FakeLLM
+from instrumentation import setup_instrumentation
+from session_memory import SessionMemory, SessionStore
+
+# Đo số token prompt mỗi lượt của một cuộc hội thoại dài theo kịch bản (LLM giả, tool giả trả về
+# danh sách bài arXiv dài), với bộ nhớ cũ ChatMemoryBuffer(token_limit=20000) và SessionMemory
+# (giữ nguyên văn vài lượt gần nhất, tóm tắt lượt cũ, lưu riêng output lớn của tool).
+# Token được đếm từ trace của mỗi lượt (tổng token vào của mọi lần gọi LLM trong lượt). Chạy offline.
+# Chạy: python bench_memory.py [--rounds 3] [--recent-turns 2] [--token-limit 3000]
+
+TOPICS = ["quantum error correction", "retrieval augmented generation", "diffusion models",
+          "graph neural networks", "protein folding", "sparse attention"]
+
+
+def fake_papers(topic, count=8):
+    """Kết quả giả của fetch_from_arxiv: danh sách bài báo dài (giống str(list[dict]) của tool thật)."""
+    return str([{
+        "title": f"Advances in {topic} part {i}",
+        "authors": [f"Author {i}{j}" for j in range(4)],
+        "summary": f"We study {topic} and propose method {i}. " * 12,
+        "pdf_url": f"https://arxiv.org/pdf/2401.{sum(map(ord, topic)):04d}{i}",
+        "published": f"2024-0{1 + i % 9}-1{i}",
+    } for i in range(count)])
+
+
+def stored_ref(text):
+    # Cùng cách đặt tham chiếu với SessionStore.put_artifact (để kịch bản gọi được read_stored_output)
+    return "mem-" + hashlib.sha1(text.encode()).hexdigest()[:12]
+
+
+def build_script(rounds):
+    """
+    Kịch bản hội thoại: mỗi chủ đề gồm một lượt tìm bài mới trên arXiv (output lớn), một lượt tra cứu
+    database local và một lượt hỏi tiếp không dùng tool; thỉnh thoảng Agent đọc lại output cũ.
+
+    Returns:
+        tuple: (danh sách câu hỏi, danh sách câu trả lời của LLM theo thứ tự gọi)
+    """
+    questions, responses = [], []
+    for i in range(rounds * 2):
+        topic = TOPICS[i % len(TOPICS)]
+        questions.append(f"Find new papers about {topic}.")
+        responses += [
+            f'Thought: The user wants new papers.\nAction: fetch_from_arxiv\n'
+            f'Action Input: {json.dumps({"title": topic, "paper_count": 8})}',
+            f"Thought: I can answer without using any more tools.\nAnswer: I found 8 new papers on {topic}; "
+            f"the most relevant is 'Advances in {topic} part 0' by Author 00 et al.",
+        ]
+        questions.append(f"What does the local database say about {topic}?")
+        responses += [
+            f'Thought: Check the local database.\nAction: research_paper_query_tool\n'
+            f'Action Input: {json.dumps({"query": topic})}',
+            f"Thought: I can answer without using any more tools.\nAnswer: The local papers describe {topic} "
+            f"as an active area with three main approaches.",
+        ]
+        if i % 2:
+            questions.append(f"List the full author list of the earlier {topic} papers again.")
+            responses += [
+                f'Thought: The list is stored.\nAction: read_stored_output\n'
+                f'Action Input: {json.dumps({"ref": stored_ref(fake_papers(topic))})}',
+                f"Thought: I can answer without using any more tools.\nAnswer: The authors are Author 00 to Author 73.",
+            ]
+        else:
+            questions.append(f"Which of these {topic} papers should I read first?")
+            responses.append(f"Thought: I can answer without using any more tools.\nAnswer: Start with part 0: "
+                             f"it introduces the {topic} setting used by the others.")
+    return questions, responses
+
+
+class ScriptedAgent(Agent):
+    """Agent với RAG tool và fetch_from_arxiv giả (không cần index hay mạng)."""
+
+    def build_query_engine(self):
+        self.query_engine = None
+
+    def build_rag_tool(self):
+        async def query(query: str) -> str:
+            return (f"According to the local papers, {query} " + "is studied with several methods. " * 20).strip()
+
+        self.rag_tool = FunctionTool.from_defaults(async_fn=query, name="research_paper_query_tool",
+                                                   description="A RAG engine with recent research papers.")
+
+    def build_fetch_arxiv_tool(self):
+        async def fetch(title: str, paper_count: int) -> str:
+            return fake_papers(title, paper_count)
+
+        self.fetch_arxiv_tool = FunctionTool.from_defaults(async_fn=fetch, name="fetch_from_arxiv",
+                                                           description="download recent papers from arxiv")
+
+
+def run(memory, questions, responses):
+    """Chạy cả kịch bản, trả về số token prompt của từng lượt."""
+    background = BackgroundLoop()
+    agent = ScriptedAgent(None, FakeLLM(responses=responses), memory=memory, streaming=False)
+    tokens = []
+    try:
+        for question in questions:
+            for event in background.iterate(agent.stream_chat(question)):
+                if event["type"] == "answer":
+                    tokens.append(event["trace"]["tokens_in"])
+    finally:
+        background.stop()
+    return tokens
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Do so token prompt moi luot: ChatMemoryBuffer vs SessionMemory.")
+    parser.add_argument("--rounds", type=int, default=3, help="So vong kich ban (moi vong 2 chu de x 3 luot)")
+    parser.add_argument("--recent-turns", type=int, default=2, help="So luot gan nhat giu nguyen van")
+    parser.add_argument("--token-limit", type=int, default=3000, help="Ngan sach token cua lich su")
+    args = parser.parse_args()
+
+    setup_instrumentation(trace_path=None, metrics_path=None)
+    questions, responses = build_script(args.rounds)
+    before = run(ChatMemoryBuffer.from_defaults(token_limit=20000), questions, responses)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        store = SessionStore(os.path.join(tmp, "sessions.sqlite"))
+        memory = SessionMemory.from_defaults("bench", store, recent_turns=args.recent_turns,
+                                             token_limit=args.token_limit)
+        after = run(memory, questions, responses)
+        # Mở lại phiên từ SQLite như sau khi khởi động lại app
+        reopened = SessionMemory.from_defaults("bench", SessionStore(store.path))
+        restored = len(reopened.transcript()) // 2
+        artifacts = sum(1 for line in (m.content or "" for m in reopened.get_all()) if "[stored output mem-" in line)
+
+    print(f"{len(questions)} luot, {len(responses)} lan goi LLM")
+    print(f"{'luot':>4} | {'ChatMemoryBuffer':>16} | {'SessionMemory':>13} | giam")
+    for i, (old, new) in enumerate(zip(before, after), 1):
+        print(f"{i:4d} | {old:16d} | {new:13d} | {1 - new / max(old, 1):5.0%}")
+    print(f"Tong token prompt: {sum(before)} -> {sum(after)} (giam {1 - sum(after) / max(sum(before), 1):.0%}); "
+          f"luot cuoi {before[-1]} -> {after[-1]}")
+    print(f"Mo lai phien tu SQLite: {restored} luot, {artifacts} tin nhan chua output luu rieng")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+import argparse
+import os
+import statistics
+import tempfile
+import time
+
+from llama_index.core import VectorStoreIndex
+from llama_index.core.schema import QueryBundle
+from llama_index.core.utils import get_tokenizer
+
+from bench_hybrid import load_nodes, make_queries
+from bm25_index import BM25Index, BM25Retriever, tokenize
+from hybrid_retriever import HybridRetriever
+from reranker import SentenceCompressor, build_reranker
+
+# So sánh ngữ cảnh gửi cho LLM mỗi câu hỏi:
+#   - baseline: top-5 chunk (như cấu hình cũ similarity_top_k=5)
+#   - rerank: lấy 50 ứng viên -> rerank trên CPU -> giữ top-n
+#   - rerank+nen: như trên, rồi chỉ giữ các câu liên quan trong mỗi chunk
+# Báo cáo số token đầu vào, độ trễ truy vấn + rerank, tỉ lệ chunk đúng còn trong ngữ cảnh
+# và tỉ lệ từ của câu hỏi còn xuất hiện trong ngữ cảnh.
+# Chạy: python bench_rerank.py [--reranker cross-encoder] [--top-n 3] [--gemini]
+
+
+def run(name, queries, retrieve, postprocessors, tokenizer):
+    tokens, latencies, hits, coverage = [], [], [], []
+    for query, expected, _ in queries:
+        start = time.perf_counter()
+        nodes = retrieve(query)
+        for postprocessor in postprocessors:
+            nodes = postprocessor.postprocess_nodes(nodes, QueryBundle(query))
+        latencies.append(time.perf_counter() - start)
+        context = "\n\n".join(n.node.get_content() for n in nodes)
+        tokens.append(len(tokenizer(context)))
+        hits.append(expected in [n.node.node_id for n in nodes])
+        context_terms = set(tokenize(context))
+        query_terms = set(tokenize(query))
+        coverage.append(len(query_terms & context_terms) / max(len(query_terms), 1))
+    result = {
+        "tokens": statistics.mean(tokens),
+        "latency_ms": statistics.mean(latencies) * 1000,
+        "hit_rate": sum(hits) / len(hits),
+        "coverage": statistics.mean(coverage),
+    }
+    print(f"- {name:12s} {result['tokens']:7.0f} token/cau | {result['latency_ms']:7.2f} ms | "
+          f"chunk dung {result['hit_rate']:.3f} | tu khoa con lai {result['coverage']:.3f}")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Do token va do tre tiet kiem duoc nho rerank + nen ngu canh.")
+    parser.add_argument("--papers-dir", default="papers")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--candidates", type=int, default=50)
+    parser.add_argument("--top-n", type=int, default=3)
+    parser.add_argument("--reranker", default="lexical", choices=["lexical", "cross-encoder"])
+    parser.add_argument("--gemini", action="store_true", help="Dung embed model that (can GOOGLE_API_KEY)")
+    args = parser.parse_args()
+
+    if args.gemini:
+        from constants import embed_model
+    else:
+        from fakes import FakeEmbedding
+        embed_model = FakeEmbedding()
+
+    nodes = load_nodes(args.papers_dir)
+    tokenizer = get_tokenizer()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        keyword_index = BM25Index(os.path.join(tmp_dir, "bm25.sqlite"))
+        keyword_index.add(nodes)
+        vector_index = VectorStoreIndex(nodes, embed_model=embed_model)
+        queries = make_queries(nodes, keyword_index, args.queries)
+
+        def hybrid(k):
+            return HybridRetriever(
+                [vector_index.as_retriever(similarity_top_k=k), BM25Retriever(keyword_index, similarity_top_k=k)],
+                similarity_top_k=k,
+            )
+
+        print(f"{len(nodes)} chunk, {len(queries)} cau hoi, reranker {args.reranker}, "
+              f"{args.candidates} ung vien -> top {args.top_n}")
+        reranker = build_reranker(args.reranker, top_n=args.top_n)
+        dense5 = vector_index.as_retriever(similarity_top_k=5)
+        hybrid5 = hybrid(5)
+        hybrid_many = hybrid(args.candidates)
+        base = run("dense top-5", queries, dense5.retrieve, [], tokenizer)
+        run("hybrid top-5", queries, hybrid5.retrieve, [], tokenizer)
+        reranked = run("rerank", queries, hybrid_many.retrieve, [reranker], tokenizer)
+        compressed = run("rerank+nen", queries, hybrid_many.retrieve, [reranker, SentenceCompressor()], tokenizer)
+
+    for name, result in (("rerank", reranked), ("rerank+nen", compressed)):
+        saved = base["tokens"] - result["tokens"]
+        print(f"=> {name}: giam {saved:.0f} token/cau ({saved / base['tokens']:.0%}) so voi dense top-5, "
+              f"them {result['latency_ms'] - base['latency_ms']:.2f} ms truy van/rerank")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+import argparse
+import asyncio
+import math
+import statistics
+import tempfile
+import time
+
+from llama_index.core.memory import ChatMemoryBuffer
+from llama_index.core.schema import TextNode
+
+from agent_class import Agent
+from agent_runtime import AgentRuntime
+from fakes import FakeEmbedding, FakeLLM
+from index_manager_local import IndexManagerLocal
+
+# Đo chi phí mỗi lượt hỏi-đáp khi dựng lại Agent mỗi lần chạy script (cách cũ của app.py)
+# so với dùng AgentRuntime dựng một lần cho cả process. Chạy hoàn toàn offline với fakes.
+# Chạy: python bench_runtime.py [--turns 20] [--connect-latency 0.3]
+
+RAG_THEN_ANSWER = [
+    'Thought: I should check the local database first.\n'
+    'Action: research_paper_query_tool\nAction Input: {"query": "retrieval augmented generation"}',
+    "Retrieval augmented generation combines a retriever with a generator.",
+    "Thought: I can answer without using any more tools.\nAnswer: RAG retrieves passages and then generates.",
+]
+
+
+def build_local_index(index_dir, embed_model, n_nodes):
+    manager = IndexManagerLocal(embed_model, index_dir=index_dir)
+    nodes = []
+    for i in range(n_nodes):
+        node = TextNode(text=f"Paper {i} studies retrieval augmented generation topic {i % 37}.", id_=f"node-{i}")
+        node.embedding = embed_model.embed(node.text)
+        nodes.append(node)
+    manager.vector_store.add(nodes)
+
+
+def make_manager(embed_model, index_dir, connect_latency):
+    # Giả lập thời gian mở kết nối tới vector store (Pinecone: tạo client + handshake)
+    if connect_latency:
+        time.sleep(connect_latency)
+    return IndexManagerLocal(embed_model, index_dir=index_dir)
+
+
+def per_run_turn(embed_model, index_dir, memory, connect_latency):
+    """Một lượt theo cách cũ: tạo LLM, kết nối, index, tool, ReActAgent và event loop mới."""
+    llm = FakeLLM(responses=RAG_THEN_ANSWER)
+    index = make_manager(embed_model, index_dir, connect_latency).retrieve_index()
+    agent = Agent(index, llm, memory=memory, embed_model=embed_model)
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(agent.chat("What is RAG?"))
+    finally:
+        loop.close()
+
+
+def summarize(name, samples):
+    samples_ms = [s * 1000 for s in samples]
+    p95 = sorted(samples_ms)[max(0, math.ceil(len(samples_ms) * 0.95) - 1)]
+    print(f"- {name:28s} trung binh {statistics.mean(samples_ms):8.1f} ms | p95 {p95:8.1f} ms")
+    return statistics.mean(samples_ms)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark chi phi moi luot hoi-dap: dung lai Agent hay dung moi.")
+    parser.add_argument("--turns", type=int, default=20, help="So luot hoi-dap moi kieu")
+    parser.add_argument("--nodes", type=int, default=2000, help="So node trong index local gia lap")
+    parser.add_argument("--connect-latency", type=float, default=0.0,
+                        help="Thoi gian gia lap mo ket noi vector store moi lan (giay)")
+    args = parser.parse_args()
+
+    embed_model = FakeEmbedding()
+    with tempfile.TemporaryDirectory() as index_dir:
+        build_local_index(index_dir, embed_model, args.nodes)
+        print(f"Index gia lap: {args.nodes} node, {args.turns} luot, connect latency {args.connect_latency}s")
+
+        memory = ChatMemoryBuffer.from_defaults(token_limit=20000)
+        per_run_turn(embed_model, index_dir, memory, args.connect_latency)  # warm-up import/JIT
+        before = []
+        for _ in range(args.turns):
+            memory.reset()
+            start = time.perf_counter()
+            per_run_turn(embed_model, index_dir, memory, args.connect_latency)
+            before.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        runtime = AgentRuntime(
+            FakeLLM(responses=RAG_THEN_ANSWER),
+            embed_model,
+            make_manager(embed_model, index_dir, args.connect_latency),
+        )
+        startup = time.perf_counter() - start
+        after = []
+        for _ in range(args.turns):
+            runtime.llm_model.reset()  # Chạy lại kịch bản từ đầu mỗi lượt
+            memory.reset()
+            start = time.perf_counter()
+            runtime.chat("What is RAG?", memory)
+            after.append(time.perf_counter() - start)
+        runtime.close()
+
+    print(f"- {'AgentRuntime khoi dong 1 lan':28s} {startup * 1000:8.1f} ms")
+    old = summarize("Dung moi moi luot (cu)", before)
+    new = summarize("AgentRuntime dung chung", after)
+    print(f"=> Tiet kiem {old - new:.1f} ms/luot ({old / max(new, 1e-9):.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
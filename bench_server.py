@@ -0,0 +1,130 @@
+import argparse
+import asyncio
+import random
+import statistics
+import tempfile
+import time
+
+import aiohttp
+from aiohttp import web
+from llama_index.core.schema import TextNode
+
+from agent_runtime import build_runtime
+from embedding_cache import CachedEmbedding, EmbeddingStore
+from fakes import FakeEmbedding, FakeReActLLM
+from index_manager_local import IndexManagerLocal
+from instrumentation import setup_instrumentation
+from server import ChatServer
+from session_memory import SessionStore
+
+# Bộ tạo tải cho server.py: chạy server trong process với LLM/embedding giả (có độ trễ giả lập) và
+# index local tạm thời, rồi cho nhiều người dùng ảo gửi câu hỏi song song (mỗi người một phiên).
+# Câu hỏi được chọn từ một tập nhỏ nên nhiều câu trùng nhau đến cùng lúc: các lời gọi embedding/RAG
+# trùng được gộp (single-flight). In thông lượng, độ trễ p50/p95/p99 và số lời gọi thực sự tới LLM/embedding.
+# Chạy: python bench_server.py [--users 32] [--requests 5] [--distinct 6] [--llm-concurrency 8]
+
+QUESTIONS = [
+    "What is quantum error correction?",
+    "How does retrieval augmented generation work?",
+    "Summarize recent work on diffusion models.",
+    "What are graph neural networks used for?",
+    "Explain sparse attention in transformers.",
+    "What is new in protein structure prediction?",
+    "How are large language models evaluated?",
+    "What is federated learning?",
+    "Explain contrastive self-supervised learning.",
+    "What are neural radiance fields?",
+]
+
+
+def percentile(samples, q):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * q))]
+
+
+def build_fake_runtime(index_dir, args):
+    embed_model = CachedEmbedding(FakeEmbedding(latency=args.embed_latency), store=EmbeddingStore(":memory:"))
+    manager = IndexManagerLocal(embed_model, index_dir=index_dir)
+    nodes = []
+    for i in range(args.nodes):
+        node = TextNode(text=f"Paper {i}: {QUESTIONS[i % len(QUESTIONS)]} topic {i % 37}.", id_=f"node-{i}")
+        node.embedding = embed_model.inner.embed(node.text)
+        nodes.append(node)
+    manager.vector_store.add(nodes)
+    llm = FakeReActLLM(first_token_latency=args.llm_latency)
+    return build_runtime(llm, embed_model, manager, max_llm_concurrency=args.llm_concurrency), llm, embed_model
+
+
+async def user(session, url, questions, n_requests, latencies, errors):
+    """Một người dùng ảo: gửi lần lượt n_requests câu hỏi trong cùng một phiên."""
+    session_id = None
+    for _ in range(n_requests):
+        start = time.perf_counter()
+        async with session.post(f"{url}/chat", json={"message": random.choice(questions), "session_id": session_id}) as resp:
+            if resp.status != 200:
+                errors.append(await resp.text())
+                continue
+            session_id = (await resp.json())["session_id"]
+        latencies.append(time.perf_counter() - start)
+
+
+async def run_load(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        runtime, llm, embed_model = build_fake_runtime(tmp, args)
+        server = ChatServer(runtime, store=SessionStore(":memory:"))
+        runner = web.AppRunner(server.build_app())
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        url = f"http://127.0.0.1:{port}"
+        questions = QUESTIONS[:args.distinct]
+        latencies, errors = [], []
+        try:
+            async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=300)) as session:
+                start = time.perf_counter()
+                await asyncio.gather(*(user(session, url, questions, args.requests, latencies, errors)
+                                       for _ in range(args.users)))
+                elapsed = time.perf_counter() - start
+                async with session.get(f"{url}/stats") as resp:
+                    stats = await resp.json()
+        finally:
+            await runner.cleanup()
+            runtime.close()
+
+    total = len(latencies)
+    print(f"{args.users} nguoi dung x {args.requests} cau hoi ({args.distinct} cau khac nhau), "
+          f"LLM {args.llm_latency * 1000:.0f} ms/lan, toi da {args.llm_concurrency} loi goi LLM cung luc")
+    print(f"- Thanh cong {total}, loi {len(errors)} trong {elapsed:.2f}s -> {total / elapsed:.1f} request/s")
+    if latencies:
+        ms = [s * 1000 for s in latencies]
+        print(f"- Do tre: trung binh {statistics.mean(ms):.0f} ms | p50 {percentile(ms, 0.5):.0f} ms | "
+              f"p95 {percentile(ms, 0.95):.0f} ms | p99 {percentile(ms, 0.99):.0f} ms | max {max(ms):.0f} ms")
+    print(f"- Goi LLM thuc su: {llm.calls} | goi embedding thuc su: {embed_model.inner.calls}")
+    print(f"- LLM: {stats['llm']}")
+    for name, counts in sorted(stats["singleflight"].items()):
+        print(f"- Single-flight {name}: {counts.get('leader', 0)} loi goi, {counts.get('coalesced', 0)} duoc gop")
+    print(f"- Server: {stats['server']}")
+    if errors:
+        print(f"Loi dau tien: {errors[0][:300]}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tao tai cho server.py voi LLM/embedding gia.")
+    parser.add_argument("--users", type=int, default=32, help="So nguoi dung ao gui song song")
+    parser.add_argument("--requests", type=int, default=5, help="So cau hoi moi nguoi dung")
+    parser.add_argument("--distinct", type=int, default=6, help="So cau hoi khac nhau (it -> nhieu cau trung)")
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="Do tre gia lap moi lan goi LLM (giay)")
+    parser.add_argument("--embed-latency", type=float, default=0.05, help="Do tre gia lap moi lan embed (giay)")
+    parser.add_argument("--llm-concurrency", type=int, default=8, help="So loi goi LLM cung luc toi da")
+    parser.add_argument("--nodes", type=int, default=2000, help="So node trong index local gia lap")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    setup_instrumentation(trace_path=None, metrics_path=None)
+    asyncio.run(run_load(args))
+
+
+if __name__ == "__main__":
+    main()
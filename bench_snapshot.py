@@ -0,0 +1,115 @@
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from llama_index.core import StorageContext, VectorStoreIndex, load_index_from_storage
+from llama_index.core.schema import TextNode
+
+from fakes import FakeEmbedding
+from index_manager import IndexManager
+from index_manager_local import IndexManagerLocal
+from index_snapshot import Snapshot
+from instrumentation import setup_instrumentation
+
+# So sánh thư mục index/ (JSON của LlamaIndex) với snapshot nhị phân (index_snapshot.py) trên một tập node
+# giả lập (văn bản ngẫu nhiên + metadata kiểu arXiv, embedding bằng FakeEmbedding): dung lượng, thời gian ghi/nạp,
+# rồi khôi phục snapshot vào index local (đo thông lượng upsert, kiểm tra không có lời gọi embedding nào)
+# và so sánh kết quả tìm kiếm (quét toàn bộ) của index gốc với index dựng lại từ snapshot (float16 làm lệch điểm rất ít).
+# Chạy: python bench_snapshot.py [--nodes 20000] [--dtype float16] [--queries 50]
+
+TOPICS = ("quantum transformer attention graph neural diffusion protein retrieval sparse federated "
+          "contrastive radiance language model learning network optimization gradient kernel bayesian "
+          "inference lattice entropy spectral manifold convex tensor encoder decoder benchmark").split()
+WORDS = TOPICS + [f"{a}{b}" for a in TOPICS for b in TOPICS[:40]]
+
+
+def dir_size(path):
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+
+
+def make_nodes(n, embed_model, seed=0):
+    rng = random.Random(seed)
+    nodes = []
+    for i in range(n):
+        text = " ".join(rng.choice(WORDS) for _ in range(150))  # Nhiều từ khác nhau để ít node có điểm sát nhau
+        node = TextNode(
+            text=text,
+            id_=f"node-{i}",
+            metadata={
+                "title": f"Paper {i // 8}",
+                "arxiv_id": f"2401.{i // 8:05d}",
+                "category": rng.choice(["cs.LG", "cs.CL", "quant-ph", "q-bio.BM"]),
+                "authors": "A. Nguyen, B. Tran",
+                "published": "2024-01-15",
+            },
+        )
+        node.embedding = embed_model.embed(text)
+        nodes.append(node)
+    return nodes
+
+
+def top_ids(retriever, queries):
+    return [[n.node.node_id for n in retriever.retrieve(q)] for q in queries]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="So sanh index/ JSON voi snapshot nhi phan.")
+    parser.add_argument("--nodes", type=int, default=20000, help="So node gia lap")
+    parser.add_argument("--dtype", choices=["float16", "float32"], default="float16")
+    parser.add_argument("--queries", type=int, default=50, help="So cau hoi dung de so sanh ket qua tim kiem")
+    args = parser.parse_args()
+
+    setup_instrumentation(trace_path=None, metrics_path=None)
+    embed_model = FakeEmbedding()
+    print(f"Tao {args.nodes} node gia lap...")
+    nodes = make_nodes(args.nodes, embed_model)
+    rng = random.Random(1)
+    queries = [" ".join(rng.choice(WORDS) for _ in range(6)) for _ in range(args.queries)]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        json_dir, snap_dir = os.path.join(tmp, "index"), os.path.join(tmp, "snapshot")
+
+        index = VectorStoreIndex(nodes, embed_model=embed_model)
+        start = time.perf_counter()
+        index.storage_context.persist(persist_dir=json_dir)
+        json_write = time.perf_counter() - start
+        start = time.perf_counter()
+        index = load_index_from_storage(StorageContext.from_defaults(persist_dir=json_dir), embed_model=embed_model)
+        json_load = time.perf_counter() - start
+        expected = top_ids(index.as_retriever(similarity_top_k=5), queries)
+
+        manager = IndexManager(embed_model)
+        manager.index = index
+        start = time.perf_counter()
+        manager.export_snapshot(snap_dir, dtype=args.dtype)
+        snap_write = time.perf_counter() - start
+        start = time.perf_counter()
+        restored = IndexManager(embed_model)
+        restored.import_snapshot(snap_dir)
+        snap_load = time.perf_counter() - start
+        got = top_ids(restored.index.as_retriever(similarity_top_k=5), queries)
+        overlap = sum(len(set(a) & set(b)) for a, b in zip(expected, got)) / max(1, sum(len(a) for a in expected))
+
+        calls = embed_model.calls
+        local = IndexManagerLocal(embed_model, index_dir=os.path.join(tmp, "local"))
+        start = time.perf_counter()
+        stats = local.import_snapshot(snap_dir)
+        restore = time.perf_counter() - start
+        restore_calls = embed_model.calls - calls
+
+        json_size, snap_size = dir_size(json_dir), Snapshot(snap_dir).nbytes()
+        print(f"\n{args.nodes} node, vector {args.dtype}:")
+        print(f"- index/ JSON : {json_size / 1e6:8.1f} MB | ghi {json_write:6.2f}s | nap {json_load:6.2f}s")
+        print(f"- snapshot    : {snap_size / 1e6:8.1f} MB | ghi {snap_write:6.2f}s | nap {snap_load:6.2f}s "
+              f"(nho hon {json_size / snap_size:.1f} lan, nap nhanh hon {json_load / snap_load:.1f} lan)")
+        print(f"- Khoi phuc vao index local: {stats['nodes']} node trong {restore:.2f}s "
+              f"({stats['nodes'] / restore:.0f} node/s, {stats['upsert_requests']} lan upsert, "
+              f"{restore_calls} lan goi embedding)")
+        print(f"- BM25: {len(local.keyword_index)} chunk | metadata: {len(local.metadata_index)} chunk")
+        print(f"- Ket qua top-5 cua index khoi phuc tu snapshot giong index goc: {overlap:.1%} ({args.queries} cau hoi)")
+
+
+if __name__ == "__main__":
+    main()
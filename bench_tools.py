@@ -0,0 +1,117 @@
+import argparse
+import asyncio
+import time
+
+from llama_index.core.agent.workflow import ToolCall, ToolCallResult
+from llama_index.core.memory import ChatMemoryBuffer
+from llama_index.core.tools import FunctionTool
+
+from fakes import FakeLLM
+from parallel_react_agent import ParallelReActAgent
+from tools import run_blocking, with_timeout
+
+# Kiểm tra tool của Agent không chặn event loop và chạy song song: hai tool giả lập I/O blocking
+# (time.sleep, giống gọi arXiv / tải PDF), LLM giả gọi cả hai trong cùng một bước.
+# Cách cũ (tool đồng bộ, mỗi bước một Action) mất tổng thời gian hai tool; cách mới mất bằng tool chậm nhất.
+# Trong lúc Agent chạy, một task "nhịp tim" đo độ trễ của event loop. Chạy hoàn toàn offline.
+# Chạy: python bench_tools.py [--delay 1.0]
+
+PARALLEL = [
+    'Thought: The two lookups are independent, I will run them together.\n'
+    'Action: slow_arxiv_tool\nAction Input: {"topic": "quantum error correction"}\n'
+    'Action: slow_pdf_tool\nAction Input: {"url": "https://arxiv.org/pdf/2401.00001"}',
+    "Thought: I can answer without using any more tools.\nAnswer: Both tools finished.",
+]
+SERIAL = [
+    'Thought: First the arXiv lookup.\n'
+    'Action: slow_arxiv_tool\nAction Input: {"topic": "quantum error correction"}',
+    'Thought: Now the download.\n'
+    'Action: slow_pdf_tool\nAction Input: {"url": "https://arxiv.org/pdf/2401.00001"}',
+    "Thought: I can answer without using any more tools.\nAnswer: Both tools finished.",
+]
+
+
+def make_tools(delay, timeout=None, use_async=True):
+    def slow_arxiv(topic: str):
+        time.sleep(delay)
+        return f"3 papers about {topic}"
+
+    def slow_pdf(url: str):
+        time.sleep(delay)
+        return f"downloaded {url}"
+
+    async def aslow_arxiv(topic: str):
+        return await run_blocking(slow_arxiv, topic)
+
+    async def aslow_pdf(url: str):
+        return await run_blocking(slow_pdf, url)
+
+    if not use_async:
+        # Cách cũ: tool đồng bộ, chạy thẳng trên event loop
+        async def aslow_arxiv(topic: str):
+            return slow_arxiv(topic)
+
+        async def aslow_pdf(url: str):
+            return slow_pdf(url)
+
+    return [
+        FunctionTool.from_defaults(fn=slow_arxiv, async_fn=with_timeout(aslow_arxiv, "slow_arxiv_tool", timeout),
+                                   name="slow_arxiv_tool", description="Search arXiv (slow)."),
+        FunctionTool.from_defaults(fn=slow_pdf, async_fn=with_timeout(aslow_pdf, "slow_pdf_tool", timeout),
+                                   name="slow_pdf_tool", description="Download a PDF (slow)."),
+    ]
+
+
+async def run_case(name, responses, tools):
+    agent = ParallelReActAgent(tools=tools, llm=FakeLLM(responses=responses), streaming=False)
+    gaps = []
+
+    async def heartbeat():
+        last = time.perf_counter()
+        while True:
+            await asyncio.sleep(0.01)
+            now = time.perf_counter()
+            gaps.append(now - last - 0.01)
+            last = now
+
+    beat = asyncio.create_task(heartbeat())
+    calls, spans = {}, []
+    start = time.perf_counter()
+    handler = agent.run(user_msg="Find and download papers", memory=ChatMemoryBuffer.from_defaults())
+    async for event in handler.stream_events():
+        if isinstance(event, ToolCall):
+            calls.setdefault(event.tool_id, time.perf_counter() - start)
+        elif isinstance(event, ToolCallResult):
+            spans.append((event.tool_name, calls.get(event.tool_id, 0.0), time.perf_counter() - start,
+                          str(event.tool_output)))
+    answer = await handler
+    elapsed = time.perf_counter() - start
+    beat.cancel()
+    print(f"- {name:34s} {elapsed:5.2f}s | event loop bi chan toi da {max(gaps, default=0) * 1000:6.0f} ms"
+          f" | tra loi: {str(answer).strip()}")
+    for tool_name, begin, end, output in spans:
+        print(f"    {tool_name:16s} {begin:5.2f}s -> {end:5.2f}s  {output}")
+    return elapsed, spans
+
+
+def overlaps(spans):
+    (_, begin_a, end_a, _), (_, begin_b, end_b, _) = spans[:2]
+    return begin_a < end_b and begin_b < end_a
+
+
+async def main(delay):
+    serial, _ = await run_case("tuan tu, tool dong bo (cu)", SERIAL, make_tools(delay, use_async=False))
+    parallel, spans = await run_case("song song, tool async (moi)", PARALLEL, make_tools(delay))
+    print(f"=> Nhanh hon {serial / parallel:.1f} lan, hai tool chay chong len nhau: {overlaps(spans)}")
+    assert overlaps(spans), "Hai tool phai chay dong thoi"
+    assert parallel < delay * 1.5, "Thoi gian phai gan bang tool cham nhat, khong phai tong hai tool"
+
+    _, spans = await run_case("song song, timeout 0.3s", PARALLEL, make_tools(delay, timeout=0.3))
+    assert all("timed out" in output for *_, output in spans), "Tool qua thoi gian phai tra ve loi timeout"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Kiem tra tool cua Agent chay song song va khong chan event loop.")
+    parser.add_argument("--delay", type=float, default=1.0, help="Thoi gian moi tool gia lap (giay)")
+    args = parser.parse_args()
+    asyncio.run(main(args.delay))
@@ -0,0 +1,350 @@
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import tempfile
+import time
+
+import numpy as np
+from llama_index.core.memory import ChatMemoryBuffer
+from llama_index.core.schema import TextNode
+from llama_index.core.vector_stores import SimpleVectorStore, VectorStoreQuery
+
+from fakes import FakeEmbedding, FakeLLM
+from ingest_manifest import file_sha256
+from ingest_pipeline import iter_parsed_files
+from numpy_retriever import NumpyVectorRetriever
+
+# Bộ benchmark tái lập được cho các backend index, chạy offline với FakeEmbedding/FakeLLM.
+#
+# Corpus:
+#   - papers: các chunk từ thư mục papers/ (embedding bằng FakeEmbedding)
+#   - synthetic-<n>: n vector có cấu trúc cụm (1k - 1M chunk), sinh trực tiếp bằng NumPy
+# Mỗi (corpus, backend) đo: tốc độ nạp, độ trễ truy vấn p50/p95/p99, recall@k so với kết quả
+# chính xác (brute-force float32), bộ nhớ (RSS tăng thêm) và dung lượng ổ cứng.
+# Thêm một lượt end-to-end trên papers/: pipeline nạp dữ liệu + Agent với FakeLLM.
+#
+# Chạy: python benchmark.py [--sizes 1000,10000,100000] [--backends memory,local,numpy-int8]
+#       [--dim 768] [--output bench_results.json]
+# Với 1M chunk nên giảm --dim (1M x 768 float32 = 3 GB) và bỏ backend "memory" (quá chậm).
+
+BATCH_SIZE = 10000
+RAG_THEN_ANSWER = [
+    'Thought: I should check the local database first.\n'
+    'Action: research_paper_query_tool\nAction Input: {"query": "quantum"}',
+    "The papers discuss quantum devices.",
+    "Thought: I can answer without using any more tools.\nAnswer: They discuss quantum devices.",
+]
+
+
+def rss_mb():
+    """RSS hiện tại của process (MB), đọc từ /proc (Linux); nơi khác trả về 0."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError, AttributeError):
+        return 0.0
+
+
+def dir_size_mb(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        total += sum(os.path.getsize(os.path.join(root, f)) for f in files)
+    return total / 2**20
+
+
+def percentiles(samples_ms):
+    p50, p95, p99 = np.percentile(samples_ms, [50, 95, 99])
+    return {"p50": float(p50), "p95": float(p95), "p99": float(p99), "mean": float(np.mean(samples_ms))}
+
+
+class Corpus:
+    def __init__(self, name, vectors, texts=None, query_vectors=None):
+        """
+        Tập chunk có embedding sẵn dùng cho benchmark.
+
+        Args:
+            name (str): Tên corpus trong kết quả.
+            vectors (np.ndarray): Ma trận embedding (n, dim).
+            texts (list): Nội dung chunk (None = sinh nội dung giả).
+            query_vectors (np.ndarray): Embedding các câu hỏi (m, dim).
+        """
+        self.name = name
+        self.vectors = vectors
+        self.texts = texts
+        self.query_vectors = query_vectors
+        self.ids = [f"{name}-{i}" for i in range(len(vectors))]
+
+    def __len__(self):
+        return len(self.vectors)
+
+    def batches(self, batch_size=BATCH_SIZE):
+        """Sinh node theo lô (không giữ toàn bộ node trong RAM cùng lúc)."""
+        for start in range(0, len(self), batch_size):
+            nodes = []
+            for i in range(start, min(start + batch_size, len(self))):
+                text = self.texts[i] if self.texts else f"synthetic chunk {i}"
+                nodes.append(TextNode(text=text, id_=self.ids[i], embedding=self.vectors[i].tolist()))
+            yield nodes
+
+    def ground_truth(self, k):
+        """Top-k chính xác (cosine, float32) cho mỗi câu hỏi."""
+        exact = NumpyVectorRetriever(None, self.ids, self.vectors, None, dtype="float32")
+        indices, _ = exact.search(self.query_vectors, k)
+        return [[self.ids[i] for i in row] for row in indices.tolist()]
+
+
+def synthetic_corpus(n, dim, n_queries, seed=0):
+    """n vector quanh các tâm cụm (giống embedding văn bản hơn nhiễu thuần) và câu hỏi gần các vector đó."""
+    rng = np.random.default_rng(seed)
+    n_clusters = max(10, int(np.sqrt(n)))
+    centers = rng.normal(size=(n_clusters, dim)).astype(np.float32)
+    vectors = np.empty((n, dim), dtype=np.float32)
+    for start in range(0, n, 100000):
+        count = min(100000, n - start)
+        vectors[start:start + count] = (
+            centers[rng.integers(0, n_clusters, count)] + 0.5 * rng.normal(size=(count, dim)).astype(np.float32)
+        )
+    picks = rng.choice(n, min(n_queries, n), replace=False)
+    queries = vectors[picks] + 0.2 * rng.normal(size=(len(picks), dim)).astype(np.float32)
+    return Corpus(f"synthetic-{n}", vectors, query_vectors=queries)
+
+
+def paper_paths(papers_dir):
+    return sorted(
+        os.path.join(papers_dir, f) for f in os.listdir(papers_dir)
+        if not f.startswith(".") and os.path.isfile(os.path.join(papers_dir, f))
+    )
+
+
+def parse_papers(papers_dir):
+    paths = paper_paths(papers_dir)
+    nodes = []
+    for _, _, file_nodes in iter_parsed_files([(path, file_sha256(path)) for path in paths]):
+        nodes.extend(file_nodes)
+    return paths, nodes
+
+
+def papers_corpus(nodes, embed_model, n_queries, seed=0):
+    """Chunk trong papers/ + câu hỏi là một đoạn ngắn (12 từ) lấy ngẫu nhiên từ các chunk."""
+    rng = np.random.default_rng(seed)
+    texts = [node.get_content() for node in nodes]
+    vectors = np.asarray(embed_model.get_text_embedding_batch(texts), dtype=np.float32)
+    queries = []
+    for i in rng.choice(len(texts), min(n_queries, len(texts)), replace=False):
+        words = texts[i].split()
+        start = int(rng.integers(0, max(1, len(words) - 12)))
+        queries.append(" ".join(words[start:start + 12]))
+    query_vectors = np.asarray([embed_model.get_query_embedding(q) for q in queries], dtype=np.float32)
+    return Corpus("papers", vectors, texts=texts, query_vectors=query_vectors)
+
+
+class StoreBackend:
+    """Backend dựa trên một vector store của LlamaIndex (truy vấn bằng VectorStoreQuery)."""
+
+    def __init__(self, name, make_store):
+        self.name = name
+        self.make_store = make_store
+        self.store = None
+        self.work_dir = None
+
+    def build(self, corpus):
+        self.work_dir = tempfile.mkdtemp(prefix=f"bench-{self.name}-")
+        self.store = self.make_store(self.work_dir)
+        for nodes in corpus.batches():
+            self.store.add(nodes)
+
+    def query(self, vector, k):
+        result = self.store.query(VectorStoreQuery(query_embedding=vector.tolist(), similarity_top_k=k))
+        return list(result.ids or [])
+
+    def disk_mb(self):
+        return dir_size_mb(self.work_dir) if self.work_dir else 0.0
+
+    def close(self):
+        self.store = None
+        if self.work_dir:
+            shutil.rmtree(self.work_dir, ignore_errors=True)
+
+
+class NumpyBackend:
+    """NumpyVectorRetriever (IndexManager.build_numpy_retriever) với float32/float16/int8."""
+
+    def __init__(self, dtype):
+        self.name = f"numpy-{dtype}"
+        self.dtype = dtype
+        self.retriever = None
+
+    def build(self, corpus):
+        self.retriever = NumpyVectorRetriever(None, corpus.ids, corpus.vectors, None, dtype=self.dtype)
+
+    def query(self, vector, k):
+        indices, _ = self.retriever.search([vector], k)
+        return [self.retriever.node_ids[i] for i in indices[0]]
+
+    def disk_mb(self):
+        return 0.0
+
+    def close(self):
+        self.retriever = None
+
+
+def make_backend(name, args):
+    if name == "memory":
+        # IndexManager mặc định: VectorStoreIndex trên SimpleVectorStore trong RAM
+        return StoreBackend(name, lambda work_dir: SimpleVectorStore())
+    if name == "local":
+        from local_vector_store import MmapVectorStore
+        return StoreBackend(name, lambda work_dir: MmapVectorStore(work_dir, nprobe=args.nprobe))
+    if name.startswith("numpy-"):
+        return NumpyBackend(name.split("-", 1)[1])
+    if name == "pinecone":
+        # Ghi vào namespace riêng của một index dành cho benchmark (không dùng index thật của app)
+        from pinecone import Pinecone
+        from llama_index.vector_stores.pinecone import PineconeVectorStore
+        index = Pinecone(api_key=os.getenv("PINECONE_API_KEY")).Index(args.pinecone_index)
+        return StoreBackend(name, lambda work_dir: PineconeVectorStore(pinecone_index=index, namespace="benchmark"))
+    raise ValueError(f"Backend khong hop le: {name}")
+
+
+def bench_backend(backend, corpus, k, truth):
+    rss_before = rss_mb()
+    start = time.perf_counter()
+    backend.build(corpus)
+    ingest_s = time.perf_counter() - start
+    rss_after = rss_mb()
+
+    latencies = []
+    hits = []
+    for vector, expected in zip(corpus.query_vectors, truth):
+        start = time.perf_counter()
+        found = backend.query(vector, k)
+        latencies.append((time.perf_counter() - start) * 1000)
+        hits.append(len(set(found) & set(expected)) / max(len(expected), 1))
+    result = {
+        "corpus": corpus.name,
+        "backend": backend.name,
+        "chunks": len(corpus),
+        "dim": int(corpus.vectors.shape[1]),
+        "ingest_seconds": ingest_s,
+        "ingest_chunks_per_second": len(corpus) / ingest_s if ingest_s else None,
+        "query_latency_ms": percentiles(latencies),
+        f"recall@{k}": float(np.mean(hits)),
+        "rss_delta_mb": rss_after - rss_before,
+        "disk_mb": backend.disk_mb(),
+    }
+    backend.close()
+    return result
+
+
+def bench_end_to_end(papers_dir, turns):
+    """Nạp papers/ qua pipeline thật (FakeEmbedding) rồi đo độ trễ mỗi lượt chat của Agent (FakeLLM)."""
+    from agent_runtime import AgentRuntime
+    from index_manager_local import IndexManagerLocal
+
+    embed_model = FakeEmbedding()
+    with tempfile.TemporaryDirectory() as index_dir:
+        manager = IndexManagerLocal(embed_model, index_dir=index_dir)
+        start = time.perf_counter()
+        stats = manager.build_pipeline().run(
+            [(path, file_sha256(path)) for path in paper_paths(papers_dir)]
+        )
+        ingest_s = time.perf_counter() - start
+
+        llm = FakeLLM(responses=RAG_THEN_ANSWER)
+        runtime = AgentRuntime(llm, embed_model, manager)
+        latencies = []
+        for _ in range(turns):
+            llm.reset()
+            start = time.perf_counter()
+            runtime.chat("What do the papers say about quantum devices?", ChatMemoryBuffer.from_defaults())
+            latencies.append((time.perf_counter() - start) * 1000)
+        runtime.close()
+    return {
+        "files": stats["files"],
+        "chunks": stats["nodes"],
+        "ingest_seconds": ingest_s,
+        "ingest_chunks_per_second": stats["nodes"] / ingest_s if ingest_s else None,
+        "chat_latency_ms": percentiles(latencies),
+        "llm_calls_per_turn": llm.calls,
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark nap du lieu / truy van / end-to-end cho cac backend index.")
+    parser.add_argument("--papers-dir", default="papers")
+    parser.add_argument("--sizes", default="1000,10000,100000", help="Kich thuoc cac corpus tong hop (dau phay)")
+    parser.add_argument("--dim", type=int, default=768, help="So chieu embedding cua corpus tong hop")
+    parser.add_argument("--backends", default="memory,local,numpy-float32,numpy-int8",
+                        help="memory, local, numpy-float32, numpy-float16, numpy-int8, pinecone")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--nprobe", type=int, default=8, help="nprobe cho backend local (IVF)")
+    parser.add_argument("--memory-max", type=int, default=100000,
+                        help="Bo qua backend memory voi corpus lon hon (truy van thuan Python rat cham)")
+    parser.add_argument("--pinecone-index", default="arxiv-benchmark", help="Index Pinecone rieng cho benchmark")
+    parser.add_argument("--turns", type=int, default=20, help="So luot chat end-to-end")
+    parser.add_argument("--skip-e2e", action="store_true")
+    parser.add_argument("--output", default="bench_results.json")
+    args = parser.parse_args()
+
+    embed_model = FakeEmbedding(dim=args.dim)
+    _, paper_nodes = parse_papers(args.papers_dir) if os.path.isdir(args.papers_dir) else ([], [])
+    corpora = []
+    if paper_nodes:
+        corpora.append(lambda: papers_corpus(paper_nodes, embed_model, args.queries))
+    for size in [int(s) for s in args.sizes.split(",") if s.strip()]:
+        corpora.append(lambda size=size: synthetic_corpus(size, args.dim, args.queries))
+
+    results = []
+    for make_corpus in corpora:
+        corpus = make_corpus()
+        truth = corpus.ground_truth(args.k)
+        print(f"\n{corpus.name}: {len(corpus)} chunk x {corpus.vectors.shape[1]} chieu, {len(truth)} cau hoi")
+        for name in [b.strip() for b in args.backends.split(",") if b.strip()]:
+            if name == "memory" and len(corpus) > args.memory_max:
+                print(f"- {name:14s} bo qua (> --memory-max {args.memory_max})")
+                continue
+            result = bench_backend(make_backend(name, args), corpus, args.k, truth)
+            results.append(result)
+            latency = result["query_latency_ms"]
+            print(f"- {name:14s} nap {result['ingest_chunks_per_second']:10.0f} chunk/s | "
+                  f"p50 {latency['p50']:7.2f} p95 {latency['p95']:7.2f} p99 {latency['p99']:7.2f} ms | "
+                  f"recall@{args.k} {result[f'recall@{args.k}']:.3f} | "
+                  f"RSS +{result['rss_delta_mb']:.0f} MB | disk {result['disk_mb']:.0f} MB")
+        del corpus
+
+    end_to_end = None
+    if not args.skip_e2e and paper_nodes:
+        end_to_end = bench_end_to_end(args.papers_dir, args.turns)
+        latency = end_to_end["chat_latency_ms"]
+        print(f"\nEnd-to-end (papers/, local, FakeLLM): nap {end_to_end['ingest_chunks_per_second']:.0f} chunk/s | "
+              f"chat p50 {latency['p50']:.1f} p95 {latency['p95']:.1f} p99 {latency['p99']:.1f} ms")
+
+    report = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "git_revision": git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": vars(args),
+        "results": results,
+        "end_to_end": end_to_end,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=1)
+    print(f"\nDa ghi ket qua vao {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,415 @@
+import asyncio
+import itertools
+import json
+import math
+import os
+import re
+import sqlite3
+import threading
+from collections import Counter, defaultdict
+from typing import List
+
+import numpy as np
+from llama_index.core.retrievers import BaseRetriever
+from llama_index.core.schema import NodeWithScore, QueryBundle
+from llama_index.core.vector_stores.utils import metadata_dict_to_node, node_to_metadata_dict
+
+DEFAULT_BM25_PATH = os.path.join(".cache", "bm25.sqlite")
+# Postings của một term gồm nhiều đoạn: lần add thứ seq thêm một đoạn (seq) cho mỗi term. Sau lần add có seq
+# chia hết cho SEGMENT_FANOUT^m, các đoạn của SEGMENT_FANOUT^m lần add gần nhất được gộp thành một đoạn mỗi term.
+# Mỗi posting chỉ bị ghi lại O(log n) lần và mỗi term có O(log n) đoạn.
+SEGMENT_FANOUT = 8
+
+# arXiv ID (2401.01234, 2401.01234v2) giữ nguyên thành một token; còn lại tách theo chữ/số
+_TOKEN_RE = re.compile(r"\d{4}\.\d{4,5}(?:v\d+)?|[^\W_]+")
+_VERSION_RE = re.compile(r"v\d+$")
+STOPWORDS = frozenset(
+    "a an and are as at be by for from has have in into is it its of on or that the their this to was "
+    "we were which with".split()
+)
+
+
+def tokenize(text):
+    """Tách văn bản thành token cho BM25 (chữ thường, bỏ stopword, arXiv ID có version sinh thêm bản không version)."""
+    tokens = []
+    for token in _TOKEN_RE.findall(text.lower()):
+        if token in STOPWORDS:
+            continue
+        tokens.append(token)
+        if "." in token and _VERSION_RE.search(token):
+            tokens.append(_VERSION_RE.sub("", token))
+    return tokens
+
+
+def encode_varints(values):
+    """Mã hóa dãy số nguyên không âm thành bytes (varint 7 bit/byte)."""
+    out = bytearray()
+    for value in values:
+        while value >= 0x80:
+            out.append((value & 0x7F) | 0x80)
+            value >>= 7
+        out.append(value)
+    return bytes(out)
+
+
+def decode_varints(data):
+    values = []
+    value = shift = 0
+    for byte in data:
+        value |= (byte & 0x7F) << shift
+        if byte & 0x80:
+            shift += 7
+        else:
+            values.append(value)
+            value = shift = 0
+    return values
+
+
+def encode_postings(postings, last_doc=0):
+    """
+    Mã hóa danh sách (doc_num, tf) đã sắp xếp tăng dần thành bytes: khoảng cách doc_num (delta) + tf, dạng varint.
+
+    Args:
+        postings (list): [(doc_num, tf), ...] với doc_num > last_doc.
+        last_doc (int): doc_num cuối cùng của phần postings đã có (để nối thêm).
+    """
+    values = []
+    for doc_num, tf in postings:
+        values.append(doc_num - last_doc)
+        values.append(tf)
+        last_doc = doc_num
+    return encode_varints(values)
+
+
+def rebase_postings(data, last_doc):
+    """Đổi khoảng cách đầu tiên của postings (mã hóa từ 0) thành khoảng cách so với last_doc, để nối sau đoạn khác."""
+    end = 0
+    while data[end] & 0x80:
+        end += 1
+    first_doc = decode_varints(data[:end + 1])[0]
+    return encode_varints([first_doc - last_doc]) + data[end + 1:]
+
+
+def decode_postings(data):
+    """Giải mã postings, trả về (mảng doc_num, mảng tf)."""
+    values = np.asarray(decode_varints(data), dtype=np.int64)
+    return np.cumsum(values[0::2]), values[1::2]
+
+
+class BM25Index:
+    def __init__(self, path=DEFAULT_BM25_PATH, k1=1.2, b=0.75):
+        """
+        Chỉ mục từ khóa (inverted index) BM25 lưu trên ổ cứng (SQLite), nạp tăng dần.
+
+        Postings của mỗi term được lưu nén (delta + varint) thành vài đoạn, nên chỉ cần đọc postings của
+        các term trong câu hỏi và add() không phải ghi lại toàn bộ postings của term phổ biến.
+        Node bị xóa chỉ được đánh dấu; compact() ghi lại postings thành một đoạn.
+
+        Args:
+            path (str): File SQLite chứa chỉ mục.
+            k1 (float): Tham số bão hòa tần suất term của BM25.
+            b (float): Mức chuẩn hóa theo độ dài chunk của BM25.
+        """
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.executescript(
+            """
+            PRAGMA journal_mode=WAL;
+            CREATE TABLE IF NOT EXISTS docs (
+                doc_num INTEGER PRIMARY KEY,
+                node_id TEXT NOT NULL,
+                ref_doc_id TEXT,
+                length INTEGER NOT NULL,
+                deleted INTEGER NOT NULL DEFAULT 0,
+                node_json TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_docs_node_id ON docs(node_id);
+            CREATE INDEX IF NOT EXISTS idx_docs_ref_doc_id ON docs(ref_doc_id);
+            """
+        )
+        with self._lock:
+            self._migrate_postings()
+        self._data_version = None
+        self._lengths = None  # doc_num -> độ dài (0 nếu đã xóa)
+        self._avgdl = 0.0
+        self._n_docs = 0
+
+    def _migrate_postings(self):
+        """
+        Tạo bảng terms (df) và segments (các đoạn postings). Chỉ mục cũ lưu toàn bộ postings trong một cột
+        của terms: mỗi term được chuyển thành một đoạn có seq = 0.
+        """
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(terms)")]
+        old_schema = "postings" in columns
+        if old_schema:
+            self._conn.execute("ALTER TABLE terms RENAME TO terms_old")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS terms (term TEXT PRIMARY KEY, df INTEGER NOT NULL);
+            CREATE TABLE IF NOT EXISTS segments (
+                term TEXT NOT NULL, seq INTEGER NOT NULL, last_doc INTEGER NOT NULL, postings BLOB NOT NULL,
+                PRIMARY KEY (term, seq));
+            CREATE INDEX IF NOT EXISTS idx_segments_seq ON segments(seq);
+            """
+        )
+        if old_schema:
+            rows = self._conn.execute("SELECT term, df, last_doc, postings FROM terms_old").fetchall()
+            self._conn.executemany("INSERT INTO terms VALUES (?, ?)", [(term, df) for term, df, _, _ in rows])
+            self._conn.executemany(
+                "INSERT INTO segments VALUES (?, 0, ?, ?)",
+                [(term, last_doc, blob) for term, _, last_doc, blob in rows if blob],
+            )
+            self._conn.execute("DROP TABLE terms_old")
+            self._conn.commit()
+
+    def __len__(self):
+        """Số chunk còn hiệu lực."""
+        self._refresh()
+        return self._n_docs
+
+    def _refresh(self):
+        """Đọc lại độ dài các chunk nếu chỉ mục đã thay đổi (kể cả do process khác ghi)."""
+        version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+        if self._lengths is not None and version == self._data_version:
+            return
+        rows = self._conn.execute("SELECT doc_num, length FROM docs WHERE deleted = 0").fetchall()
+        max_doc = self._conn.execute("SELECT COALESCE(MAX(doc_num), 0) FROM docs").fetchone()[0]
+        lengths = np.zeros(max_doc + 1, dtype=np.float32)
+        if rows:
+            doc_nums, values = zip(*rows)
+            lengths[list(doc_nums)] = values
+        self._lengths = lengths
+        self._n_docs = len(rows)
+        self._avgdl = float(lengths.sum()) / max(len(rows), 1)
+        self._data_version = version
+
+    def _invalidate(self):
+        # data_version chỉ đổi khi connection khác ghi, nên tự đánh dấu khi chính mình ghi
+        self._lengths = None
+
+    def _change_df(self, counts, sign):
+        for term, tf_docs in counts.items():
+            self._conn.execute("UPDATE terms SET df = df + ? WHERE term = ?", (sign * tf_docs, term))
+
+    def _mark_deleted(self, column, values):
+        """Đánh dấu xóa các chunk, giảm df của các term tương ứng."""
+        removed = Counter()
+        for start in range(0, len(values), 500):
+            batch = list(values[start:start + 500])
+            placeholders = ",".join("?" * len(batch))
+            rows = self._conn.execute(
+                f"SELECT doc_num, node_json FROM docs WHERE deleted = 0 AND {column} IN ({placeholders})", batch
+            ).fetchall()
+            for doc_num, node_json in rows:
+                removed.update(set(tokenize(metadata_dict_to_node(json.loads(node_json)).get_content())))
+            self._conn.executemany("UPDATE docs SET deleted = 1 WHERE doc_num = ?", [(d,) for d, _ in rows])
+        self._change_df(removed, -1)
+
+    def add(self, nodes):
+        """Thêm chunk vào chỉ mục. Chunk trùng node_id sẽ thay thế bản cũ."""
+        nodes = [node for node in nodes if node.get_content()]
+        if not nodes:
+            return
+        with self._lock:
+            self._mark_deleted("node_id", [node.node_id for node in nodes])
+            next_doc = self._conn.execute("SELECT COALESCE(MAX(doc_num), 0) + 1 FROM docs").fetchone()[0]
+            new_postings = defaultdict(list)
+            rows = []
+            for offset, node in enumerate(nodes):
+                doc_num = next_doc + offset
+                tokens = tokenize(node.get_content())
+                for term, tf in Counter(tokens).items():
+                    new_postings[term].append((doc_num, tf))
+                node_json = json.dumps(node_to_metadata_dict(node, remove_text=False, flat_metadata=False))
+                rows.append((doc_num, node.node_id, node.ref_doc_id, len(tokens), node_json))
+            self._conn.executemany(
+                "INSERT INTO docs (doc_num, node_id, ref_doc_id, length, node_json) VALUES (?, ?, ?, ?, ?)", rows
+            )
+            self._conn.executemany(
+                "INSERT INTO terms VALUES (?, ?) ON CONFLICT(term) DO UPDATE SET df = df + excluded.df",
+                [(term, len(postings)) for term, postings in new_postings.items()],
+            )
+            self._append_segments(new_postings)
+            self._conn.commit()
+            self._invalidate()
+
+    def _append_segments(self, new_postings):
+        """
+        Thêm postings của một lần add thành một đoạn mới cho mỗi term, rồi gộp các đoạn nếu đến lượt.
+
+        Args:
+            new_postings (dict): term -> [(doc_num, tf), ...] với doc_num lớn hơn mọi doc_num đã có.
+        """
+        seq = self._conn.execute("SELECT COALESCE(MAX(seq), 0) + 1 FROM segments").fetchone()[0]
+        self._conn.executemany(
+            "INSERT INTO segments VALUES (?, ?, ?, ?)",
+            [(term, seq, postings[-1][0], encode_postings(postings)) for term, postings in new_postings.items()],
+        )
+        window = 1
+        while seq % (window * SEGMENT_FANOUT) == 0:
+            window *= SEGMENT_FANOUT
+        if window > 1:
+            self._merge_segments(seq - window)
+
+    def _merge_segments(self, after_seq):
+        """Gộp các đoạn có seq > after_seq thành một đoạn (giữ seq lớn nhất) cho mỗi term."""
+        rows = self._conn.execute(
+            "SELECT term, seq, last_doc, postings FROM segments WHERE seq > ? ORDER BY term, seq", (after_seq,)
+        ).fetchall()
+        merged = []
+        for term, group in itertools.groupby(rows, key=lambda row: row[0]):
+            group = list(group)
+            if len(group) < 2:
+                continue
+            # doc_num tăng dần theo seq: nối bytes của các đoạn theo thứ tự, chỉ mã hóa lại khoảng cách đầu của mỗi đoạn
+            parts = [group[0][3]]
+            for (_, _, prev_last, _), (_, _, _, blob) in zip(group, group[1:]):
+                parts.append(rebase_postings(blob, prev_last))
+            merged.append((term, group[-1][1], group[-1][2], b"".join(parts)))
+        self._conn.executemany(
+            "DELETE FROM segments WHERE term = ? AND seq > ?", [(term, after_seq) for term, _, _, _ in merged]
+        )
+        self._conn.executemany("INSERT INTO segments VALUES (?, ?, ?, ?)", merged)
+
+    def delete(self, ref_doc_id):
+        """Xóa toàn bộ chunk thuộc document ref_doc_id."""
+        with self._lock:
+            self._mark_deleted("ref_doc_id", [ref_doc_id])
+            self._conn.commit()
+            self._invalidate()
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM docs")
+            self._conn.execute("DELETE FROM terms")
+            self._conn.execute("DELETE FROM segments")
+            self._conn.commit()
+            self._invalidate()
+
+    def search(self, query, k=10, node_ids=None):
+        """
+        Tìm k chunk có điểm BM25 cao nhất.
+
+        Args:
+            query (str): Câu hỏi.
+            k (int): Số kết quả.
+            node_ids (list): Chỉ xét các chunk này (ví dụ đã lọc theo metadata), None = tất cả.
+        Returns:
+            list: [(doc_num, score), ...] theo điểm giảm dần.
+        """
+        terms = list(dict.fromkeys(tokenize(query)))
+        with self._lock:
+            # Đọc độ dài chunk và postings trong cùng một snapshot, để process khác ghi xen vào giữa
+            # không làm hai lần đọc lệch nhau
+            if not self._conn.in_transaction:
+                self._conn.execute("BEGIN")
+            try:
+                self._conn.execute("SELECT 1 FROM docs LIMIT 1").fetchall()  # Mở snapshot đọc
+                self._refresh()
+                if not terms or self._n_docs == 0:
+                    return []
+                placeholders = ",".join("?" * len(terms))
+                rows = self._conn.execute(
+                    "SELECT t.df, s.postings FROM segments s JOIN terms t ON t.term = s.term "
+                    f"WHERE s.term IN ({placeholders})",
+                    terms,
+                ).fetchall()
+            finally:
+                self._conn.commit()
+            lengths = self._lengths
+            scores = np.zeros(len(lengths), dtype=np.float32)
+            norm = self.k1 * (1 - self.b + self.b * lengths / (self._avgdl or 1.0))
+            for df, blob in rows:
+                if df <= 0:
+                    continue
+                idf = math.log(1 + (self._n_docs - df + 0.5) / (df + 0.5))
+                doc_nums, tfs = decode_postings(blob)
+                # Phòng khi độ dài vẫn cũ hơn postings: chunk chưa có độ dài thì bỏ qua ở lần tìm này
+                fresh = doc_nums < len(lengths)
+                doc_nums, tfs = doc_nums[fresh], tfs[fresh].astype(np.float32)
+                scores[doc_nums] += idf * tfs * (self.k1 + 1) / (tfs + norm[doc_nums])
+            scores[lengths == 0] = 0  # Chunk đã xóa
+            if node_ids is not None:
+                allowed = np.zeros(len(scores), dtype=bool)
+                doc_nums = self._doc_nums(node_ids)
+                allowed[doc_nums[doc_nums < len(allowed)]] = True
+                scores[~allowed] = 0
+        hits = np.flatnonzero(scores)
+        if len(hits) > k:
+            hits = hits[np.argpartition(-scores[hits], k - 1)[:k]]
+        hits = hits[np.argsort(-scores[hits])]
+        return [(int(d), float(scores[d])) for d in hits]
+
+    def _doc_nums(self, node_ids):
+        doc_nums = []
+        node_ids = list(node_ids)
+        for start in range(0, len(node_ids), 500):
+            batch = node_ids[start:start + 500]
+            placeholders = ",".join("?" * len(batch))
+            doc_nums += [d for (d,) in self._conn.execute(
+                f"SELECT doc_num FROM docs WHERE deleted = 0 AND node_id IN ({placeholders})", batch
+            )]
+        return np.array(doc_nums, dtype=np.int64)
+
+    def get_nodes(self, doc_nums):
+        found = {}
+        with self._lock:
+            for start in range(0, len(doc_nums), 500):
+                batch = list(doc_nums[start:start + 500])
+                placeholders = ",".join("?" * len(batch))
+                for doc_num, node_json in self._conn.execute(
+                    f"SELECT doc_num, node_json FROM docs WHERE doc_num IN ({placeholders})", batch
+                ):
+                    found[doc_num] = metadata_dict_to_node(json.loads(node_json))
+        return [found[d] for d in doc_nums]
+
+    def compact(self):
+        """Ghi lại postings, bỏ hẳn các chunk đã bị xóa (doc_num được giữ nguyên)."""
+        with self._lock:
+            alive = set(d for (d,) in self._conn.execute("SELECT doc_num FROM docs WHERE deleted = 0"))
+            postings = defaultdict(list)
+            for term, blob in self._conn.execute("SELECT term, postings FROM segments ORDER BY term, seq").fetchall():
+                doc_nums, tfs = decode_postings(blob)
+                postings[term].extend((int(d), int(t)) for d, t in zip(doc_nums, tfs) if int(d) in alive)
+            self._conn.execute("DELETE FROM segments")
+            self._conn.execute("DELETE FROM terms")
+            for term, kept in postings.items():
+                if kept:
+                    self._conn.execute("INSERT INTO terms VALUES (?, ?)", (term, len(kept)))
+                    self._conn.execute(
+                        "INSERT INTO segments VALUES (?, 0, ?, ?)", (term, kept[-1][0], encode_postings(kept))
+                    )
+            self._conn.execute("DELETE FROM docs WHERE deleted = 1")
+            self._conn.commit()
+            self._conn.execute("VACUUM")
+            self._invalidate()
+
+
+class BM25Retriever(BaseRetriever):
+    def __init__(self, index, similarity_top_k=5, node_ids=None):
+        """
+        Retriever từ khóa dùng BM25Index (bắt được arXiv ID, tên tác giả, thuật ngữ chính xác).
+
+        Args:
+            index (BM25Index): Chỉ mục BM25.
+            similarity_top_k (int): Số node trả về mỗi câu hỏi.
+            node_ids (list): Chỉ tìm trong các chunk này (ví dụ đã lọc theo metadata), None = tất cả.
+        """
+        super().__init__()
+        self.index = index
+        self.similarity_top_k = similarity_top_k
+        self.node_ids = node_ids
+
+    def _retrieve(self, query_bundle: QueryBundle) -> List[NodeWithScore]:
+        hits = self.index.search(query_bundle.query_str, self.similarity_top_k, node_ids=self.node_ids)
+        nodes = self.index.get_nodes([doc_num for doc_num, _ in hits])
+        return [NodeWithScore(node=node, score=score) for node, (_, score) in zip(nodes, hits)]
+
+    async def _aretrieve(self, query_bundle: QueryBundle) -> List[NodeWithScore]:
+        # Chấm điểm BM25 và đọc SQLite là việc blocking: chạy trong thread để không chặn event loop của Agent
+        return await asyncio.to_thread(self._retrieve, query_bundle)
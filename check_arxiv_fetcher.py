@@ -0,0 +1,209 @@
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from arxiv_fetcher import ArxivFetcher, PaperStore, normalize_topic
+
+# Kiểm tra ArxivFetcher với feed Atom giả lập (http.server, định dạng theo response thật của export.arxiv.org):
+#   - iter_pages trả về từng trang page_size bài, request theo start/max_results
+#   - cache theo chủ đề đã chuẩn hóa (khác hoa/thường, khoảng trắng) và theo arXiv ID: không gọi lại API
+#   - cache hết hạn sau ttl thì tìm lại
+#   - fetch_many tải song song tối đa max_workers chủ đề, các request vẫn cách nhau ít nhất delay_seconds
+# Chạy: python check_arxiv_fetcher.py
+
+FEED_HEADER = """<?xml version="1.0" encoding="UTF-8"?>
+<feed xmlns="http://www.w3.org/2005/Atom" xmlns:opensearch="http://a9.com/-/spec/opensearch/1.1/"
+      xmlns:arxiv="http://arxiv.org/schemas/atom">
+  <id>https://arxiv.org/api/recorded</id>
+  <title>arXiv Query: {query}</title>
+  <updated>2024-01-31T00:00:00Z</updated>
+  <link href="https://arxiv.org/api/query?{query}" type="application/atom+xml"/>
+  <opensearch:itemsPerPage>{per_page}</opensearch:itemsPerPage>
+  <opensearch:totalResults>{total}</opensearch:totalResults>
+  <opensearch:startIndex>{start}</opensearch:startIndex>
+"""
+
+FEED_ENTRY = """  <entry>
+    <id>http://arxiv.org/abs/{arxiv_id}</id>
+    <title>{title}</title>
+    <updated>2024-01-{day:02d}T18:59:59Z</updated>
+    <link href="https://arxiv.org/abs/{arxiv_id}" rel="alternate" type="text/html"/>
+    <link href="https://arxiv.org/pdf/{arxiv_id}" rel="related" type="application/pdf" title="pdf"/>
+    <summary>We study {topic}. Experiments on standard benchmarks show consistent gains.</summary>
+    <category term="cs.LG" scheme="http://arxiv.org/schemas/atom"/>
+    <category term="stat.ML" scheme="http://arxiv.org/schemas/atom"/>
+    <published>2024-01-{day:02d}T18:59:59Z</published>
+    <arxiv:comment>12 pages, 4 figures</arxiv:comment>
+    <arxiv:primary_category term="cs.LG"/>
+    <author>
+      <name>Nguyen Van A</name>
+    </author>
+    <author>
+      <name>Tran Thi B</name>
+    </author>
+  </entry>
+"""
+
+
+class FeedServer:
+    def __init__(self, topics, per_topic=30, delay=0.0):
+        """
+        Server HTTP chạy trong thread, trả feed Atom cho /api/query (search_query hoặc id_list).
+
+        Args:
+            topics (list): Các chủ đề có kết quả; mỗi chủ đề có per_topic bài, mới nhất trước.
+            per_topic (int): Số bài mỗi chủ đề.
+            delay (float): Thời gian chờ trước khi trả mỗi response (giây), để đo số request đồng thời.
+        """
+        self.entries = {}  # chủ đề đã chuẩn hóa -> [arXiv ID]
+        self.by_id = {}  # arXiv ID -> XML của entry
+        self.latest = {}  # arXiv ID không kèm version -> ID phiên bản mới nhất (như API thật)
+        for t, topic in enumerate(topics):
+            ids = [f"24{t + 1:02d}.{i:05d}v1" for i in range(per_topic)]
+            self.entries[normalize_topic(topic)] = ids
+            for i, arxiv_id in enumerate(ids):
+                self.latest[arxiv_id.rsplit("v", 1)[0]] = arxiv_id
+                self.by_id[arxiv_id] = FEED_ENTRY.format(
+                    arxiv_id=arxiv_id, title=f"{topic} paper {i}", topic=topic, day=28 - i % 28
+                )
+        self.delay = delay
+        self.requests = []  # (thời điểm, tham số query)
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                params = {k: v[0] for k, v in parse_qs(url.query).items()}
+                with server._lock:
+                    server.requests.append((time.monotonic(), params))
+                    server.in_flight += 1
+                    server.max_in_flight = max(server.max_in_flight, server.in_flight)
+                try:
+                    time.sleep(server.delay)
+                    if url.path != "/api/query":
+                        self.send_error(404)
+                        return
+                    body = server.feed(url.query, params).encode("utf-8")
+                    self.send_response(200)
+                    self.send_header("Content-Type", "application/atom+xml; charset=utf-8")
+                    self.send_header("Content-Length", str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+                finally:
+                    with server._lock:
+                        server.in_flight -= 1
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def feed(self, query, params):
+        if params.get("id_list"):
+            ids = [self.latest.get(i, i) for i in params["id_list"].split(",")]
+            ids = [i for i in ids if i in self.by_id]
+        else:
+            match = re.match(r'all:"(.*)"$', params.get("search_query", ""))
+            ids = self.entries.get(normalize_topic(match.group(1)) if match else "", [])
+        start = int(params.get("start", 0))
+        page = ids[start:start + int(params.get("max_results", 10))]
+        header = FEED_HEADER.format(query=query.replace("&", "&amp;"), per_page=len(page), total=len(ids), start=start)
+        return header + "".join(self.by_id[i] for i in page) + "</feed>\n"
+
+    def searches(self, since=0):
+        """Các request tìm theo chủ đề từ vị trí since: [(search_query, start)]."""
+        return [(p.get("search_query"), int(p.get("start", 0))) for _, p in self.requests[since:] if "search_query" in p]
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def main():
+    topics = ["graph neural networks", "retrieval augmented generation", "diffusion models",
+              "speech recognition", "protein folding", "federated learning"]
+    server = FeedServer(topics, delay=0.1)
+    checks = []
+
+    def check(name, ok, detail=""):
+        checks.append(ok)
+        print(f"[{'OK' if ok else 'FAIL'}] {name}" + (f" ({detail})" if detail else ""))
+
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            store = PaperStore(os.path.join(tmp, "arxiv.sqlite"))
+            base_url = server.url + "/api/query?{}"
+            fetcher = ArxivFetcher(store=store, delay_seconds=0.05, page_size=10, base_url=base_url)
+
+            # 1. iter_pages: 25 bài = 3 trang (10, 10, 5), mỗi trang một request theo start
+            pages = [len(page) for page in fetcher.iter_pages("graph neural networks", 25)]
+            starts = [start for _, start in server.searches()]
+            first = fetcher.fetch("graph neural networks", 25)
+            check("iter_pages chia trang theo page_size", pages == [10, 10, 5] and starts == [0, 10, 20],
+                  f"trang {pages}, start {starts}")
+
+            # 2. Cache theo chủ đề đã chuẩn hóa: không gọi API, cùng kết quả; ít bài hơn cũng lấy từ cache
+            before = len(server.requests)
+            again = fetcher.fetch("  Graph   NEURAL networks ", 25)
+            fewer = fetcher.fetch("graph neural networks", 7)
+            check("cache theo chu de da chuan hoa",
+                  len(server.requests) == before and again == first and fewer == first[:7],
+                  f"{len(server.requests) - before} request")
+
+            # 3. Cache theo arXiv ID: chỉ gọi API cho ID chưa có, tra được cả ID không kèm version
+            known = [p["arxiv_id"] for p in first[:3]]
+            before = len(server.requests)
+            papers = fetcher.get_by_ids(known)
+            cached = len(server.requests) == before and [p["arxiv_id"] for p in papers] == known
+            missing = server.entries["graph neural networks"][27]
+            papers = fetcher.get_by_ids(known + [missing.rsplit("v", 1)[0]])
+            id_lists = [p.get("id_list") for _, p in server.requests[before:]]
+            check("cache theo arXiv ID",
+                  cached and id_lists == [missing.rsplit("v", 1)[0]] and papers[-1]["arxiv_id"] == missing,
+                  f"id_list {id_lists}")
+
+            # 4. Cache hết hạn sau ttl: trước ttl dùng cache, sau ttl tìm lại chủ đề đó
+            short = ArxivFetcher(store=store, ttl=0.5, delay_seconds=0.05, page_size=10, base_url=base_url)
+            before = len(server.requests)
+            short.fetch("retrieval augmented generation", 5)
+            short.fetch("retrieval augmented generation", 5)
+            fresh = len(server.searches(before))
+            time.sleep(0.6)
+            short.fetch("retrieval augmented generation", 5)
+            check("cache het han sau ttl", fresh == 1 and len(server.searches(before)) == 2,
+                  f"{fresh} request truoc ttl, {len(server.searches(before)) - fresh} request sau ttl")
+
+            # 5. fetch_many: tối đa max_workers chủ đề cùng lúc, request cách nhau ít nhất delay_seconds,
+            #    chủ đề trùng chỉ tải một lần, chủ đề đã có trong cache (2 chủ đề đầu) không gọi API
+            many = ArxivFetcher(store=store, delay_seconds=0.05, page_size=50, base_url=base_url)
+            server.max_in_flight = 0
+            before = len(server.requests)
+            start = time.perf_counter()
+            results = many.fetch_many(topics[1:] + ["diffusion models", "graph neural networks"], 5, max_workers=3)
+            elapsed = time.perf_counter() - start
+            times = [t for t, _ in server.requests[before:]]
+            gaps = [b - a for a, b in zip(times, times[1:])]
+            searched = sorted(q for q, _ in server.searches(before))
+            check("fetch_many toi da 3 chu de cung luc",
+                  server.max_in_flight == 3 and searched == sorted(f'all:"{t}"' for t in topics[2:])
+                  and all(len(papers) == 5 for papers in results.values()),
+                  f"toi da {server.max_in_flight}, {len(times)} request trong {elapsed:.2f}s")
+            check("fetch_many giu khoang cach giua cac request", min(gaps) >= 0.04,
+                  f"khoang cach nho nhat {min(gaps) * 1000:.0f}ms")
+    finally:
+        server.close()
+    sys.exit(0 if all(checks) else 1)
+
+
+if __name__ == "__main__":
+    main()
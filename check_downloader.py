@@ -0,0 +1,193 @@
+import hashlib
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from downloader import DownloadManager
+
+# Kiểm tra DownloadManager với một server HTTP local (http.server, hỗ trợ Range):
+#   - tải tiếp phần dở dang (206), phần dở dang không còn hợp lệ (416) thì tải lại từ đầu
+#   - phần dở dang của URL khác trùng tên file không bị nối tiếp
+#   - download_many không chạy quá max_workers request cùng lúc
+#   - trùng URL / trùng nội dung: không tải lại, không tạo file thứ hai
+#   - trùng tên file nhưng khác URL: không trả về file của URL khác
+# Chạy: python check_downloader.py
+
+
+class FileServer:
+    def __init__(self, files, delay=0.0):
+        """
+        Server HTTP chạy trong thread, phục vụ files (đường dẫn -> bytes).
+
+        Args:
+            files (dict): Nội dung theo đường dẫn URL (ví dụ "/a.pdf").
+            delay (float): Thời gian chờ trước khi trả mỗi response (giây), để đo số request đồng thời.
+        """
+        self.files = files
+        self.delay = delay
+        self.requests = []  # (đường dẫn, header Range)
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                with server._lock:
+                    server.requests.append((self.path, self.headers.get("Range")))
+                    server.in_flight += 1
+                    server.max_in_flight = max(server.max_in_flight, server.in_flight)
+                try:
+                    time.sleep(server.delay)
+                    self.respond(server.files.get(self.path))
+                finally:
+                    with server._lock:
+                        server.in_flight -= 1
+
+            def respond(self, body):
+                if body is None:
+                    self.send_error(404)
+                    return
+                match = re.match(r"bytes=(\d+)-$", self.headers.get("Range") or "")
+                if match:
+                    start = int(match.group(1))
+                    if start >= len(body):
+                        self.send_response(416)
+                        self.send_header("Content-Range", f"bytes */{len(body)}")
+                        self.send_header("Content-Length", "0")
+                        self.end_headers()
+                        return
+                    self.send_response(206)
+                    self.send_header("Content-Range", f"bytes {start}-{len(body) - 1}/{len(body)}")
+                    body = body[start:]
+                else:
+                    self.send_response(200)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def count(self, path):
+        return sum(1 for p, _ in self.requests if p == path)
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def payload(seed, size=200_000):
+    block = hashlib.sha256(seed.encode("utf-8")).digest()
+    return (block * (size // len(block) + 1))[:size]
+
+
+def read(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def main():
+    files = {f"/p{i}.pdf": payload(f"paper-{i}") for i in range(10)}
+    files["/dup-a.pdf"] = files["/dup-b.pdf"] = payload("same content")
+    files["/v2/p2.pdf"] = payload("paper-2 v2")
+    server = FileServer(files, delay=0.05)
+    checks = []
+
+    def check(name, ok, detail=""):
+        checks.append(ok)
+        print(f"[{'OK' if ok else 'FAIL'}] {name}" + (f" ({detail})" if detail else ""))
+
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            manager = DownloadManager(tmp)
+            body = files["/p0.pdf"]
+
+            # 1. Tải tiếp phần dở dang bằng Range (206)
+            url = server.url + "/p0.pdf"
+            with open(os.path.join(tmp, DownloadManager.part_name(url)), "wb") as f:
+                f.write(body[:80_000])
+            result = manager.download(url, "resume.pdf")
+            check("tai tiep (206)", result["status"] == "resumed" and result["bytes"] == len(body) - 80_000
+                  and read(result["path"]) == body, f"{result['status']}, {result['bytes']} byte")
+
+            # 2. Phần dở dang dài hơn file trên server (416): bỏ đi và tải lại từ đầu
+            url = server.url + "/p1.pdf"
+            with open(os.path.join(tmp, DownloadManager.part_name(url)), "wb") as f:
+                f.write(files["/p1.pdf"] + b"stale")
+            result = manager.download(url, "range416.pdf")
+            ranges = [r for p, r in server.requests if p == "/p1.pdf"]
+            check("416 -> tai lai tu dau", result["status"] == "downloaded" and read(result["path"]) == files["/p1.pdf"]
+                  and ranges[0] is not None and ranges[-1] is None, f"Range: {ranges}")
+
+            # 3. Phần dở dang của URL khác (cùng tên file) không được dùng
+            with open(os.path.join(tmp, DownloadManager.part_name(server.url + "/old.pdf")), "wb") as f:
+                f.write(b"%PDF-garbage from another url")
+            result = manager.download(server.url + "/p2.pdf", "p2.pdf")
+            check("khong noi tiep phan do dang cua URL khac",
+                  read(result["path"]) == files["/p2.pdf"] and server.requests[-1][1] is None)
+
+            # 4. download_many giới hạn số request cùng lúc
+            server.max_in_flight = 0
+            items = [(server.url + f"/p{i}.pdf", f"many-{i}.pdf") for i in range(3, 10)]
+            start = time.perf_counter()
+            results = manager.download_many(items, max_workers=3)
+            elapsed = time.perf_counter() - start
+            check("download_many toi da 3 request cung luc",
+                  server.max_in_flight == 3 and all(r["status"] == "downloaded" for r in results),
+                  f"toi da {server.max_in_flight}, {len(items)} file trong {elapsed:.2f}s")
+
+            # 5. Trùng nội dung (URL khác) và trùng URL: trả về file đã có, không tạo file mới
+            first = manager.download(server.url + "/dup-a.pdf", "dup-a.pdf")
+            second = manager.download(server.url + "/dup-b.pdf", "dup-b.pdf")
+            check("trung noi dung -> dung lai file cu",
+                  second["status"] == "deduplicated" and second["path"] == first["path"]
+                  and not os.path.exists(os.path.join(tmp, "dup-b.pdf")))
+            before = server.count("/dup-a.pdf")
+            results = manager.download_many([(server.url + "/dup-a.pdf", "dup-c.pdf"),
+                                             (server.url + "/dup-a.pdf", "dup-d.pdf")])
+            check("trung URL -> khong tai lai",
+                  server.count("/dup-a.pdf") == before and all(r["path"] == first["path"] for r in results)
+                  and not any(os.path.exists(os.path.join(tmp, n)) for n in ("dup-c.pdf", "dup-d.pdf")),
+                  ", ".join(r["status"] for r in results))
+
+            # 6. Trùng tên file nhưng khác URL: tải vào tên khác; tải lại đúng URL đó thì "exists"
+            result = manager.download(server.url + "/v2/p2.pdf", "p2.pdf")
+            check("trung ten file, khac URL -> khong tra ve file cu",
+                  result["status"] == "downloaded" and read(result["path"]) == files["/v2/p2.pdf"]
+                  and read(os.path.join(tmp, "p2.pdf")) == files["/p2.pdf"], os.path.basename(result["path"]))
+            before = len(server.requests)
+            again = manager.download(server.url + "/p2.pdf", "p2.pdf")
+            check("cung URL, cung ten file -> exists",
+                  again["status"] == "exists" and len(server.requests) == before, again["status"])
+
+            # 7. File có sẵn chưa có trong index, cùng nội dung với URL: dùng lại, không tạo bản thứ hai
+            manual_dir = os.path.join(tmp, "manual")
+            os.makedirs(manual_dir)
+            with open(os.path.join(manual_dir, "p4.pdf"), "wb") as f:
+                f.write(files["/p4.pdf"])
+            result = DownloadManager(manual_dir).download(server.url + "/p4.pdf", "p4.pdf")
+            names = sorted(os.listdir(manual_dir))
+            check("file co san chua co trong index, cung noi dung -> dung lai",
+                  result["status"] == "deduplicated" and names == [".download_index.json", "p4.pdf"],
+                  f"{result['status']}, {names}")
+
+            leftovers = [n for n in os.listdir(tmp) if n.endswith(".part")]
+            check("chi con file .part cua URL chua tai",
+                  leftovers == [DownloadManager.part_name(server.url + "/old.pdf")],
+                  f"{leftovers}")
+    finally:
+        server.close()
+    sys.exit(0 if all(checks) else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+import sys
+import time
+
+import numpy as np
+
+from numpy_retriever import NumpyVectorRetriever, recall_at_k
+
+# Kiểm tra độ chính xác (recall@k) của NumpyVectorRetriever khi lưu vector ở float16/int8
+# so với kết quả chính xác float32. Chạy: python check_recall.py [so_vector] [so_chieu]
+
+
+def make_corpus(n, dim, n_clusters=100, seed=0):
+    """Tạo tập embedding giả lập có cấu trúc cụm (giống embedding văn bản thật hơn là nhiễu thuần)."""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(n_clusters, dim))
+    vectors = centers[rng.integers(0, n_clusters, n)] + 0.5 * rng.normal(size=(n, dim))
+    queries = vectors[rng.choice(n, 200, replace=False)] + 0.2 * rng.normal(size=(200, dim))
+    return vectors.astype(np.float32), queries.astype(np.float32)
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    dim = int(sys.argv[2]) if len(sys.argv) > 2 else 768
+    vectors, queries = make_corpus(n, dim)
+    node_ids = [str(i) for i in range(n)]
+    exact = NumpyVectorRetriever(None, node_ids, vectors, None, dtype="float32")
+
+    print(f"Corpus: {n} vector x {dim} chieu, {len(queries)} cau hoi")
+    failed = False
+    for dtype, min_recall in (("float32", 1.0), ("float16", 0.99), ("int8", 0.95)):
+        retriever = NumpyVectorRetriever(None, node_ids, vectors, None, dtype=dtype)
+        start = time.perf_counter()
+        retriever.search(queries, 10)
+        elapsed = (time.perf_counter() - start) / len(queries) * 1000
+        recall = recall_at_k(retriever, exact, queries, k=10)
+        status = "OK" if recall >= min_recall else "FAIL"
+        failed = failed or status == "FAIL"
+        print(f"- {dtype:8s} {retriever.matrix.nbytes / 2**20:8.1f} MB | recall@10 = {recall:.4f} "
+              f"(>= {min_recall}) | {elapsed:.2f} ms/cau hoi (lo {len(queries)}) | {status}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,24 +1,74 @@
 from dotenv import load_dotenv
+import functools
 import os
-from llama_index.llms.gemini import Gemini
-from llama_index.embeddings.gemini import GeminiEmbedding
 
 # Load biến môi trường
 load_dotenv()
 
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
+EMBED_MODEL_NAME = "models/text-embedding-004"
+LLM_MODEL_NAME = "models/gemini-2.5-flash"
+PINECONE_INDEX_NAME = "arxiv-research"
 
-# 1. Cấu hình Embed Model (Dùng để chuyển văn bản thành Vector)
-# Updated: Dùng text-embedding-004 để đảm bảo output là 768 dimensions
-embed_model = GeminiEmbedding(
-    api_key=GOOGLE_API_KEY, 
-    model_name="models/text-embedding-004"
-)
-
-# 2. Cấu hình LLM (Model ngôn ngữ chính)
-llm_model = Gemini(
-    api_key=GOOGLE_API_KEY, 
-    model_name="models/gemini-2.5-flash",
-    max_tokens=8192, # Tăng giới hạn token đầu ra để tránh lỗi MAX_TOKENS khi tóm tắt văn bản dài
-    # transport="rest" # Tạm thời tắt REST để fix lỗi await, quay về gRPC + nest_asyncio
-)
\ No newline at end of file
+# Các client (Gemini, Pinecone) chỉ được tạo khi dùng lần đầu rồi dùng lại: import constants không còn
+# nạp SDK hay gọi mạng (Gemini(...) hỏi thông tin model ngay khi khởi tạo). Vẫn dùng được
+# `from constants import embed_model, llm_model` như trước (xem __getattr__ cuối file).
+
+
+@functools.lru_cache(maxsize=None)
+def get_embed_model():
+    """
+    Embed Model (chuyển văn bản thành vector), tạo một lần.
+    Dùng text-embedding-004 để đảm bảo output là 768 dimensions, bọc bằng CachedEmbedding để không phải
+    gọi lại API cho văn bản/câu hỏi đã embed (cache tại .cache/embeddings.sqlite).
+    """
+    from llama_index.embeddings.gemini import GeminiEmbedding
+    from embedding_cache import CachedEmbedding
+
+    return CachedEmbedding(GeminiEmbedding(api_key=GOOGLE_API_KEY, model_name=EMBED_MODEL_NAME))
+
+
+@functools.lru_cache(maxsize=None)
+def get_llm():
+    """LLM chính (Gemini), tạo một lần."""
+    from llama_index.llms.gemini import Gemini
+
+    return Gemini(
+        api_key=GOOGLE_API_KEY,
+        model_name=LLM_MODEL_NAME,
+        max_tokens=8192, # Tăng giới hạn token đầu ra để tránh lỗi MAX_TOKENS khi tóm tắt văn bản dài
+        # transport="rest" # Tạm thời tắt REST để fix lỗi await, quay về gRPC + nest_asyncio
+    )
+
+
+def get_index_manager(backend=None):
+    """
+    Index manager (kết nối vector store), tạo một lần cho mỗi backend.
+
+    Args:
+        backend (str): "pinecone" hoặc "local" (None = theo biến môi trường INDEX_BACKEND, mặc định pinecone).
+            Chỉ module của backend được chọn mới được import (index local không cần nạp SDK Pinecone).
+    """
+    # Xác định backend trước khi tra cache: get_index_manager() và get_index_manager("local") (khi
+    # INDEX_BACKEND=local) dùng chung một index manager, không mở hai kết nối tới cùng một index
+    return _index_manager(backend or os.getenv("INDEX_BACKEND", "pinecone"))
+
+
+@functools.lru_cache(maxsize=None)
+def _index_manager(backend):
+    if backend == "local":
+        from index_manager_local import IndexManagerLocal
+
+        return IndexManagerLocal(get_embed_model())
+    from index_manager_pinecone import IndexManagerPinecone
+
+    return IndexManagerPinecone(get_embed_model(), PINECONE_INDEX_NAME)
+
+
+def __getattr__(name):
+    # Tương thích với code/notebook cũ: constants.embed_model, constants.llm_model (tạo khi truy cập lần đầu)
+    if name == "embed_model":
+        return get_embed_model()
+    if name == "llm_model":
+        return get_llm()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
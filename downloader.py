@@ -0,0 +1,206 @@
+import hashlib
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+INDEX_FILE_NAME = ".download_index.json"
+
+
+class DownloadManager:
+    def __init__(self, output_dir="papers", pool_size=8, timeout=(10, 60), chunk_size=1 << 16, max_retries=3):
+        """
+        Trình tải file (PDF) dùng chung một HTTP session có connection pool.
+
+        - Ghi dữ liệu xuống ổ cứng theo từng khối (không giữ cả file trong RAM),
+          vào file tạm rồi rename khi tải xong (không bao giờ để lại file PDF hỏng).
+        - Tải tiếp phần còn thiếu bằng HTTP Range nếu lần trước bị ngắt (file tạm đặt tên theo hash URL,
+          nên không bao giờ nối tiếp phần tải dở của một URL khác trùng tên file).
+        - Khử trùng lặp theo hash nội dung: cùng URL hoặc cùng nội dung thì không tải/lưu lại lần nữa
+          mà trả về file đã có (không tạo bản thứ hai trong output_dir: hai file cùng nội dung sẽ có cùng
+          doc_id khi nạp, xóa file này sẽ xóa luôn vector của file kia).
+
+        Args:
+            output_dir (str): Thư mục lưu file.
+            pool_size (int): Số kết nối tối đa giữ trong pool.
+            timeout (tuple): (timeout kết nối, timeout đọc) tính bằng giây.
+            chunk_size (int): Kích thước mỗi khối khi ghi file.
+            max_retries (int): Số lần thử lại khi lỗi kết nối hoặc lỗi 429/5xx.
+        """
+        self.output_dir = output_dir
+        self.timeout = timeout
+        self.chunk_size = chunk_size
+        self.session = requests.Session()
+        retry = Retry(
+            total=max_retries,
+            backoff_factor=0.5,
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=("GET", "HEAD"),
+        )
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._lock = threading.Lock()
+        self._key_locks = {}  # file đích / URL -> khóa (mỗi file chỉ một thread tải và rename)
+        self._index_path = os.path.join(output_dir, INDEX_FILE_NAME)
+        self._index = self._load_index()  # {"urls": {url: sha256}, "hashes": {sha256: tên file}}
+
+    def _load_index(self):
+        try:
+            with open(self._index_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {"urls": {}, "hashes": {}}
+
+    def _save_index(self):
+        os.makedirs(self.output_dir, exist_ok=True)
+        tmp_path = self._index_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self._index, f, ensure_ascii=False, indent=1)
+        os.replace(tmp_path, self._index_path)
+
+    def _existing_copy(self, sha):
+        """Đường dẫn file đã có với cùng hash nội dung (nếu file đó vẫn còn)."""
+        name = self._index["hashes"].get(sha)
+        if name and os.path.exists(os.path.join(self.output_dir, name)):
+            return os.path.join(self.output_dir, name)
+        return None
+
+    def download(self, url, file_name):
+        """
+        Tải một file.
+
+        Returns:
+            dict: {"path": đường dẫn file, "status": "downloaded" / "resumed" / "exists" / "deduplicated",
+                   "bytes": số byte đã tải qua mạng}. "exists" chỉ khi file_name đã được tải từ chính URL này.
+                   Với "deduplicated", path là file đã có sẵn (cùng URL hoặc cùng nội dung), có thể khác
+                   file_name. Nếu file_name đã là file của URL khác, file được lưu vào conflict_name(url, file_name).
+        """
+        os.makedirs(self.output_dir, exist_ok=True)
+        path = os.path.join(self.output_dir, file_name)
+        # Khóa theo file đích rồi theo URL (luôn theo thứ tự này): hai mục cùng tên hoặc cùng URL chạy lần lượt
+        with self._key_lock(("path", os.path.normpath(path))), self._key_lock(("url", url)):
+            return self._download(url, file_name, path)
+
+    def _key_lock(self, key):
+        with self._lock:
+            return self._key_locks.setdefault(key, threading.Lock())
+
+    @staticmethod
+    def part_name(url):
+        """Tên file tạm theo hash của URL: phần đã tải chỉ được tải tiếp từ đúng URL đó."""
+        return f".{hashlib.sha256(url.encode('utf-8')).hexdigest()[:24]}.part"
+
+    @staticmethod
+    def conflict_name(url, file_name):
+        """Tên file thay thế (thêm hash của URL) khi file_name đã là file của URL khác."""
+        stem, ext = os.path.splitext(file_name)
+        return f"{stem}-{hashlib.sha256(url.encode('utf-8')).hexdigest()[:8]}{ext}"
+
+    def _file_hash(self, path):
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+        return digest.hexdigest()
+
+    def _download(self, url, file_name, path):
+        # URL đã từng tải (có thể dưới tên khác): dùng lại file cũ thay vì tải lại
+        with self._lock:
+            known = self._existing_copy(self._index["urls"].get(url))
+        if known:
+            status = "exists" if os.path.normpath(known) == os.path.normpath(path) else "deduplicated"
+            return {"path": known, "status": status, "bytes": 0}
+
+        if os.path.exists(path) and os.path.getsize(path) > 0:
+            # Tên file đã bị chiếm bởi file của URL khác (hoặc file chưa có trong index): không trả về file đó,
+            # tải vào tên có hash của URL. File chưa có trong index được ghi hash để vẫn khử trùng lặp được.
+            with self._lock:
+                indexed = file_name in self._index["hashes"].values()
+            if not indexed:
+                sha = self._file_hash(path)
+                with self._lock:
+                    self._index["hashes"].setdefault(sha, file_name)
+            file_name = self.conflict_name(url, file_name)
+            path = os.path.join(self.output_dir, file_name)
+
+        # File tạm ẩn (bắt đầu bằng ".") để không bị đọc nhầm khi nạp thư mục papers/
+        part_path = os.path.join(self.output_dir, self.part_name(url))
+        offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+        headers = {"Range": f"bytes={offset}-"} if offset else {}
+        with self.session.get(url, headers=headers, stream=True, timeout=self.timeout) as response:
+            if response.status_code == 416:  # Phần đã tải không còn hợp lệ với file trên server
+                os.remove(part_path)
+                return self._download(url, file_name, path)
+            response.raise_for_status()
+            resumed = offset > 0 and response.status_code == 206
+            if not resumed:
+                offset = 0
+            digest = hashlib.sha256()
+            if resumed:
+                with open(part_path, "rb") as f:
+                    for block in iter(lambda: f.read(1 << 20), b""):
+                        digest.update(block)
+            received = 0
+            with open(part_path, "ab" if resumed else "wb") as f:
+                for block in response.iter_content(chunk_size=self.chunk_size):
+                    f.write(block)
+                    digest.update(block)
+                    received += len(block)
+                f.flush()
+                os.fsync(f.fileno())
+            expected = response.headers.get("Content-Length")
+            if expected is not None and "Content-Encoding" not in response.headers and received != int(expected):
+                raise requests.exceptions.ContentDecodingError(
+                    f"Tai thieu du lieu: nhan {received}/{expected} byte (se tai tiep o lan sau)"
+                )
+
+        sha = digest.hexdigest()
+        with self._lock:
+            duplicate = self._existing_copy(sha)
+            if duplicate:
+                # Cùng nội dung với file đã có: bỏ bản vừa tải, dùng lại bản cũ
+                os.remove(part_path)
+                path = duplicate
+                status = "deduplicated"
+            else:
+                os.replace(part_path, path)
+                self._index["hashes"][sha] = file_name
+                status = "resumed" if resumed else "downloaded"
+            self._index["urls"][url] = sha
+            self._save_index()
+        return {"path": path, "status": status, "bytes": received}
+
+    def download_many(self, items, max_workers=4):
+        """
+        Tải nhiều file song song (tối đa max_workers file cùng lúc).
+
+        Args:
+            items (list): Danh sách (url, file_name).
+        Returns:
+            list: Kết quả theo đúng thứ tự items; file lỗi có "status": "error" và "error".
+        """
+        def run(item):
+            url, file_name = item
+            try:
+                return self.download(url, file_name)
+            except requests.exceptions.RequestException as e:
+                return {"path": os.path.join(self.output_dir, file_name), "status": "error", "error": str(e), "bytes": 0}
+
+        items = list(items)
+        # Mỗi URL chỉ tải một lần; các mục trùng URL được xử lý sau đó (dùng lại file đã tải)
+        first = {}
+        for i, (url, _) in enumerate(items):
+            first.setdefault(url, i)
+        results = [None] * len(items)
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            for i, result in zip(first.values(), pool.map(run, [items[i] for i in first.values()])):
+                results[i] = result
+        for i, item in enumerate(items):
+            if results[i] is None:
+                results[i] = run(item)
+        return results
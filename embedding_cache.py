@@ -0,0 +1,230 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from array import array
+from typing import Any, List
+
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.bridge.pydantic import PrivateAttr
+
+from instrumentation import tracer
+from singleflight import SingleFlight
+
+DEFAULT_CACHE_PATH = os.path.join(".cache", "embeddings.sqlite")
+
+
+class EmbeddingStore:
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_entries=50000):
+        """
+        Kho lưu embedding trên ổ cứng (SQLite), vector được lưu dạng float32 nhị phân.
+
+        Khi số bản ghi vượt quá max_entries, các bản ghi lâu không dùng nhất (LRU) sẽ bị xóa.
+
+        Args:
+            path (str): Đường dẫn file SQLite (":memory:" để chỉ lưu trong RAM).
+            max_entries (int): Số embedding tối đa được giữ lại.
+        """
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " key TEXT PRIMARY KEY, vector BLOB NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_last_used ON embeddings(last_used)")
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(model_name, kind, text):
+        """Khóa cache = hash(tên model + loại embedding (query/text) + nội dung)."""
+        return hashlib.sha256(f"{model_name}\x00{kind}\x00{text}".encode("utf-8")).hexdigest()
+
+    def get_many(self, keys):
+        """
+        Lấy nhiều embedding cùng lúc.
+
+        Returns:
+            dict: key -> embedding (list float) cho các key có trong cache.
+        """
+        found = {}
+        if not keys:
+            return found
+        with self._lock:
+            unique_keys = list(dict.fromkeys(keys))
+            for start in range(0, len(unique_keys), 500):  # SQLite giới hạn số tham số mỗi câu lệnh
+                batch = unique_keys[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = array("f", blob).tolist()
+            if found:
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE key = ?",
+                    [(now, key) for key in found],
+                )
+                self._conn.commit()
+            self.hits += sum(1 for key in keys if key in found)
+            self.misses += sum(1 for key in keys if key not in found)
+        return found
+
+    def put_many(self, items):
+        """Lưu nhiều cặp (key, embedding) và dọn bớt cache nếu vượt giới hạn."""
+        if not items:
+            return
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector, last_used) VALUES (?, ?, ?)",
+                [(key, array("f", vector).tobytes(), now) for key, vector in items],
+            )
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        count = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        overflow = count - self.max_entries
+        if overflow > 0:
+            # Xóa dư ra 10% để không phải dọn lại sau mỗi lần ghi
+            overflow += self.max_entries // 10
+            self._conn.execute(
+                "DELETE FROM embeddings WHERE key IN ("
+                " SELECT key FROM embeddings ORDER BY last_used ASC LIMIT ?)",
+                (overflow,),
+            )
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def stats(self):
+        """Thống kê hiệu quả cache: số lần hit/miss, tỉ lệ hit và số bản ghi."""
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "entries": len(self),
+        }
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM embeddings")
+            self._conn.commit()
+
+
+class CachedEmbedding(BaseEmbedding):
+    """
+    Bọc một embed model (ví dụ GeminiEmbedding) bằng cache lưu trên ổ cứng.
+    Văn bản/câu hỏi đã embed trước đó sẽ được trả về ngay mà không gọi API; các câu hỏi giống nhau
+    đang chờ embed cùng lúc (nhiều phiên) chỉ gọi API một lần.
+    """
+
+    _inner: BaseEmbedding = PrivateAttr()
+    _store: EmbeddingStore = PrivateAttr()
+    _flight: SingleFlight = PrivateAttr()
+
+    def __init__(self, inner: BaseEmbedding, store: EmbeddingStore = None, **kwargs: Any):
+        super().__init__(
+            model_name=inner.model_name,
+            embed_batch_size=inner.embed_batch_size,
+            **kwargs,
+        )
+        self._inner = inner
+        self._store = store if store is not None else EmbeddingStore()
+        self._flight = SingleFlight("query_embedding")
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "CachedEmbedding"
+
+    @property
+    def inner(self) -> BaseEmbedding:
+        return self._inner
+
+    @property
+    def store(self) -> EmbeddingStore:
+        return self._store
+
+    def stats(self):
+        return self._store.stats()
+
+    def _key(self, kind, text):
+        return EmbeddingStore.make_key(self.model_name, kind, text)
+
+    def _lookup(self, kind, texts):
+        """Trả về (danh sách embedding có thể chứa None, danh sách vị trí bị miss)."""
+        keys = [self._key(kind, text) for text in texts]
+        found = self._store.get_many(keys)
+        embeddings = [found.get(key) for key in keys]
+        missing = [i for i, emb in enumerate(embeddings) if emb is None]
+        tracer.incr("embedding_cache_lookups_total", len(keys) - len(missing), kind=kind, result="hit")
+        tracer.incr("embedding_cache_lookups_total", len(missing), kind=kind, result="miss")
+        return keys, embeddings, missing
+
+    def _fill(self, keys, embeddings, missing, new_embeddings):
+        for i, emb in zip(missing, new_embeddings):
+            embeddings[i] = emb
+        self._store.put_many([(keys[i], embeddings[i]) for i in missing])
+        return embeddings
+
+    def _get_query_embedding(self, query: str) -> List[float]:
+        keys, embeddings, missing = self._lookup("query", [query])
+        if missing:
+            def embed():
+                return self._fill(keys, embeddings, missing, [self._inner.get_query_embedding(query)])[0]
+
+            return self._flight.call(keys[0], embed)
+        return embeddings[0]
+
+    async def _aget_query_embedding(self, query: str) -> List[float]:
+        keys, embeddings, missing = self._lookup("query", [query])
+        if missing:
+            async def embed():
+                return self._fill(keys, embeddings, missing, [await self._inner.aget_query_embedding(query)])[0]
+
+            return await self._flight.do(keys[0], embed)
+        return embeddings[0]
+
+    def get_query_embedding_batch(self, queries: List[str]) -> List[List[float]]:
+        """
+        Embed nhiều câu hỏi bằng lời gọi batch của model bên trong (câu đã có trong cache hoặc trùng nhau
+        chỉ embed một lần). Gemini embed câu hỏi và văn bản như nhau (cùng task_type) nên dùng batch văn bản;
+        kết quả được lưu theo khóa câu hỏi, get_query_embedding sau đó sẽ hit cache.
+        """
+        keys, embeddings, missing = self._lookup("query", queries)
+        if missing:
+            unique = list(dict.fromkeys(queries[i] for i in missing))
+            vectors = dict(zip(unique, self._inner.get_text_embedding_batch(unique)))
+            self._fill(keys, embeddings, missing, [vectors[queries[i]] for i in missing])
+        return embeddings
+
+    def _get_text_embedding(self, text: str) -> List[float]:
+        return self._get_text_embeddings([text])[0]
+
+    async def _aget_text_embedding(self, text: str) -> List[float]:
+        return (await self._aget_text_embeddings([text]))[0]
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        keys, embeddings, missing = self._lookup("text", texts)
+        if missing:
+            new_embeddings = self._inner.get_text_embedding_batch([texts[i] for i in missing])
+            self._fill(keys, embeddings, missing, new_embeddings)
+        return embeddings
+
+    async def _aget_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        keys, embeddings, missing = self._lookup("text", texts)
+        if missing:
+            new_embeddings = await self._inner.aget_text_embedding_batch([texts[i] for i in missing])
+            self._fill(keys, embeddings, missing, new_embeddings)
+        return embeddings
@@ -0,0 +1,259 @@
+"""
+Các thành phần giả lập (fake) chạy hoàn toàn local, không cần API key hay mạng.
+Dùng để thử nghiệm và đo hiệu năng pipeline nạp dữ liệu / truy vấn.
+"""
+import asyncio
+import hashlib
+import json
+import math
+import re
+import threading
+import time
+from typing import Any, List
+
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.base.llms.generic_utils import (
+    astream_completion_response_to_chat_response,
+    completion_response_to_chat_response,
+)
+from llama_index.core.base.llms.types import CompletionResponse, LLMMetadata
+from llama_index.core.bridge.pydantic import PrivateAttr
+from llama_index.core.llms import CustomLLM
+from llama_index.core.llms.callbacks import llm_chat_callback, llm_completion_callback
+from llama_index.core.vector_stores import SimpleVectorStore
+
+_TOKEN_RE = re.compile(r"\w+")
+
+
+class FakeRateLimitError(Exception):
+    """Lỗi giả lập khi vượt quota (giống lỗi 429 RESOURCE_EXHAUSTED của Gemini)."""
+
+
+class FakeEmbedding(BaseEmbedding):
+    """
+    Embedding giả lập có tính tất định (cùng văn bản -> cùng vector).
+
+    Dùng kỹ thuật feature hashing trên các từ, nên hai văn bản có nhiều từ chung
+    sẽ có vector gần nhau - đủ để đo recall của các bộ truy vấn mà không cần gọi API.
+    """
+
+    dim: int = 768
+    latency: float = 0.0  # Độ trễ giả lập mỗi lần gọi (giây)
+    fail_every: int = 0   # Cứ mỗi n lần gọi thì ném FakeRateLimitError một lần (0 = không lỗi)
+
+    _calls: int = PrivateAttr(default=0)
+    _lock: Any = PrivateAttr(default_factory=threading.Lock)
+
+    def __init__(self, **kwargs: Any):
+        kwargs.setdefault("model_name", "fake-embedding")
+        super().__init__(**kwargs)
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "FakeEmbedding"
+
+    @property
+    def calls(self) -> int:
+        return self._calls
+
+    def embed(self, text: str) -> List[float]:
+        vector = [0.0] * self.dim
+        for token in _TOKEN_RE.findall(text.lower()):
+            digest = hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest()
+            value = int.from_bytes(digest, "little")
+            vector[value % self.dim] += 1.0 if (value >> 32) & 1 else -1.0
+        norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+        return [v / norm for v in vector]
+
+    def _tick(self):
+        with self._lock:
+            self._calls += 1
+            calls = self._calls
+        if self.fail_every and calls % self.fail_every == 0:
+            raise FakeRateLimitError("429 RESOURCE_EXHAUSTED: fake quota exceeded")
+
+    def _get_query_embedding(self, query: str) -> List[float]:
+        return self._get_text_embeddings([query])[0]
+
+    async def _aget_query_embedding(self, query: str) -> List[float]:
+        return (await self._aget_text_embeddings([query]))[0]
+
+    def _get_text_embedding(self, text: str) -> List[float]:
+        return self._get_text_embeddings([text])[0]
+
+    async def _aget_text_embedding(self, text: str) -> List[float]:
+        return (await self._aget_text_embeddings([text]))[0]
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        self._tick()
+        if self.latency:
+            time.sleep(self.latency)
+        return [self.embed(text) for text in texts]
+
+    async def _aget_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        self._tick()
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return [self.embed(text) for text in texts]
+
+
+class FakeVectorStore(SimpleVectorStore):
+    """
+    Vector store trong RAM (dựa trên SimpleVectorStore) có độ trễ giả lập cho mỗi lần upsert,
+    đếm số lần gọi add để kiểm tra việc gom batch.
+    """
+
+    latency: float = 0.0
+    _add_calls: int = PrivateAttr(default=0)
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "FakeVectorStore"
+
+    @property
+    def add_calls(self) -> int:
+        return self._add_calls
+
+    def add(self, nodes, **add_kwargs: Any) -> List[str]:
+        self._add_calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        return super().add(nodes, **add_kwargs)
+
+
+class FakeLLM(CustomLLM):
+    """
+    LLM giả lập, trả lời theo kịch bản và stream từng token (có độ trễ giả lập).
+
+    Mỗi lần gọi lấy câu trả lời tiếp theo trong `responses` (hết thì dùng câu cuối cùng).
+    Mặc định trả lời ngay theo định dạng ReAct ("Thought: ... Answer: ...").
+    """
+
+    responses: List[str] = [
+        "Thought: I can answer without using any more tools.\nAnswer: This is a fake answer."
+    ]
+    token_latency: float = 0.0   # Độ trễ giữa hai token khi stream (giây)
+    first_token_latency: float = 0.0  # Độ trễ trước token đầu tiên (giây)
+    context_window: int = 32768
+    num_output: int = 8192
+
+    _calls: int = PrivateAttr(default=0)
+    _prompt_chars: int = PrivateAttr(default=0)
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "FakeLLM"
+
+    @property
+    def metadata(self) -> LLMMetadata:
+        return LLMMetadata(context_window=self.context_window, num_output=self.num_output, model_name="fake-llm")
+
+    @property
+    def calls(self) -> int:
+        return self._calls
+
+    @property
+    def prompt_chars(self) -> int:
+        """Tổng số ký tự prompt đã nhận (ước lượng chi phí token đầu vào)."""
+        return self._prompt_chars
+
+    def reset(self):
+        """Chạy lại kịch bản từ câu trả lời đầu tiên."""
+        self._calls = 0
+        self._prompt_chars = 0
+
+    def _next_response(self, prompt: str) -> str:
+        self._prompt_chars += len(prompt)
+        text = self.responses[min(self._calls, len(self.responses) - 1)]
+        self._calls += 1
+        return text
+
+    @staticmethod
+    def _tokens(text: str) -> List[str]:
+        return re.findall(r"\S+\s*|\s+", text)
+
+    @llm_completion_callback()
+    def complete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponse:
+        text = self._next_response(prompt)
+        if self.first_token_latency or self.token_latency:
+            time.sleep(self.first_token_latency + self.token_latency * len(self._tokens(text)))
+        return CompletionResponse(text=text)
+
+    @llm_completion_callback()
+    def stream_complete(self, prompt: str, formatted: bool = False, **kwargs: Any):
+        text = self._next_response(prompt)
+
+        def gen():
+            if self.first_token_latency:
+                time.sleep(self.first_token_latency)
+            response = ""
+            for token in self._tokens(text):
+                if self.token_latency:
+                    time.sleep(self.token_latency)
+                response += token
+                yield CompletionResponse(text=response, delta=token)
+
+        return gen()
+
+    @llm_completion_callback()
+    async def acomplete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponse:
+        return await self._acomplete(prompt)
+
+    @llm_completion_callback()
+    async def astream_complete(self, prompt: str, formatted: bool = False, **kwargs: Any):
+        return await self._astream_complete(prompt)
+
+    async def _acomplete(self, prompt: str) -> CompletionResponse:
+        text = self._next_response(prompt)
+        if self.first_token_latency or self.token_latency:
+            await asyncio.sleep(self.first_token_latency + self.token_latency * len(self._tokens(text)))
+        return CompletionResponse(text=text)
+
+    async def _astream_complete(self, prompt: str):
+        text = self._next_response(prompt)
+
+        async def gen():
+            if self.first_token_latency:
+                await asyncio.sleep(self.first_token_latency)
+            response = ""
+            for token in self._tokens(text):
+                if self.token_latency:
+                    await asyncio.sleep(self.token_latency)
+                response += token
+                yield CompletionResponse(text=response, delta=token)
+
+        return gen()
+
+    # CustomLLM mặc định chạy bản async bằng hàm đồng bộ (chặn event loop), nên ghi đè lại.
+    # Gọi thẳng bản nội bộ (không qua callback complete) để mỗi lượt chat chỉ phát một sự kiện LLM, như LLM thật
+    @llm_chat_callback()
+    async def achat(self, messages, **kwargs: Any):
+        response = await self._acomplete(self.messages_to_prompt(messages))
+        return completion_response_to_chat_response(response)
+
+    @llm_chat_callback()
+    async def astream_chat(self, messages, **kwargs: Any):
+        completion = await self._astream_complete(self.messages_to_prompt(messages))
+        return astream_completion_response_to_chat_response(completion)
+
+
+class FakeReActLLM(FakeLLM):
+    """
+    LLM giả lập cho nhiều phiên chạy song song: câu trả lời phụ thuộc vào prompt thay vì thứ tự gọi.
+
+    - Prompt ReAct mà câu hỏi hiện tại chưa có Observation: gọi research_paper_query_tool với câu hỏi đó.
+    - Prompt ReAct đã có Observation: trả lời cuối cùng.
+    - Prompt khác (bước tổng hợp câu trả lời của RAG): một đoạn tóm tắt cố định.
+    """
+
+    def _next_response(self, prompt: str) -> str:
+        self._prompt_chars += len(prompt)
+        self._calls += 1
+        if "Action Input" not in prompt:
+            return "The retrieved papers describe this topic and compare several methods."
+        # messages_to_prompt: "...\nuser: <tin nhắn cuối>\nassistant: "
+        last = prompt.rstrip().rsplit("\nuser: ", 1)[-1].rsplit("\nassistant:", 1)[0].strip()
+        if last.startswith("Observation:"):
+            return "Thought: I can answer without using any more tools.\nAnswer: " + last[len("Observation:"):].strip()
+        return ("Thought: I should check the local database first.\nAction: research_paper_query_tool\n"
+                f'Action Input: {{"query": {json.dumps(last)}}}')
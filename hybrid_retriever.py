@@ -0,0 +1,57 @@
+import asyncio
+from typing import List
+
+from llama_index.core.retrievers import BaseRetriever
+from llama_index.core.schema import NodeWithScore, QueryBundle
+
+
+def reciprocal_rank_fusion(result_lists, k=60, weights=None):
+    """
+    Gộp nhiều danh sách kết quả bằng Reciprocal Rank Fusion: điểm = sum(w / (k + hạng)).
+
+    Chỉ dùng thứ hạng, không dùng điểm gốc, nên gộp được điểm cosine với điểm BM25.
+
+    Args:
+        result_lists (list): Mỗi phần tử là list NodeWithScore đã sắp xếp theo độ liên quan.
+        k (int): Hằng số làm mượt của RRF (60 theo bài báo gốc).
+        weights (list): Trọng số cho từng danh sách (mặc định bằng nhau).
+    Returns:
+        list: NodeWithScore (điểm = điểm RRF) theo thứ tự giảm dần.
+    """
+    weights = weights or [1.0] * len(result_lists)
+    scores = {}
+    nodes = {}
+    for results, weight in zip(result_lists, weights):
+        for rank, result in enumerate(results, 1):
+            node_id = result.node.node_id
+            scores[node_id] = scores.get(node_id, 0.0) + weight / (k + rank)
+            nodes.setdefault(node_id, result.node)
+    ranked = sorted(scores, key=scores.get, reverse=True)
+    return [NodeWithScore(node=nodes[node_id], score=scores[node_id]) for node_id in ranked]
+
+
+class HybridRetriever(BaseRetriever):
+    def __init__(self, retrievers, similarity_top_k=5, rrf_k=60, weights=None):
+        """
+        Retriever kết hợp (ví dụ vector + BM25): lấy kết quả của từng retriever rồi gộp bằng RRF.
+
+        Args:
+            retrievers (list): Các retriever con (nên lấy nhiều ứng viên hơn similarity_top_k).
+            similarity_top_k (int): Số node trả về sau khi gộp.
+            rrf_k (int): Hằng số RRF.
+            weights (list): Trọng số của từng retriever.
+        """
+        super().__init__()
+        self.retrievers = retrievers
+        self.similarity_top_k = similarity_top_k
+        self.rrf_k = rrf_k
+        self.weights = weights
+
+    def _retrieve(self, query_bundle: QueryBundle) -> List[NodeWithScore]:
+        results = [retriever.retrieve(query_bundle) for retriever in self.retrievers]
+        return reciprocal_rank_fusion(results, k=self.rrf_k, weights=self.weights)[:self.similarity_top_k]
+
+    async def _aretrieve(self, query_bundle: QueryBundle) -> List[NodeWithScore]:
+        # Các retriever độc lập nhau (vector store, BM25): chạy đồng thời
+        results = await asyncio.gather(*(retriever.aretrieve(query_bundle) for retriever in self.retrievers))
+        return reciprocal_rank_fusion(results, k=self.rrf_k, weights=self.weights)[:self.similarity_top_k]
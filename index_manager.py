@@ -1,4 +1,9 @@
 from tools import fetch_arxiv_papers
+from numpy_retriever import NumpyVectorRetriever
+from index_snapshot import DEFAULT_CHUNK_ROWS, Snapshot, SnapshotWriter, node_record
+from ingest_manifest import embed_model_name
+from instrumentation import traced, tracer
+from metadata_index import EMBED_EXCLUDED_KEYS, paper_metadata
 from llama_index.core import Document, VectorStoreIndex, Settings
 from llama_index.core import StorageContext,load_index_from_storage
 class IndexManager:
@@ -27,24 +32,19 @@ class IndexManager:
     def create_documents_from_papers(self):
         """
         Chuyển đổi dữ liệu bài báo thô (dicts) thành các đối tượng Document.
-        Mỗi bài báo sẽ được gom các trường (Tiêu đề, Tác giả, Tóm tắt...) thành một chuỗi văn bản.
+        Tóm tắt là nội dung văn bản; tiêu đề, tác giả, category, ngày đăng, URL được lưu thành metadata
+        (vẫn được đưa vào văn bản khi embed/gửi LLM) để lọc được theo category/tác giả/thời gian.
         """
         self.documents = [] # Reset danh sách cũ nếu có
         
         for paper in self.papers:
-            # Gom các thông tin quan trọng vào một chuỗi văn bản duy nhất để model dễ đọc
-            content = (
-                f"Title: {paper['title']}\n"
-                f"Authors: {', '.join(paper['authors'])}\n"
-                f"Abstract: {paper['summary']}\n"
-                f"URL: {paper.get('pdf_url', 'N/A')}\n"
-                f"DOI: {paper.get('doi', 'N/A')}\n"
-                f"Primary Category: {paper['primary_category']}\n"
-                f"arXiv URL: {paper['arxiv_url']}\n"
-            )
-            # Tạo Document và thêm vào danh sách (Sửa lỗi indentation cũ)
-            self.documents.append(Document(text=content))
+            metadata = paper_metadata(paper)
+            document = Document(text=paper["summary"], metadata=metadata, excluded_embed_metadata_keys=EMBED_EXCLUDED_KEYS)
+            if metadata["arxiv_id"]:
+                document.id_ = f"arxiv_{metadata['arxiv_id']}"  # Nạp lại cùng bài báo sẽ ghi đè đúng vector cũ
+            self.documents.append(document)
     
+    @traced("ingest.create_index")
     def create_index(self):
         """
         Tạo mới VectorStoreIndex từ danh sách bài báo hiện có.
@@ -63,6 +63,7 @@ class IndexManager:
             embed_model=self.embed_model
         )
 
+    @traced("index.load")
     def retrieve_index(self, persist_dir="index/"):
         """
         Khôi phục (Load) Index đã lưu từ ổ cứng lên RAM.
@@ -75,6 +76,85 @@ class IndexManager:
         storage_context = StorageContext.from_defaults(persist_dir=persist_dir)
         return load_index_from_storage(storage_context, embed_model=self.embed_model)
     
+    def build_numpy_retriever(self, index=None, similarity_top_k=5, dtype="float32"):
+        """
+        Tạo retriever NumPy (nhân ma trận + argpartition) cho index dùng SimpleVectorStore.
+
+        Args:
+            index (VectorStoreIndex): Index cần truy vấn (mặc định self.index).
+            similarity_top_k (int): Số node trả về mỗi câu hỏi.
+            dtype (str): "float32", "float16" hoặc "int8" (giảm bộ nhớ 2-4 lần).
+        Returns:
+            NumpyVectorRetriever: Có thể truyền vào Agent(retriever=...).
+        """
+        return NumpyVectorRetriever.from_index(
+            index or self.index,
+            similarity_top_k=similarity_top_k,
+            dtype=dtype,
+            embed_model=self.embed_model,
+        )
+
+    def iter_snapshot_records(self, batch_size=1000):
+        """
+        Đọc lần lượt mọi node của index kèm embedding (dùng để xuất snapshot).
+
+        Yields:
+            tuple: (ids, records, vectors) - list node_id, list JSON node, list embedding.
+        """
+        index = self.index or self.retrieve_index()
+        embedding_dict = index.vector_store.data.embedding_dict
+        node_ids = list(embedding_dict)
+        for start in range(0, len(node_ids), batch_size):
+            ids = node_ids[start:start + batch_size]
+            nodes = index.docstore.get_nodes(ids)
+            yield ids, [node_record(node) for node in nodes], [embedding_dict[node_id] for node_id in ids]
+
+    def snapshot_ingest_manifest(self):
+        """Danh sách file đã nạp, lưu kèm snapshot (index trong RAM không có manifest)."""
+        return None
+
+    @traced("index.snapshot_export")
+    def export_snapshot(self, path, dtype="float16", chunk_rows=DEFAULT_CHUNK_ROWS):
+        """
+        Xuất toàn bộ vector + node của index ra snapshot nhị phân gọn (xem index_snapshot.py),
+        nhỏ và nạp nhanh hơn nhiều so với thư mục index/ dạng JSON của LlamaIndex.
+
+        Args:
+            path (str): Thư mục snapshot (rỗng hoặc chưa tồn tại).
+            dtype (str): "float16" (mặc định, nhỏ bằng một nửa) hoặc "float32".
+            chunk_rows (int): Số node mỗi file chunk.
+        Returns:
+            dict: Manifest của snapshot.
+        """
+        writer = SnapshotWriter(path, embed_model=embed_model_name(self.embed_model), dtype=dtype,
+                                chunk_rows=chunk_rows, source=type(self).__name__)
+        for ids, records, vectors in self.iter_snapshot_records():
+            writer.add(ids, records, vectors)
+        manifest = writer.close(ingest_manifest=self.snapshot_ingest_manifest())
+        tracer.incr("snapshot_nodes_total", manifest["count"], op="export")
+        print(f"Da xuat {manifest['count']} node ({len(manifest['chunks'])} chunk, {manifest['dtype']}) ra {path}.")
+        return manifest
+
+    @traced("index.snapshot_import")
+    def import_snapshot(self, path, force=False):
+        """
+        Dựng index trong RAM từ snapshot: node đã có sẵn embedding nên không gọi API embedding.
+
+        Args:
+            path (str): Thư mục snapshot.
+            force (bool): Vẫn khôi phục khi snapshot được tạo bằng model embedding khác.
+        Returns:
+            int: Số node đã khôi phục.
+        """
+        snapshot = Snapshot(path)
+        if not force:
+            snapshot.check_compatible(embed_model_name(self.embed_model))
+        nodes = [node for chunk in snapshot.iter_nodes() for node in chunk]
+        self.index = VectorStoreIndex(nodes, embed_model=self.embed_model)
+        tracer.incr("snapshot_nodes_total", len(nodes), op="import")
+        print(f"Da khoi phuc {len(nodes)} node tu snapshot {path}.")
+        return len(nodes)
+
     def list_papers(self):
         """
         In ra danh sách tiêu đề các bài báo đang được quản lý.
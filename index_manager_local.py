@@ -0,0 +1,24 @@
+import os
+
+from index_manager_persistent import PersistentIndexManager
+from local_vector_store import MmapVectorStore
+
+
+class IndexManagerLocal(PersistentIndexManager):
+    def __init__(self, embed_model, index_dir="local_index", nprobe=8):
+        """
+        IndexManager lưu index hoàn toàn trên ổ cứng (không cần mạng), thay thế cho Pinecone.
+        Chỉ mục BM25 và chỉ mục metadata cũng nằm trong index_dir.
+
+        Args:
+            embed_model: Mô hình Embeddings.
+            index_dir (str): Thư mục chứa ma trận vector, metadata và manifest.
+            nprobe (int): Số cụm IVF được dò mỗi lần tìm kiếm (lớn hơn = chính xác hơn nhưng chậm hơn).
+        """
+        super().__init__(
+            embed_model,
+            MmapVectorStore(index_dir, nprobe=nprobe),
+            manifest_path=os.path.join(index_dir, "ingest_manifest.json"),
+            keyword_index_path=os.path.join(index_dir, "bm25.sqlite"),
+            metadata_index_path=os.path.join(index_dir, "metadata.sqlite"),
+        )
@@ -0,0 +1,397 @@
+import os
+
+from llama_index.core import StorageContext, VectorStoreIndex, Settings
+from llama_index.core.retrievers import VectorIndexRetriever
+
+from async_ingest import AsyncIngestEngine
+from bm25_index import BM25Index, BM25Retriever, DEFAULT_BM25_PATH
+from hybrid_retriever import HybridRetriever
+from index_manager import IndexManager
+from index_snapshot import Snapshot
+from ingest_manifest import IngestManifest, DEFAULT_MANIFEST_PATH, embed_model_name, file_sha256
+from ingest_pipeline import IngestPipeline, iter_parsed_files
+from instrumentation import traced, tracer
+from metadata_index import DEFAULT_METADATA_INDEX_PATH, MetadataIndex, enrich_metadata, to_metadata_filters
+from minhash_dedup import MinHashDeduper
+from pdf_chunker import CHUNKER_VERSION
+from query_cache import bump_index_version
+from tools import get_arxiv_fetcher
+
+
+def record_ingest_stats(stats):
+    """Cộng thống kê của một lần nạp dữ liệu vào các counter của tracer."""
+    tracer.incr("ingest_files_total", stats["files"])
+    tracer.incr("ingest_failed_files_total", len(stats["failed_files"]))
+    tracer.incr("ingest_nodes_total", stats["nodes"])
+    tracer.incr("ingest_duplicate_chunks_total", stats.get("duplicates", 0))
+    tracer.incr("ingest_retries_total", stats["retries"])
+    tracer.incr("embedding_requests_total", stats["embed_requests"])
+    tracer.incr("vector_store_upserts_total", stats["upsert_requests"])
+    tracer.write_prometheus()
+
+
+class PersistentIndexManager(IndexManager):
+    # Vector store tự lọc được theo metadata phía server (Pinecone); nếu không thì lọc trước bằng node_ids
+    supports_filter_pushdown = False
+
+    def __init__(self, embed_model, vector_store, manifest_path=DEFAULT_MANIFEST_PATH,
+                 keyword_index_path=DEFAULT_BM25_PATH, metadata_index_path=DEFAULT_METADATA_INDEX_PATH,
+                 upload_manifest_path=None):
+        """
+        IndexManager dùng một vector store lưu trữ lâu dài (Pinecone, index local...).
+        Dữ liệu được nạp tăng dần: chỉ file mới/thay đổi mới được embed và upsert.
+
+        Args:
+            embed_model: Mô hình Embeddings.
+            vector_store: Vector store của LlamaIndex.
+            manifest_path (str): File manifest ghi nhận các file đã nạp vào vector store này.
+            keyword_index_path (str): File chỉ mục BM25 đi kèm vector store này (nạp/xóa cùng lúc).
+            metadata_index_path (str): File chỉ mục metadata (category, tác giả, ngày đăng) dùng để
+                lọc trước khi tìm kiếm.
+            upload_manifest_path (str): File manifest ghi nhận các file upload đã nạp, theo tên file
+                (mặc định upload_manifest.json cạnh manifest_path).
+        """
+        super().__init__(embed_model)
+        self.vector_store = vector_store
+        self.storage_context = StorageContext.from_defaults(vector_store=self.vector_store)
+        self.manifest_path = manifest_path
+        self.upload_manifest_path = upload_manifest_path or os.path.join(
+            os.path.dirname(manifest_path), "upload_manifest.json"
+        )
+        self.keyword_index = BM25Index(keyword_index_path)
+        self.metadata_index = MetadataIndex(metadata_index_path)
+        # Cấu hình embed/upsert khi nạp dữ liệu (xem AsyncIngestEngine)
+        self.ingest_config = {
+            "embed_batch_size": 64,
+            "max_concurrent_embeds": 4,
+            "upsert_batch_size": 100,
+            "max_concurrent_upserts": 4,
+            "requests_per_minute": None,
+            "max_retries": 6,
+        }
+
+    @traced("ingest.create_index")
+    def create_index(self, papers_dir="papers", manifest_path=None):
+        """
+        Nạp bài báo (từ Arxiv) và các file trong thư mục papers/ vào vector store.
+
+        Chỉ các file mới hoặc đã thay đổi (so với manifest) mới được đọc, embed và upsert;
+        vector của các file đã bị xóa khỏi thư mục cũng bị xóa khỏi vector store.
+
+        Args:
+            papers_dir (str): Thư mục chứa file tài liệu local.
+            manifest_path (str): Đường dẫn file manifest ghi nhận các file đã nạp
+                (mặc định self.manifest_path).
+        """
+        self.documents = [] # Reset danh sách cũ nếu có
+        self.create_documents_from_papers()
+
+        Settings.chunk_size = 1024
+        Settings.chunk_overlap = 50
+        manifest = IngestManifest(
+            manifest_path or self.manifest_path,
+            chunk_size=Settings.chunk_size,
+            chunk_overlap=Settings.chunk_overlap,
+            model_name=embed_model_name(self.embed_model),
+            chunker=CHUNKER_VERSION,
+        )
+        file_jobs = []  # (path, sha256) các file cần nạp
+        deleted = 0     # Số document đã xóa khỏi vector store
+
+        # Thêm phần đọc file local từ thư mục papers/
+        if os.path.exists(papers_dir):
+            try:
+                file_paths = sorted(
+                    os.path.join(papers_dir, f) for f in os.listdir(papers_dir)
+                    if not f.startswith(".") and os.path.isfile(os.path.join(papers_dir, f))
+                )
+                changed, removed = manifest.diff(file_paths)
+                print(f"Tim thay {len(file_paths)} file: {len(changed)} file moi/thay doi, {len(removed)} file da bi xoa.")
+
+                # Xóa vector của file đã bị xóa hoặc đã thay đổi nội dung
+                for path in removed + [path for path, _ in changed]:
+                    for doc_id in manifest.doc_ids(path):
+                        self.delete_document(doc_id)
+                        deleted += 1
+                for path in removed:
+                    manifest.forget(path)
+
+                # Chỉ nạp các file mới/thay đổi. doc_id được gắn theo đường dẫn + hash nội dung (doc_id_prefix) để xóa chính xác về sau.
+                for path, sha in changed:
+                    manifest.forget(path)
+                file_jobs = changed
+            except Exception as e:
+                print(f"Co loi khi doc file local: {e}")
+
+        if not self.documents and not file_jobs:
+            manifest.save()
+            if deleted:
+                bump_index_version()  # Báo cho cache câu trả lời biết dữ liệu của file đã xóa không còn
+            print("Khong co tai lieu moi nao de nap vao Index.")
+            self.index = self.retrieve_index()
+            return
+
+        print(f"Dang nap {len(file_jobs)} file va {len(self.documents)} bai bao vao vector store...")
+        hashes = dict(file_jobs)
+
+        def on_file_done(path, doc_ids):
+            # Ghi nhận ngay từng file đã upsert xong để lần chạy sau (kể cả khi bị ngắt giữa chừng) không nạp lại
+            manifest.record(path, hashes[path], doc_ids)
+
+        stats = None
+        try:
+            stats = self.build_pipeline().run(file_jobs, documents=self.documents, on_file_done=on_file_done)
+        finally:
+            manifest.save()
+            # Báo cho cache câu trả lời biết index đã thay đổi (đã xóa, đã nạp, hoặc lỗi giữa chừng sau khi nạp một phần)
+            if deleted or stats is None or stats["nodes"]:
+                bump_index_version()
+        print(f"Da nap {stats['files']} file, {stats['nodes']} chunk ({stats['duplicates']} chunk trung bi bo, "
+              f"{stats['retries']} lan thu lai).")
+        record_ingest_stats(stats)
+        if stats["failed_files"]:
+            print(f"Co {len(stats['failed_files'])} file nap loi, se duoc nap lai o lan chay sau: {stats['failed_files']}")
+        self.index = self.retrieve_index()
+
+    def build_pipeline(self, **engine_kwargs):
+        """
+        Tạo pipeline nạp dữ liệu streaming (đọc file song song -> embed -> upsert vào vector store).
+
+        Args:
+            **engine_kwargs: Ghi đè cấu hình AsyncIngestEngine (embed_batch_size,
+                max_concurrent_embeds, upsert_batch_size, requests_per_minute, max_retries...).
+        """
+        Settings.chunk_size = 1024
+        Settings.chunk_overlap = 50
+        config = dict(self.ingest_config)
+        config.update(engine_kwargs)
+        return IngestPipeline(
+            self.embed_model,
+            self.vector_store,
+            chunk_size=Settings.chunk_size,
+            chunk_overlap=Settings.chunk_overlap,
+            keyword_index=self.keyword_index,
+            metadata_index=self.metadata_index,
+            paper_store=get_arxiv_fetcher().store,
+            **config,
+        )
+
+    def delete_document(self, doc_id):
+        """Xóa một document khỏi vector store, chỉ mục BM25 và chỉ mục metadata."""
+        self.vector_store.delete(doc_id)
+        self.keyword_index.delete(doc_id)
+        self.metadata_index.delete(doc_id)
+
+    def rebuild_keyword_index(self, manifest_path=None):
+        """
+        Dựng lại chỉ mục BM25 và chỉ mục metadata từ các file đã ghi trong manifest (chỉ đọc và
+        chia chunk, không gọi API embedding). Dùng khi vector store đã có dữ liệu từ trước khi có các chỉ mục này.
+
+        Returns:
+            int: Số chunk đã nạp vào chỉ mục.
+        """
+        manifest = IngestManifest(manifest_path or self.manifest_path)
+        jobs = [(path, entry["sha256"]) for path, entry in manifest.files.items() if os.path.exists(path)]
+        self.keyword_index.clear()
+        self.metadata_index.clear()
+        count = 0
+        deduper = MinHashDeduper()  # Lọc trùng (trong từng file) giống lúc nạp vector để hai chỉ mục có cùng tập chunk
+        paper_store = get_arxiv_fetcher().store
+        for _, _, nodes in iter_parsed_files(jobs, chunk_size=1024, chunk_overlap=50):
+            deduper.reset()
+            nodes = deduper.filter(enrich_metadata(nodes, paper_store))
+            self.keyword_index.add(nodes)
+            self.metadata_index.add(nodes)
+            count += len(nodes)
+        print(f"Da dung lai chi muc BM25 va metadata: {len(jobs)} file, {count} chunk.")
+        return count
+
+    def iter_snapshot_records(self, batch_size=10000):
+        """Đọc lần lượt mọi node kèm vector từ vector store (index local: đọc thẳng từ file, không qua tìm kiếm)."""
+        return self.vector_store.iter_records(batch_size)
+
+    def snapshot_ingest_manifest(self):
+        return IngestManifest(self.manifest_path).files
+
+    @traced("index.snapshot_import")
+    def import_snapshot(self, path, force=False, replace=False):
+        """
+        Khôi phục snapshot vào vector store (Pinecone hoặc index local) mà không gọi API embedding:
+        node đã có sẵn embedding được upsert theo batch, song song như khi nạp dữ liệu
+        (upsert_batch_size x max_concurrent_upserts trong self.ingest_config, có thử lại khi lỗi tạm thời).
+        Chỉ mục BM25, chỉ mục metadata và manifest nạp dữ liệu cũng được khôi phục.
+
+        Args:
+            path (str): Thư mục snapshot.
+            force (bool): Vẫn khôi phục khi snapshot được tạo bằng model embedding khác.
+            replace (bool): Xóa hết dữ liệu hiện có của vector store và các chỉ mục trước khi khôi phục.
+        Returns:
+            dict: Thống kê của AsyncIngestEngine (nodes, failed_nodes, retries, upsert_requests...).
+        """
+        snapshot = Snapshot(path)
+        if not force:
+            snapshot.check_compatible(embed_model_name(self.embed_model))
+        if replace:
+            self.vector_store.clear()
+            self.keyword_index.clear()
+            self.metadata_index.clear()
+
+        config = dict(self.ingest_config)
+        # Không có bước embed: mỗi batch đủ cho mọi luồng upsert, batch sau được đọc trong lúc batch trước đang upsert
+        config["embed_batch_size"] = config["upsert_batch_size"] * config["max_concurrent_upserts"]
+        config["max_concurrent_embeds"] = 2
+        engine = AsyncIngestEngine(self.embed_model, self.vector_store, **config)
+
+        def on_batch_done(nodes, error):
+            if error is None:
+                self.keyword_index.add(nodes)
+                self.metadata_index.add(nodes)
+
+        print(f"Dang khoi phuc {len(snapshot)} node tu snapshot {path}...")
+        stats = engine.ingest(snapshot.iter_nodes(), on_batch_done=on_batch_done)
+        tracer.incr("snapshot_nodes_total", stats["nodes"], op="import")
+        tracer.incr("vector_store_upserts_total", stats["upsert_requests"])
+        if snapshot.ingest_manifest and not stats["failed_nodes"]:
+            # Ghi nhận các file đã có vector để lần nạp sau (create_index) không embed lại
+            manifest = IngestManifest(self.manifest_path)
+            manifest.files.update(snapshot.ingest_manifest)
+            manifest.save()
+        if stats["nodes"] or replace:
+            bump_index_version()  # Báo cho cache câu trả lời biết index đã thay đổi
+        print(f"Da khoi phuc {stats['nodes']} node ({stats['upsert_requests']} lan upsert, "
+              f"{stats['retries']} lan thu lai, {stats['failed_nodes']} node loi).")
+        self.index = self.retrieve_index()
+        return stats
+
+    def build_hybrid_retriever(self, index=None, similarity_top_k=5, candidate_k=20):
+        """
+        Tạo retriever kết hợp vector + BM25 (gộp bằng Reciprocal Rank Fusion).
+
+        Args:
+            index (VectorStoreIndex): Index vector (mặc định self.index hoặc retrieve_index()).
+            similarity_top_k (int): Số node trả về sau khi gộp.
+            candidate_k (int): Số ứng viên lấy từ mỗi retriever trước khi gộp.
+        Returns:
+            HybridRetriever: Có thể truyền vào Agent(retriever=...).
+        """
+        index = index or self.index or self.retrieve_index()
+        return HybridRetriever(
+            [
+                index.as_retriever(similarity_top_k=candidate_k, embed_model=self.embed_model),
+                BM25Retriever(self.keyword_index, similarity_top_k=candidate_k),
+            ],
+            similarity_top_k=similarity_top_k,
+        )
+
+    def build_filtered_retriever(self, filters, index=None, similarity_top_k=5, candidate_k=20):
+        """
+        Tạo retriever chỉ tìm trong các chunk thỏa bộ lọc metadata (category, tác giả, ngày đăng, arXiv ID).
+
+        Tập chunk thỏa bộ lọc được tính trước bằng MetadataIndex, rồi:
+            - Pinecone: đẩy xuống thành bộ lọc metadata phía server (ngày đăng + ref_doc_id IN ...).
+            - Vector store local: chỉ chấm điểm các node đó (VectorStoreQuery.node_ids).
+            - BM25: chỉ chấm điểm các node đó.
+
+        Args:
+            filters (dict): {"category", "author", "published_after", "published_before", "arxiv_id"}.
+            index (VectorStoreIndex): Index vector (mặc định self.index hoặc retrieve_index()).
+            similarity_top_k (int): Số node trả về sau khi gộp.
+            candidate_k (int): Số ứng viên lấy từ mỗi retriever trước khi gộp.
+        Returns:
+            BaseRetriever: Hoặc None nếu không có chunk nào thỏa bộ lọc.
+        """
+        index = index or self.index or self.retrieve_index()
+        if not len(self.metadata_index):
+            # Chưa có chỉ mục metadata (dữ liệu nạp từ phiên bản cũ): chỉ lọc được trong vector store
+            print("Chi muc metadata dang trong, hay chay 'python ingest_local_pdfs.py --rebuild-keyword-index'.")
+            if self.supports_filter_pushdown:
+                # Pinecone không khớp chuỗi được: chỉ giữ bộ lọc ngày đăng / arXiv ID
+                filters = {k: v for k, v in filters.items() if k not in ("category", "author")}
+            return index.as_retriever(
+                similarity_top_k=similarity_top_k, filters=to_metadata_filters(filters), embed_model=self.embed_model
+            )
+        matches = self.metadata_index.match(filters)
+        if not matches:
+            return None
+        node_ids = [node_id for node_id, _ in matches]
+        hybrid = len(self.keyword_index) > 0
+        k = candidate_k if hybrid else similarity_top_k
+        if self.supports_filter_pushdown:
+            ref_doc_ids = sorted({ref_doc_id for _, ref_doc_id in matches if ref_doc_id})
+            filters = to_metadata_filters(filters, ref_doc_ids=ref_doc_ids)
+            vector_retriever = index.as_retriever(similarity_top_k=k, filters=filters, embed_model=self.embed_model)
+        else:
+            vector_retriever = VectorIndexRetriever(
+                index, similarity_top_k=k, node_ids=node_ids, embed_model=self.embed_model
+            )
+        if not hybrid:
+            return vector_retriever
+        return HybridRetriever(
+            [vector_retriever, BM25Retriever(self.keyword_index, similarity_top_k=candidate_k, node_ids=node_ids)],
+            similarity_top_k=similarity_top_k,
+        )
+
+    def ingest_uploaded_files(self, file_paths, on_file_done=None):
+        """
+        Doc va nap truc tiep danh sach file (tu upload) vao vector store
+
+        on_file_done: gọi với (path, doc_ids) ngay khi từng file nạp xong (dùng để báo tiến độ, xem ingest_worker.py)
+        """
+        try:
+            print(f"Dang xu ly {len(file_paths)} file upload...")
+            # File upload được ghi nhận theo tên file (giống file trong papers/): upload lại một file cùng tên
+            # mà khác nội dung (hoặc đã đổi cách chia chunk/model embedding) thì vector của bản cũ bị xóa trước
+            manifest = IngestManifest(
+                self.upload_manifest_path,
+                chunk_size=1024,
+                chunk_overlap=50,
+                model_name=embed_model_name(self.embed_model),
+                chunker=CHUNKER_VERSION,
+            )
+            file_jobs = [(path, file_sha256(path)) for path in file_paths]
+            deleted = 0
+            for path, sha in file_jobs:
+                name = os.path.basename(path)
+                entry = manifest.files.get(name)
+                if entry and (entry["sha256"] != sha or entry.get("fingerprint") != manifest.fingerprint):
+                    for doc_id in manifest.doc_ids(name):
+                        self.delete_document(doc_id)
+                        deleted += 1
+                    manifest.forget(name)
+            hashes = dict(file_jobs)
+
+            def record_file(path, doc_ids):
+                manifest.record(path, hashes[path], doc_ids, key=os.path.basename(path))
+                if on_file_done is not None:
+                    on_file_done(path, doc_ids)
+
+            stats = None
+            try:
+                with tracer.span("ingest.uploaded_files", files=len(file_paths)):
+                    stats = self.build_pipeline().run(file_jobs, on_file_done=record_file)
+            finally:
+                manifest.save()
+                # Báo cho cache câu trả lời biết index đã thay đổi (kể cả khi lỗi giữa chừng sau khi nạp một phần)
+                if deleted or stats is None or stats["nodes"]:
+                    bump_index_version()
+            record_ingest_stats(stats)
+
+            if stats["failed_files"]:
+                return False, (
+                    f"Da nap {stats['files']} file ({stats['nodes']} doan tai lieu), "
+                    f"nhung {len(stats['failed_files'])} file bi loi sau {stats['retries']} lan thu lai: "
+                    + ", ".join(os.path.basename(p) for p in stats["failed_files"])
+                )
+            if not stats["nodes"]:
+                return False, "Khong doc duoc noi dung file na."
+
+            return True, f"Da nap thanh cong {stats['files']} file voi {stats['nodes']} doan tai lieu!"
+        except Exception as e:
+            return False, f"Gap loi khi nap file: {str(e)}"
+
+    @traced("index.load")
+    def retrieve_index(self):
+        return VectorStoreIndex.from_vector_store(
+            vector_store=self.vector_store,
+            embed_model=self.embed_model
+        )
\ No newline at end of file
@@ -1,80 +1,64 @@
-from index_manager import IndexManager
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from index_manager_persistent import PersistentIndexManager
+from index_snapshot import node_record
 from pinecone import Pinecone
 import os
 from dotenv import load_dotenv
+from llama_index.core.vector_stores.utils import metadata_dict_to_node
 from llama_index.vector_stores.pinecone import PineconeVectorStore
-from llama_index.core import StorageContext, load_index_from_storage
-from llama_index.core import Document, VectorStoreIndex, Settings
-from llama_index.core import SimpleDirectoryReader
+from instrumentation import tracer
 load_dotenv()
 
 
-class IndexManagerPinecone(IndexManager):
-    def __init__(self, embed_model, index_name):
-        super().__init__(embed_model)
-        pc = Pinecone(api_key=os.getenv('PINECONE_API_KEY'))
-        self.pinecone_index = pc.Index(index_name)
-        self.vector_store = PineconeVectorStore(pinecone_index=self.pinecone_index)
-        self.storage_context = StorageContext.from_defaults(vector_store=self.vector_store)
+class TracedPineconeVectorStore(PineconeVectorStore):
+    """PineconeVectorStore có đo thời gian mỗi lần query/upsert/xóa (span vector_store.*)."""
+
+    def query(self, query, **kwargs):
+        with tracer.span("vector_store.query", backend="pinecone"):
+            return super().query(query, **kwargs)
+
+    def add(self, nodes, **add_kwargs):
+        with tracer.span("vector_store.add", backend="pinecone", nodes=len(nodes)):
+            return super().add(nodes, **add_kwargs)
 
-    def create_index(self):
-        self.documents = [] # Reset danh sách cũ nếu có
-        self.create_documents_from_papers()
-        
-        # Thêm phần đọc file local từ thư mục papers/
-        if os.path.exists("papers"):
-            try:
-                print("Dang doc file tu folder papers/...")
-                # SimpleDirectoryReader tự động đọc pdf, txt, docx...
-                reader = SimpleDirectoryReader("papers")
-                local_docs = reader.load_data()
-                print(f"Tim thay {len(local_docs)} trang tai lieu.")
-                self.documents.extend(local_docs)
-            except Exception as e:
-                print(f"Co loi khi doc file local: {e}")
+    def delete(self, ref_doc_id, **delete_kwargs):
+        with tracer.span("vector_store.delete", backend="pinecone"):
+            return super().delete(ref_doc_id, **delete_kwargs)
 
-        if not self.documents:
-            print("Khong co tai lieu nao de nap vao Index.")
-            return
 
-        Settings.chunk_size = 1024
-        Settings.chunk_overlap = 50
-        self.index = VectorStoreIndex.from_documents(
-            self.documents,
-            storage_context=self.storage_context,
-            embed_model=self.embed_model
-        )
+class IndexManagerPinecone(PersistentIndexManager):
+    supports_filter_pushdown = True
 
-    def ingest_uploaded_files(self, file_paths):
+    def __init__(self, embed_model, index_name):
+        pc = Pinecone(api_key=os.getenv('PINECONE_API_KEY'))
+        self.pinecone_index = pc.Index(index_name)
+        super().__init__(embed_model, TracedPineconeVectorStore(pinecone_index=self.pinecone_index))
+
+    def iter_snapshot_records(self, batch_size=100):
         """
-        Doc va nap truc tiep danh sach file (tu upload) vao Pinecone
+        Đọc mọi vector của namespace (list id theo trang rồi fetch song song, tối đa max_concurrent_upserts
+        request cùng lúc). index.list() chỉ có trên index serverless của Pinecone.
+
+        Yields:
+            tuple: (ids, records, vectors) - list node_id, list JSON node, list embedding.
         """
-        try:
-            print(f"Dang xu ly {len(file_paths)} file upload...")
-            # Doc noi dung file
-            reader = SimpleDirectoryReader(input_files=file_paths)
-            new_documents = reader.load_data()
-            
-            if not new_documents:
-                return False, "Khong doc duoc noi dung file na."
+        namespace = self.vector_store.namespace
+        workers = self.ingest_config["max_concurrent_upserts"]
 
-            print(f"Tim thay {len(new_documents)} trang tai lieu. Dang day len Pinecone...")
+        def fetch(ids):
+            with tracer.span("vector_store.fetch", backend="pinecone", nodes=len(ids)):
+                vectors = self.pinecone_index.fetch(ids=ids, namespace=namespace).vectors
+            ids = [node_id for node_id in ids if node_id in vectors]
+            records = [node_record(metadata_dict_to_node(vectors[node_id].metadata)) for node_id in ids]
+            return ids, records, [vectors[node_id].values for node_id in ids]
 
-            # Settings chunk text
-            Settings.chunk_size = 1024
-            Settings.chunk_overlap = 50
-            
-            # Nap vao Index hien co (Append mode)
-            VectorStoreIndex.from_documents(
-                new_documents,
-                storage_context=self.storage_context,
-                embed_model=self.embed_model
-            )
-            return True, f"Da nap thanh cong {len(file_paths)} file voi {len(new_documents)} trang tai lieu!"
-        except Exception as e:
-            return False, f"Gap loi khi nap file: {str(e)}"
-    def retrieve_index(self):
-        return VectorStoreIndex.from_vector_store(
-            vector_store=self.vector_store,
-            embed_model=self.embed_model
-        )
\ No newline at end of file
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            pending = deque()
+            for ids in self.pinecone_index.list(namespace=namespace, limit=batch_size):
+                pending.append(pool.submit(fetch, list(ids)))
+                if len(pending) >= 2 * workers:  # Giới hạn số trang đã fetch mà chưa được ghi ra
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
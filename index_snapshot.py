@@ -0,0 +1,213 @@
+import json
+import os
+import time
+import zlib
+
+import numpy as np
+from llama_index.core.vector_stores.utils import metadata_dict_to_node, node_to_metadata_dict
+
+from ingest_manifest import file_sha256
+
+SNAPSHOT_FORMAT = "arxiv-researcher-snapshot"
+SNAPSHOT_VERSION = 1
+MANIFEST_NAME = "snapshot.json"
+DEFAULT_CHUNK_ROWS = 10000
+
+# Định dạng snapshot (một thư mục):
+#   snapshot.json      manifest: tên embed model, số chiều, dtype, số node, danh sách chunk (+ sha256), manifest nạp dữ liệu
+#   chunk-00000.npz    np.savez (không pickle) với:
+#                        vectors  (n, dim) float16/float32 - embedding gốc (chưa chuẩn hóa)
+#                        ids      (n,) chuỗi node_id
+#                        nodes    uint8 - JSON của từng node (text + metadata) nối liền rồi nén zlib
+#                        offsets  (n + 1,) int64 - vị trí bắt đầu/kết thúc của từng JSON sau khi giải nén
+# snapshot.json được ghi sau cùng: thư mục không có file này là snapshot chưa ghi xong.
+
+
+def node_record(node):
+    """Chuỗi JSON của node (text + metadata + quan hệ) giống cách MmapVectorStore lưu trong meta.sqlite."""
+    return json.dumps(node_to_metadata_dict(node, remove_text=False, flat_metadata=False), ensure_ascii=False)
+
+
+class SnapshotWriter:
+    def __init__(self, path, embed_model="", dtype="float16", chunk_rows=DEFAULT_CHUNK_ROWS, source=""):
+        """
+        Ghi snapshot của một index (vector + node) theo từng chunk nhị phân.
+
+        Args:
+            path (str): Thư mục snapshot (phải rỗng hoặc chưa tồn tại).
+            embed_model (str): Tên model embedding đã tạo các vector (kiểm tra lại khi khôi phục).
+            dtype (str): "float16" (nhỏ bằng một nửa, sai số ~1e-3) hoặc "float32" (giữ nguyên vector).
+            chunk_rows (int): Số node mỗi file chunk.
+            source (str): Backend nguồn ("local", "pinecone", "memory"), chỉ để tham khảo.
+        """
+        if dtype not in ("float16", "float32"):
+            raise ValueError(f"dtype khong hop le: {dtype}")
+        if os.path.exists(path) and os.listdir(path):
+            raise ValueError(f"Thu muc snapshot {path} da co du lieu.")
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.embed_model = embed_model
+        self.dtype = dtype
+        self.chunk_rows = chunk_rows
+        self.source = source
+        self.dim = None
+        self.count = 0
+        self.chunks = []
+        self._ids, self._records, self._vectors = [], [], []
+        self._buffered = 0
+
+    def add(self, ids, records, vectors):
+        """
+        Thêm một batch node.
+
+        Args:
+            ids (list): node_id của từng node.
+            records (list): JSON của từng node (xem node_record).
+            vectors (array-like): Ma trận (n, dim) embedding tương ứng.
+        """
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if not len(ids):
+            return
+        if vectors.ndim != 2 or vectors.shape[0] != len(ids) or len(records) != len(ids):
+            raise ValueError("ids, records va vectors phai co cung so hang.")
+        if self.dim is None:
+            self.dim = vectors.shape[1]
+        elif vectors.shape[1] != self.dim:
+            raise ValueError(f"Embedding co {vectors.shape[1]} chieu, snapshot dang dung {self.dim} chieu.")
+        self._ids.extend(ids)
+        self._records.extend(records)
+        self._vectors.append(vectors)
+        self._buffered += len(ids)
+        while self._buffered >= self.chunk_rows:
+            self._flush(self.chunk_rows)
+
+    def _flush(self, rows):
+        vectors = np.concatenate(self._vectors) if len(self._vectors) > 1 else self._vectors[0]
+        ids, records = self._ids[:rows], self._records[:rows]
+        self._ids, self._records = self._ids[rows:], self._records[rows:]
+        self._vectors = [vectors[rows:]] if rows < len(vectors) else []
+        self._buffered -= rows
+        chunk = vectors[:rows].astype(self.dtype)
+        if not np.isfinite(chunk).all():
+            raise ValueError("Vector vuot qua mien gia tri cua float16, hay dung dtype float32.")
+
+        encoded = [record.encode("utf-8") for record in records]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(b) for b in encoded])
+        blob = np.frombuffer(zlib.compress(b"".join(encoded), 6), dtype=np.uint8)
+        name = f"chunk-{len(self.chunks):05d}.npz"
+        file_path = os.path.join(self.path, name)
+        with open(file_path, "wb") as f:
+            np.savez(f, vectors=chunk, ids=np.array(ids, dtype=str), nodes=blob, offsets=offsets)
+        self.chunks.append({"file": name, "count": len(ids), "sha256": file_sha256(file_path)})
+        self.count += len(ids)
+
+    def close(self, ingest_manifest=None):
+        """
+        Ghi nốt dữ liệu còn trong bộ đệm rồi ghi manifest snapshot.json.
+
+        Args:
+            ingest_manifest (dict): Danh sách file đã nạp (IngestManifest.files) của index nguồn,
+                khôi phục cùng để lần nạp sau không embed lại các file này.
+        Returns:
+            dict: Manifest của snapshot.
+        """
+        if self._buffered:
+            self._flush(self._buffered)
+        manifest = {
+            "format": SNAPSHOT_FORMAT,
+            "version": SNAPSHOT_VERSION,
+            "source": self.source,
+            "embed_model": self.embed_model,
+            "dim": self.dim,
+            "dtype": self.dtype,
+            "count": self.count,
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "chunks": self.chunks,
+            "ingest_manifest": ingest_manifest or {},
+        }
+        tmp_path = os.path.join(self.path, MANIFEST_NAME + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=1)
+        os.replace(tmp_path, os.path.join(self.path, MANIFEST_NAME))
+        return manifest
+
+
+class Snapshot:
+    def __init__(self, path):
+        """
+        Đọc snapshot do SnapshotWriter ghi.
+
+        Args:
+            path (str): Thư mục snapshot.
+        """
+        manifest_path = os.path.join(path, MANIFEST_NAME)
+        if not os.path.exists(manifest_path):
+            raise ValueError(f"{path} khong phai snapshot (hoac chua ghi xong): thieu {MANIFEST_NAME}.")
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            self.manifest = json.load(f)
+        if self.manifest.get("format") != SNAPSHOT_FORMAT or self.manifest.get("version") != SNAPSHOT_VERSION:
+            raise ValueError(f"Dinh dang snapshot khong ho tro: {self.manifest.get('format')} "
+                             f"v{self.manifest.get('version')}.")
+        self.path = path
+
+    def __len__(self):
+        return self.manifest["count"]
+
+    @property
+    def embed_model(self):
+        return self.manifest["embed_model"]
+
+    @property
+    def dim(self):
+        return self.manifest["dim"]
+
+    @property
+    def ingest_manifest(self):
+        return self.manifest.get("ingest_manifest") or {}
+
+    def nbytes(self):
+        """Tổng dung lượng các file của snapshot trên ổ cứng."""
+        return sum(os.path.getsize(os.path.join(self.path, name)) for name in os.listdir(self.path))
+
+    def check_compatible(self, embed_model):
+        """Báo lỗi nếu snapshot được tạo bằng model embedding khác (vector không dùng chung được)."""
+        if self.embed_model and embed_model and self.embed_model != embed_model:
+            raise ValueError(f"Snapshot duoc tao bang embed model {self.embed_model}, "
+                             f"index dang dung {embed_model} (dung force=True de van khoi phuc).")
+
+    def iter_chunks(self, verify=True):
+        """
+        Đọc lần lượt từng chunk.
+
+        Args:
+            verify (bool): Kiểm tra sha256 của file chunk trước khi đọc.
+        Yields:
+            tuple: (ids, records, vectors) - list node_id, list JSON node, ma trận float32 (n, dim).
+        """
+        for chunk in self.manifest["chunks"]:
+            file_path = os.path.join(self.path, chunk["file"])
+            if verify and file_sha256(file_path) != chunk["sha256"]:
+                raise ValueError(f"Chunk {chunk['file']} bi hong (sai sha256).")
+            with np.load(file_path, allow_pickle=False) as data:
+                vectors = data["vectors"].astype(np.float32)
+                ids = data["ids"].tolist()
+                offsets = data["offsets"]
+                blob = zlib.decompress(data["nodes"].tobytes())
+            records = [blob[offsets[i]:offsets[i + 1]].decode("utf-8") for i in range(len(ids))]
+            yield ids, records, vectors
+
+    def iter_nodes(self, verify=True):
+        """
+        Đọc lần lượt từng chunk dưới dạng node đã gắn sẵn embedding (không cần gọi API embedding).
+
+        Yields:
+            list: Các node (TextNode...) của một chunk.
+        """
+        for _, records, vectors in self.iter_chunks(verify=verify):
+            nodes = []
+            for record, vector in zip(records, vectors):
+                node = metadata_dict_to_node(json.loads(record))
+                node.embedding = vector.tolist()
+                nodes.append(node)
+            yield nodes
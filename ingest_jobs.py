@@ -0,0 +1,294 @@
+import hashlib
+import os
+import socket
+import sqlite3
+import threading
+import time
+
+DEFAULT_JOBS_PATH = os.path.join(".cache", "jobs.sqlite")
+DEFAULT_UPLOAD_DIR = os.path.join(".cache", "uploads")
+STALE_AFTER = 120   # Giây không có heartbeat thì coi worker đã chết: job đang chạy được đưa lại vào hàng đợi
+MAX_ATTEMPTS = 3    # Số lần chạy tối đa của một job (tính cả các lần worker chết giữa chừng)
+
+
+class JobQueue:
+    def __init__(self, path=DEFAULT_JOBS_PATH, upload_dir=DEFAULT_UPLOAD_DIR, stale_after=STALE_AFTER):
+        """
+        Hàng đợi job nạp tài liệu lưu trên SQLite, dùng chung giữa app Streamlit (gửi job, xem tiến độ)
+        và các process worker (ingest_worker.py) chạy việc nạp ở nền.
+
+        Mỗi job gồm nhiều file; trạng thái từng file được ghi ngay khi nạp xong nên job bị ngắt giữa
+        chừng (worker chết, máy khởi động lại) chỉ nạp tiếp các file còn lại. File được lưu theo hash
+        nội dung: gửi lại file đã nạp hoặc đang chờ nạp sẽ được bỏ qua.
+
+        Args:
+            path (str): File SQLite của hàng đợi.
+            upload_dir (str): Thư mục lưu file upload (mỗi file một thư mục con theo hash).
+            stale_after (float): Số giây không có heartbeat thì job đang chạy bị coi là bỏ dở.
+        """
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self.upload_dir = upload_dir
+        self.stale_after = stale_after
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.executescript(
+            """
+            PRAGMA journal_mode=WAL;
+            CREATE TABLE IF NOT EXISTS jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                status TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                started_at REAL,
+                finished_at REAL,
+                heartbeat REAL,
+                worker TEXT,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                message TEXT
+            );
+            CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status, id);
+            CREATE TABLE IF NOT EXISTS job_files (
+                job_id INTEGER NOT NULL,
+                sha256 TEXT NOT NULL,
+                name TEXT NOT NULL,
+                path TEXT NOT NULL,
+                status TEXT NOT NULL,
+                error TEXT,
+                updated_at REAL,
+                PRIMARY KEY (job_id, sha256)
+            );
+            CREATE INDEX IF NOT EXISTS idx_job_files_sha ON job_files(sha256, status);
+            CREATE TABLE IF NOT EXISTS workers (worker TEXT PRIMARY KEY, pid INTEGER, heartbeat REAL);
+            """
+        )
+
+    def _transaction(self):
+        # BEGIN IMMEDIATE: khóa ghi ngay từ đầu, nên hai process không thể cùng nhận một job
+        self._conn.execute("BEGIN IMMEDIATE")
+
+    def submit(self, files):
+        """
+        Gửi một job nạp các file upload.
+
+        Args:
+            files (list): Danh sách (tên file, nội dung bytes).
+        Returns:
+            int: ID của job. File trùng nội dung với file đã nạp/đang chờ được đánh dấu "duplicate";
+                nếu mọi file đều trùng thì job hoàn thành ngay.
+        """
+        now = time.time()
+        rows = []
+        for name, data in files:
+            sha = hashlib.sha256(data).hexdigest()
+            name = os.path.basename(name)
+            # Giữ tên gốc (pdf_chunker lấy file_name/arXiv ID từ tên file), thư mục theo hash để không đè nhau
+            path = os.path.join(self.upload_dir, sha[:16], name)
+            if not os.path.exists(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                tmp_path = path + ".tmp"
+                with open(tmp_path, "wb") as f:
+                    f.write(data)
+                os.replace(tmp_path, path)
+            rows.append((sha, name, path))
+        with self._lock:
+            self._transaction()
+            try:
+                job_id = self._conn.execute(
+                    "INSERT INTO jobs (status, created_at) VALUES ('queued', ?)", (now,)
+                ).lastrowid
+                seen = set()
+                for sha, name, path in rows:
+                    taken = sha in seen or self._conn.execute(
+                        "SELECT 1 FROM job_files WHERE sha256 = ? AND status IN ('queued', 'running', 'done') LIMIT 1",
+                        (sha,),
+                    ).fetchone()
+                    seen.add(sha)
+                    self._conn.execute(
+                        "INSERT OR IGNORE INTO job_files VALUES (?, ?, ?, ?, ?, NULL, ?)",
+                        (job_id, sha, name, path, "duplicate" if taken else "queued", now),
+                    )
+                if not self._conn.execute(
+                    "SELECT 1 FROM job_files WHERE job_id = ? AND status = 'queued'", (job_id,)
+                ).fetchone():
+                    self._conn.execute(
+                        "UPDATE jobs SET status = 'done', finished_at = ?, message = ? WHERE id = ?",
+                        (now, "Tat ca file da duoc nap truoc do.", job_id),
+                    )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return job_id
+
+    def requeue_stale(self):
+        """
+        Đưa các job đang chạy nhưng mất heartbeat (worker đã chết) về hàng đợi; job đã chạy
+        quá MAX_ATTEMPTS lần thì đánh dấu lỗi. File đã nạp xong của job giữ nguyên trạng thái "done".
+
+        Returns:
+            int: Số job được đưa lại vào hàng đợi.
+        """
+        cutoff = time.time() - self.stale_after
+        with self._lock:
+            self._transaction()
+            try:
+                self._conn.execute(
+                    "UPDATE jobs SET status = 'failed', finished_at = ?, message = ? "
+                    "WHERE status = 'running' AND heartbeat < ? AND attempts >= ?",
+                    (time.time(), "Worker dung giua chung qua nhieu lan.", cutoff, MAX_ATTEMPTS),
+                )
+                count = self._conn.execute(
+                    "UPDATE jobs SET status = 'queued', worker = NULL WHERE status = 'running' AND heartbeat < ?",
+                    (cutoff,),
+                ).rowcount
+                self._conn.execute(
+                    "UPDATE job_files SET status = 'queued' WHERE status = 'running' AND job_id IN "
+                    "(SELECT id FROM jobs WHERE status = 'queued')"
+                )
+                self._conn.execute(
+                    "UPDATE job_files SET status = 'failed', error = 'Worker dung giua chung' WHERE status = 'running' "
+                    "AND job_id IN (SELECT id FROM jobs WHERE status = 'failed')"
+                )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return count
+
+    def claim(self, worker):
+        """
+        Nhận job cũ nhất đang chờ (nguyên tử giữa các process).
+
+        Args:
+            worker (str): Tên worker nhận job.
+        Returns:
+            dict: Job (xem get()) với các file cần nạp đã chuyển sang "running", hoặc None nếu không có job.
+        """
+        self.requeue_stale()
+        now = time.time()
+        with self._lock:
+            self._transaction()
+            try:
+                row = self._conn.execute("SELECT id FROM jobs WHERE status = 'queued' ORDER BY id LIMIT 1").fetchone()
+                if row is None:
+                    self._conn.execute("COMMIT")
+                    return None
+                job_id = row["id"]
+                self._conn.execute(
+                    "UPDATE jobs SET status = 'running', worker = ?, heartbeat = ?, attempts = attempts + 1, "
+                    "started_at = COALESCE(started_at, ?) WHERE id = ?",
+                    (worker, now, now, job_id),
+                )
+                self._conn.execute(
+                    "UPDATE job_files SET status = 'running', updated_at = ? WHERE job_id = ? AND status = 'queued'",
+                    (now, job_id),
+                )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return self.get(job_id)
+
+    def heartbeat(self, job_id=None, worker=None):
+        """Báo worker (và job đang chạy của nó) vẫn còn sống."""
+        now = time.time()
+        with self._lock:
+            if job_id is not None:
+                self._conn.execute("UPDATE jobs SET heartbeat = ? WHERE id = ? AND status = 'running'", (now, job_id))
+            if worker is not None:
+                self._conn.execute("INSERT OR REPLACE INTO workers VALUES (?, ?, ?)", (worker, os.getpid(), now))
+
+    def remove_worker(self, worker):
+        with self._lock:
+            self._conn.execute("DELETE FROM workers WHERE worker = ?", (worker,))
+
+    def live_workers(self):
+        """Danh sách worker còn heartbeat gần đây."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT worker FROM workers WHERE heartbeat >= ?", (time.time() - self.stale_after,)
+            ).fetchall()
+        return [row["worker"] for row in rows]
+
+    def set_file_status(self, job_id, sha256, status, error=None):
+        """Ghi trạng thái một file của job ("done", "failed"...)."""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE job_files SET status = ?, error = ?, updated_at = ? WHERE job_id = ? AND sha256 = ?",
+                (status, error, time.time(), job_id, sha256),
+            )
+
+    def finish(self, job_id, message=None):
+        """
+        Kết thúc job: "done" nếu mọi file đã nạp xong (hoặc trùng), ngược lại "failed".
+
+        Returns:
+            str: Trạng thái cuối của job.
+        """
+        with self._lock:
+            failed = self._conn.execute(
+                "SELECT COUNT(*) FROM job_files WHERE job_id = ? AND status NOT IN ('done', 'duplicate')", (job_id,)
+            ).fetchone()[0]
+            status = "failed" if failed else "done"
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, finished_at = ?, message = ? WHERE id = ?",
+                (status, time.time(), message, job_id),
+            )
+        return status
+
+    def retry(self, job_id):
+        """Đưa job lỗi về hàng đợi, chỉ nạp lại các file chưa xong."""
+        with self._lock:
+            self._transaction()
+            try:
+                self._conn.execute(
+                    "UPDATE jobs SET status = 'queued', attempts = 0, finished_at = NULL, message = NULL "
+                    "WHERE id = ? AND status = 'failed'",
+                    (job_id,),
+                )
+                self._conn.execute(
+                    "UPDATE job_files SET status = 'queued', error = NULL WHERE job_id = ? AND status IN ('failed', 'running')",
+                    (job_id,),
+                )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def get(self, job_id):
+        """
+        Trạng thái của một job.
+
+        Returns:
+            dict: Các cột của job kèm "files" (danh sách dict name/sha256/path/status/error)
+                và "progress" (số file đã xử lý xong / tổng số file), None nếu không có job.
+        """
+        with self._lock:
+            job = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if job is None:
+                return None
+            files = self._conn.execute(
+                "SELECT name, sha256, path, status, error FROM job_files WHERE job_id = ? ORDER BY rowid", (job_id,)
+            ).fetchall()
+        job = dict(job)
+        job["files"] = [dict(f) for f in files]
+        finished = sum(f["status"] in ("done", "duplicate", "failed") for f in job["files"])
+        job["progress"] = (finished, len(job["files"]))
+        return job
+
+    def recent(self, limit=10):
+        """Các job gần nhất (mới nhất trước)."""
+        with self._lock:
+            ids = [row["id"] for row in self._conn.execute("SELECT id FROM jobs ORDER BY id DESC LIMIT ?", (limit,))]
+        return [self.get(job_id) for job_id in ids]
+
+    def pending_count(self):
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM jobs WHERE status IN ('queued', 'running')"
+            ).fetchone()[0]
+
+
+def default_worker_name():
+    return f"{socket.gethostname()}-{os.getpid()}"
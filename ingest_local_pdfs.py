@@ -1,19 +1,30 @@
-from constants import embed_model
-from index_manager_pinecone import IndexManagerPinecone
+from constants import PINECONE_INDEX_NAME, get_embed_model, get_index_manager
+from instrumentation import setup_instrumentation
 import os
+import sys
 
 def main():
+    setup_instrumentation()
     # 1. Init Manager
-    # Đảm bảo tên index khớp với tên bạn đã tạo trên Pinecone (mặc định là arxiv-research)
-    index_name = "arxiv-research" 
-    print(f"Khoi tao ket noi Pinecone voi index: {index_name}...")
-    
+    # Chạy với tham số --local để nạp vào index local (local_index/) thay vì Pinecone
     try:
-        index_manager = IndexManagerPinecone(embed_model, index_name=index_name)
+        # Chỉ SDK của backend được chọn mới được nạp (--local không cần import Pinecone)
+        if "--local" in sys.argv:
+            print("Khoi tao index local tai thu muc: local_index/...")
+            index_manager = get_index_manager("local")
+        else:
+            # Đảm bảo tên index khớp với tên bạn đã tạo trên Pinecone (constants.PINECONE_INDEX_NAME)
+            print(f"Khoi tao ket noi Pinecone voi index: {PINECONE_INDEX_NAME}...")
+            index_manager = get_index_manager("pinecone")
     except Exception as e:
         print(f"Loi ket noi: {e}")
         return
 
+    # Chạy với --rebuild-keyword-index để dựng lại chỉ mục BM25 và metadata từ các file đã nạp (không gọi API embedding)
+    if "--rebuild-keyword-index" in sys.argv:
+        index_manager.rebuild_keyword_index()
+        return
+
     # 2. Kiem tra thu muc papers
     if not os.path.exists("papers"):
         os.makedirs("papers")
@@ -30,12 +41,17 @@ def main():
         return
 
     print(f"Tim thay {file_count} file PDF: {pdf_files}")
-    print("Bat dau nap du lieu vao Pinecone (viec nay co the mat vai phut)...")
+    print("Bat dau nap du lieu (chi nap cac file moi hoac da thay doi)...")
 
     # 3. Tao Index (Ham nay da duoc nang cap de doc folder papers/)
     index_manager.create_index()
     
-    print("XONG! Toan bo hang da duoc chuyen len Pinecone.")
+    print("XONG! Toan bo hang da duoc nap vao Index.")
+    embed_model = get_embed_model()
+    if hasattr(embed_model, "stats"):
+        stats = embed_model.stats()
+        print(f"Embedding cache: {stats['hits']} hit / {stats['misses']} miss "
+              f"(hit rate {stats['hit_rate']:.1%}, {stats['entries']} ban ghi).")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,134 @@
+import hashlib
+import json
+import os
+
+DEFAULT_MANIFEST_PATH = os.path.join(".cache", "ingest_manifest.json")
+MANIFEST_VERSION = 1
+
+
+def file_sha256(path, block_size=1 << 20):
+    """Tính SHA-256 của nội dung file (đọc theo từng khối để không tốn RAM)."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def doc_id_prefix(path, sha):
+    """
+    Tiền tố doc_id cho các chunk của một file: hash của (đường dẫn, hash nội dung).
+    Hai file giống hệt nhau ở hai đường dẫn khác nhau có doc_id khác nhau, nên xóa/nạp lại
+    file này không đụng tới vector của file kia.
+    """
+    return hashlib.sha256(f"{os.path.normpath(path)}\x00{sha}".encode("utf-8")).hexdigest()
+
+
+def embed_model_name(embed_model):
+    """Lấy tên model embedding để đưa vào fingerprint của manifest."""
+    return getattr(embed_model, "model_name", None) or type(embed_model).__name__
+
+
+class IngestManifest:
+    def __init__(self, path=DEFAULT_MANIFEST_PATH, chunk_size=1024, chunk_overlap=50, model_name="", chunker=""):
+        """
+        Sổ ghi chép (manifest) các file đã được nạp vào vector store.
+
+        Mỗi file được định danh bằng hash nội dung + cấu hình chunking + tên embed model.
+        Chỉ khi một trong các yếu tố này thay đổi thì file mới cần nạp lại.
+
+        Args:
+            path (str): Đường dẫn file JSON lưu manifest.
+            chunk_size (int): Kích thước chunk đang dùng.
+            chunk_overlap (int): Độ chồng lặp giữa các chunk.
+            model_name (str): Tên model embedding.
+            chunker (str): Tên cách chia chunk (ví dụ "structured-v1"), đổi cách chia thì nạp lại.
+        """
+        self.path = path
+        self.fingerprint = f"{chunk_size}:{chunk_overlap}:{model_name}"
+        if chunker:
+            self.fingerprint += f":{chunker}"
+        self.files = {}
+        self.load()
+
+    def load(self):
+        """Đọc manifest từ ổ cứng (nếu có)."""
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Manifest bi loi, se nap lai tu dau: {e}")
+            return
+        if data.get("version") == MANIFEST_VERSION:
+            self.files = data.get("files", {})
+
+    def save(self):
+        """Ghi manifest xuống ổ cứng (ghi file tạm rồi rename để tránh hỏng file)."""
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"version": MANIFEST_VERSION, "files": self.files}, f, ensure_ascii=False, indent=1)
+        os.replace(tmp_path, self.path)
+
+    def file_hash(self, path):
+        """
+        Trả về hash nội dung của file, dùng lại hash cũ nếu size và mtime không đổi
+        (tránh phải đọc lại hàng nghìn file PDF mỗi lần chạy).
+        """
+        stat = os.stat(path)
+        entry = self.files.get(self._key(path))
+        if entry and entry.get("size") == stat.st_size and entry.get("mtime") == stat.st_mtime:
+            return entry["sha256"]
+        return file_sha256(path)
+
+    def diff(self, file_paths):
+        """
+        So sánh danh sách file hiện có với manifest.
+
+        Returns:
+            tuple: (changed, removed)
+                - changed: list (path, sha256) các file mới hoặc đã thay đổi.
+                - removed: list path các file có trong manifest nhưng đã bị xóa.
+        """
+        changed = []
+        seen = set()
+        for path in file_paths:
+            key = self._key(path)
+            seen.add(key)
+            sha = self.file_hash(path)
+            entry = self.files.get(key)
+            if entry is None or entry["sha256"] != sha or entry.get("fingerprint") != self.fingerprint:
+                changed.append((path, sha))
+        removed = [key for key in self.files if key not in seen]
+        return changed, removed
+
+    def doc_ids(self, path):
+        """Danh sách doc_id đã được nạp cho file này (dùng để xóa vector cũ)."""
+        entry = self.files.get(self._key(path))
+        return list(entry.get("doc_ids", [])) if entry else []
+
+    def record(self, path, sha, doc_ids, key=None):
+        """
+        Ghi nhận file đã được nạp thành công.
+
+        Args:
+            key (str): Khóa trong manifest (mặc định là đường dẫn file), ví dụ tên file upload.
+        """
+        stat = os.stat(path)
+        self.files[self._key(key or path)] = {
+            "sha256": sha,
+            "fingerprint": self.fingerprint,
+            "size": stat.st_size,
+            "mtime": stat.st_mtime,
+            "doc_ids": list(doc_ids),
+        }
+
+    def forget(self, path):
+        """Xóa file khỏi manifest."""
+        self.files.pop(self._key(path), None)
+
+    @staticmethod
+    def _key(path):
+        return os.path.normpath(path)
@@ -0,0 +1,236 @@
+import asyncio
+import os
+import queue
+import threading
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from llama_index.core import SimpleDirectoryReader
+from llama_index.core.node_parser import SentenceSplitter
+
+from async_ingest import AsyncIngestEngine
+from ingest_manifest import doc_id_prefix
+from metadata_index import enrich_metadata
+from minhash_dedup import MinHashDeduper
+from pdf_chunker import assign_pages, load_pdf_documents
+
+_DONE = object()  # Sentinel báo hiệu stage trước đã chạy xong
+
+
+def chunk_id(i, doc):
+    """id tất định cho chunk thứ i của document, để nạp lại cùng file sẽ ghi đè đúng vector cũ."""
+    return f"{doc.id_}_chunk_{i}"
+
+
+def parse_file(path, doc_id_prefix, chunk_size=1024, chunk_overlap=50, structured=True):
+    """
+    Đọc một file và chia thành các chunk (chạy trong process con).
+
+    Args:
+        path (str): Đường dẫn file cần đọc.
+        doc_id_prefix (str): Tiền tố doc_id của các trang/mục (xem ingest_manifest.doc_id_prefix).
+        chunk_size (int): Kích thước chunk.
+        chunk_overlap (int): Độ chồng lặp giữa các chunk.
+        structured (bool): PDF được cắt theo mục, bỏ header/footer và tài liệu tham khảo
+            (xem pdf_chunker); False = một Document mỗi trang như SimpleDirectoryReader.
+    Returns:
+        tuple: (path, danh sách doc_id, danh sách node)
+    """
+    docs = load_pdf_documents(path, doc_id_prefix) if structured and path.lower().endswith(".pdf") else []
+    if not docs:
+        docs = SimpleDirectoryReader(input_files=[path]).load_data()
+        for i, doc in enumerate(docs):
+            doc.id_ = f"{doc_id_prefix}_part_{i}"
+    splitter = SentenceSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap, id_func=chunk_id)
+    nodes = assign_pages(splitter.get_nodes_from_documents(docs))
+    return path, [doc.id_ for doc in docs], nodes
+
+
+def iter_parsed_files(jobs, chunk_size=1024, chunk_overlap=50, max_workers=None, max_pending=None, structured=True):
+    """
+    Đọc và chia chunk nhiều file song song bằng process pool, trả kết quả dạng generator.
+
+    Chỉ có tối đa max_pending file được xử lý/chờ cùng lúc: khi bên tiêu thụ chậm lại,
+    việc đọc file mới cũng dừng lại (back-pressure), nên RAM không tăng theo số file.
+
+    Args:
+        jobs (list): Danh sách (path, sha256 nội dung file); doc_id được đặt theo doc_id_prefix(path, sha256).
+        max_workers (int): Số process (mặc định = số CPU).
+        max_pending (int): Số file tối đa đang xử lý/chờ (mặc định = 2 * max_workers).
+        structured (bool): Cắt PDF theo mục (xem parse_file).
+    Yields:
+        tuple: (path, doc_ids, nodes) theo thứ tự file nào xong trước trả về trước.
+    """
+    jobs = list(jobs)
+    if not jobs:
+        return
+    max_workers = max_workers or os.cpu_count() or 1
+    max_pending = max_pending or 2 * max_workers
+    with ProcessPoolExecutor(max_workers=min(max_workers, len(jobs))) as pool:
+        pending = set()
+        job_iter = iter(jobs)
+        while True:
+            for path, sha in job_iter:
+                prefix = doc_id_prefix(path, sha)
+                pending.add(pool.submit(parse_file, path, prefix, chunk_size, chunk_overlap, structured))
+                if len(pending) >= max_pending:
+                    break
+            if not pending:
+                return
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
+
+
+class IngestPipeline:
+    def __init__(self, embed_model, vector_store, chunk_size=1024, chunk_overlap=50,
+                 max_workers=None, queue_size=4, keyword_index=None, structured=True, dedup_threshold=0.9,
+                 metadata_index=None, paper_store=None, **engine_kwargs):
+        """
+        Pipeline nạp tài liệu dạng streaming: đọc file (process pool) -> embed -> upsert.
+
+        Việc đọc file chạy ở thread hiện tại, còn embed/upsert do AsyncIngestEngine đảm nhận
+        ở một thread riêng; hai bên nối với nhau bằng hàng đợi có giới hạn (queue_size batch),
+        nên stage nhanh sẽ tự chờ stage chậm.
+
+        Args:
+            embed_model (BaseEmbedding): Model embedding.
+            vector_store: Vector store của LlamaIndex (ví dụ PineconeVectorStore).
+            max_workers (int): Số process đọc file (mặc định = số CPU).
+            queue_size (int): Số batch tối đa chờ giữa hai stage.
+            keyword_index (BM25Index): Chỉ mục từ khóa được nạp cùng lúc với vector store (optional).
+            structured (bool): Cắt PDF theo mục kèm metadata title/section/page/arxiv_id (xem pdf_chunker).
+            dedup_threshold (float): Bỏ chunk gần trùng (Jaccard MinHash >= ngưỡng) với chunk khác của cùng
+                file trước khi embed; None = không lọc. Không lọc trùng giữa các file: nếu không, chunk của
+                file B bị bỏ vì trùng file A sẽ biến mất khỏi index khi A bị xóa, và kết quả phụ thuộc thứ tự nạp.
+            metadata_index (MetadataIndex): Chỉ mục metadata để lọc trước khi tìm kiếm (optional).
+            paper_store (PaperStore): Kho metadata arXiv để bổ sung tác giả/category/ngày đăng
+                cho chunk của PDF có arXiv ID (optional).
+            **engine_kwargs: Tham số cho AsyncIngestEngine (embed_batch_size,
+                max_concurrent_embeds, requests_per_minute, max_retries...).
+        """
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.max_workers = max_workers
+        self.queue_size = queue_size
+        self.keyword_index = keyword_index
+        self.structured = structured
+        self.dedup_threshold = dedup_threshold
+        self.metadata_index = metadata_index
+        self.paper_store = paper_store
+        self.engine = AsyncIngestEngine(embed_model, vector_store, **engine_kwargs)
+
+    def run(self, file_jobs=(), documents=(), on_file_done=None):
+        """
+        Chạy pipeline.
+
+        Args:
+            file_jobs (list): Danh sách (path, sha256) các file cần nạp.
+            documents (list): Các Document có sẵn trong bộ nhớ (ví dụ bài báo từ Arxiv).
+            on_file_done (callable): Gọi với (path, doc_ids) sau khi toàn bộ chunk
+                của file đã được upsert thành công.
+        Returns:
+            dict: Thống kê của AsyncIngestEngine kèm số file đã nạp xong ("files"),
+                danh sách file bị lỗi ("failed_files") và số chunk trùng đã bỏ ("duplicates").
+        """
+        batch_queue = queue.Queue(maxsize=self.queue_size)
+        deduper = MinHashDeduper(self.dedup_threshold) if self.dedup_threshold else None
+        owners = {}      # node_id -> path của file chứa node
+        files = {}       # path -> {"pending": số node chưa xong, "closed": đã đọc xong, "failed": có lỗi, "doc_ids": [...]}
+        result = {"files": 0, "failed_files": [], "duplicates": 0}
+        lock = threading.Lock()
+
+        def finish_file(path):
+            info = files.pop(path)
+            if info["failed"]:
+                result["failed_files"].append(path)
+                return
+            result["files"] += 1
+            if on_file_done:
+                on_file_done(path, info["doc_ids"])
+
+        def on_batch_done(nodes, error):
+            if error is None and self.keyword_index is not None:
+                self.keyword_index.add(nodes)
+            if error is None and self.metadata_index is not None:
+                self.metadata_index.add(nodes)
+            with lock:
+                for node in nodes:
+                    path = owners.pop(node.node_id, None)
+                    if path is None:
+                        continue
+                    info = files[path]
+                    info["pending"] -= 1
+                    info["failed"] = info["failed"] or error is not None
+                    if info["closed"] and info["pending"] == 0:
+                        finish_file(path)
+
+        async def batches():
+            while True:
+                item = await asyncio.to_thread(batch_queue.get)
+                if item is _DONE:
+                    return
+                yield item
+
+        def consume():
+            try:
+                result.update(self.engine.ingest(batches(), on_batch_done=on_batch_done))
+            except Exception as e:
+                result["error"] = e
+            finally:
+                # Báo cho thread đọc file dừng lại (sentinel _DONE có thể đã bị đọc rồi nên không chờ nó),
+                # rồi xả những batch còn trong hàng đợi để lệnh put đang chờ không bị kẹt
+                stopped.set()
+                while True:
+                    try:
+                        batch_queue.get_nowait()
+                    except queue.Empty:
+                        break
+
+        def put(item):
+            """Đưa batch vào hàng đợi; trả về False nếu stage embed/upsert đã dừng."""
+            while not stopped.is_set():
+                try:
+                    batch_queue.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        stopped = threading.Event()
+        consumer = threading.Thread(target=consume, daemon=True)
+        consumer.start()
+        try:
+            if documents:
+                splitter = SentenceSplitter(chunk_size=self.chunk_size, chunk_overlap=self.chunk_overlap, id_func=chunk_id)
+                nodes = splitter.get_nodes_from_documents(list(documents))
+                put(deduper.filter(nodes) if deduper else nodes)
+            parsed = iter_parsed_files(
+                file_jobs,
+                chunk_size=self.chunk_size,
+                chunk_overlap=self.chunk_overlap,
+                max_workers=self.max_workers,
+                structured=self.structured,
+            )
+            for path, doc_ids, nodes in parsed:
+                if stopped.is_set():
+                    break
+                enrich_metadata(nodes, self.paper_store)
+                if deduper:
+                    deduper.reset()
+                    nodes = deduper.filter(nodes)
+                with lock:
+                    files[path] = {"pending": len(nodes), "closed": False, "failed": False, "doc_ids": doc_ids}
+                    owners.update((node.node_id, path) for node in nodes)
+                if not put(nodes):
+                    break
+                with lock:
+                    files[path]["closed"] = True
+                    if files[path]["pending"] == 0:
+                        finish_file(path)
+        finally:
+            put(_DONE)
+            consumer.join()
+        result["duplicates"] = deduper.dropped if deduper else 0
+        if "error" in result:
+            raise result.pop("error")
+        return result
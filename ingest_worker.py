@@ -0,0 +1,144 @@
+import argparse
+import multiprocessing
+import os
+import subprocess
+import sys
+import threading
+import time
+
+from constants import get_index_manager
+from ingest_jobs import JobQueue, default_worker_name
+
+# Worker nạp tài liệu ở nền: lấy job từ hàng đợi SQLite (.cache/jobs.sqlite) do app Streamlit gửi,
+# nạp từng file vào index và ghi tiến độ của từng file. Worker chết giữa chừng thì job được worker
+# khác (hoặc lần chạy sau) nhận lại và chỉ nạp tiếp các file chưa xong.
+# Chạy: python ingest_worker.py [--local] [--workers 1] [--once]
+# Index local (--local hoặc INDEX_BACKEND=local) chỉ cho một process ghi, nên luôn chạy 1 worker.
+
+
+def process_job(queue, index_manager, job, worker):
+    """
+    Nạp các file đang chờ của một job, ghi trạng thái từng file ngay khi xong.
+
+    Returns:
+        str: Trạng thái cuối của job ("done" / "failed").
+    """
+    files = {f["path"]: f for f in job["files"] if f["status"] == "running"}
+    if not files:
+        # Job được nhận lại sau khi worker trước đã nạp xong mọi file
+        return queue.finish(job["id"], "Tat ca file da duoc nap.")
+    print(f"[{worker}] Job #{job['id']}: nap {len(files)} file (lan thu {job['attempts']})...")
+    stop = threading.Event()
+
+    def keep_alive():
+        # Nạp có thể mất vài phút: heartbeat định kỳ để job không bị coi là bỏ dở
+        while not stop.wait(max(queue.stale_after / 4, 1)):
+            queue.heartbeat(job["id"], worker)
+
+    def on_file_done(path, doc_ids):
+        queue.set_file_status(job["id"], files[path]["sha256"], "done")
+        print(f"[{worker}] Job #{job['id']}: xong {os.path.basename(path)}")
+
+    beat = threading.Thread(target=keep_alive, daemon=True)
+    beat.start()
+    try:
+        success, message = index_manager.ingest_uploaded_files(list(files), on_file_done=on_file_done)
+    except Exception as e:
+        success, message = False, f"Gap loi khi nap file: {e}"
+    finally:
+        stop.set()
+        beat.join()
+    done = {f["sha256"] for f in queue.get(job["id"])["files"] if f["status"] == "done"}
+    for file in files.values():
+        if file["sha256"] not in done:
+            queue.set_file_status(job["id"], file["sha256"], "failed", message)
+    status = queue.finish(job["id"], message)
+    print(f"[{worker}] Job #{job['id']}: {status} - {message}")
+    return status
+
+
+def worker_loop(local, poll_interval=2.0, once=False, jobs_path=None):
+    """
+    Vòng lặp của một worker: nhận job, nạp, lặp lại. Index manager (kết nối vector store)
+    chỉ được tạo khi có job đầu tiên và dùng lại cho các job sau.
+
+    Args:
+        local (bool): Nạp vào index local thay vì Pinecone.
+        poll_interval (float): Số giây chờ giữa hai lần kiểm tra hàng đợi khi không có job.
+        once (bool): Xử lý hết các job đang chờ rồi thoát.
+        jobs_path (str): File SQLite của hàng đợi (mặc định .cache/jobs.sqlite).
+    """
+    queue = JobQueue(jobs_path) if jobs_path else JobQueue()
+    worker = default_worker_name()
+    index_manager = None
+    print(f"[{worker}] Worker bat dau, cho job trong {queue.path}...")
+    try:
+        while True:
+            queue.heartbeat(worker=worker)
+            job = queue.claim(worker)
+            if job is None:
+                if once:
+                    return
+                time.sleep(poll_interval)
+                continue
+            if index_manager is None:
+                from instrumentation import setup_instrumentation
+
+                setup_instrumentation()
+                index_manager = get_index_manager("local" if local else "pinecone")
+            process_job(queue, index_manager, job, worker)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        queue.remove_worker(worker)
+
+
+def ensure_worker(queue, local=None):
+    """
+    Khởi động một process worker ở nền nếu chưa có worker nào đang chạy (gọi từ app Streamlit).
+    local: backend của worker (None = theo INDEX_BACKEND, giống app).
+
+    Returns:
+        bool: True nếu vừa khởi động worker mới.
+    """
+    if queue.live_workers():
+        return False
+    if local is None:
+        local = os.getenv("INDEX_BACKEND", "pinecone") == "local"
+    args = [sys.executable, os.path.abspath(__file__)] + (["--local"] if local else [])
+    # Process tách riêng (session mới): không bị dừng khi Streamlit chạy lại script hay đóng trang
+    subprocess.Popen(args, cwd=os.path.dirname(os.path.abspath(__file__)), start_new_session=True,
+                     stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    # Giữ chỗ trong lúc worker mới khởi động (nạp thư viện mất vài giây), tránh khởi động trùng
+    queue.heartbeat(worker="starting")
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Worker nap tai lieu o nen tu hang doi job.")
+    parser.add_argument("--local", action="store_true", default=os.getenv("INDEX_BACKEND", "pinecone") == "local",
+                        help="Nap vao index local (local_index/) thay vi Pinecone")
+    parser.add_argument("--workers", type=int, default=1, help="So process worker (chi Pinecone)")
+    parser.add_argument("--poll", type=float, default=2.0, help="So giay giua hai lan kiem tra hang doi")
+    parser.add_argument("--once", action="store_true", help="Xu ly het job dang cho roi thoat")
+    args = parser.parse_args()
+
+    workers = args.workers
+    if args.local and workers > 1:
+        print("Index local chi cho mot process ghi: chay 1 worker.")
+        workers = 1
+    if workers == 1:
+        worker_loop(args.local, args.poll, args.once)
+        return
+    processes = [
+        multiprocessing.Process(target=worker_loop, args=(args.local, args.poll, args.once))
+        for _ in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+
+
+if __name__ == "__main__":
+    main()
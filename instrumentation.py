@@ -0,0 +1,335 @@
+import contextvars
+import functools
+import inspect
+import json
+import os
+import threading
+import time
+import uuid
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Any
+
+from llama_index.core.bridge.pydantic import PrivateAttr
+from llama_index.core.instrumentation import get_dispatcher
+from llama_index.core.instrumentation.event_handlers import BaseEventHandler
+
+DEFAULT_TRACE_PATH = os.path.join(".cache", "traces.jsonl")
+DEFAULT_METRICS_PATH = os.path.join(".cache", "metrics.prom")
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+
+class Span:
+    def __init__(self, name, trace_id=None, parent_id=None, attrs=None, start=None):
+        """Một khoảng thời gian được đo (một bước trong lượt chat, lần gọi LLM, truy vấn vector store...)."""
+        self.name = name
+        self.trace_id = trace_id or uuid.uuid4().hex
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent_id
+        self.attrs = dict(attrs or {})
+        self.start = start if start is not None else time.time()
+        self.duration_ms = None
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start": self.start,
+            "duration_ms": self.duration_ms,
+            "attrs": self.attrs,
+        }
+
+
+class JSONLExporter:
+    def __init__(self, path=DEFAULT_TRACE_PATH):
+        """Ghi mỗi span đã kết thúc thành một dòng JSON (nối vào cuối file)."""
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+
+    def __call__(self, span):
+        line = json.dumps(span.to_dict(), ensure_ascii=False, default=str)
+        with self._lock, open(self.path, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+
+
+class TurnTrace:
+    """Các span của một lượt (chat hoặc nạp dữ liệu), dùng để hiển thị bảng thời gian theo từng bước."""
+
+    def __init__(self, root):
+        self.root = root
+        self.spans = []
+
+    def breakdown(self):
+        """
+        Tổng hợp theo tên span.
+
+        Returns:
+            dict: {"total_ms", "llm_calls", "tokens_in", "tokens_out",
+                   "stages": [{"name", "count", "total_ms"}, ...] (giảm dần theo thời gian)}.
+                   Span lồng nhau được tính cả ở span cha lẫn span con.
+        """
+        stages = defaultdict(lambda: {"count": 0, "total_ms": 0.0})
+        tokens_in = tokens_out = llm_calls = 0
+        for span in self.spans:
+            if span is self.root:
+                continue
+            stage = stages[span.name]
+            stage["count"] += 1
+            stage["total_ms"] += span.duration_ms or 0.0
+            if span.name == "llm":
+                llm_calls += 1
+                tokens_in += span.attrs.get("tokens_in", 0)
+                tokens_out += span.attrs.get("tokens_out", 0)
+        return {
+            "total_ms": self.root.duration_ms,
+            "llm_calls": llm_calls,
+            "tokens_in": tokens_in,
+            "tokens_out": tokens_out,
+            "stages": sorted(
+                ({"name": name, **values} for name, values in stages.items()),
+                key=lambda s: -s["total_ms"],
+            ),
+        }
+
+
+class Tracer:
+    def __init__(self, exporters=None, metrics_path=None):
+        """
+        Bộ đo span và counter dùng chung cho cả process.
+
+        Args:
+            exporters (list): Các hàm nhận span đã kết thúc (ví dụ JSONLExporter).
+            metrics_path (str): File Prometheus text để ghi counter (None = không ghi).
+        """
+        self.exporters = list(exporters or [])
+        self.metrics_path = metrics_path
+        self._lock = threading.Lock()
+        self._counters = defaultdict(float)   # (tên, labels) -> giá trị
+        self._durations = defaultdict(lambda: [0, 0.0])  # tên span -> [số lần, tổng ms]
+        self._turns = {}  # trace_id -> TurnTrace đang thu thập
+
+    def add_exporter(self, exporter):
+        self.exporters.append(exporter)
+
+    def incr(self, name, value=1, **labels):
+        """Tăng counter (ví dụ incr("embedding_cache_hits_total", 3))."""
+        with self._lock:
+            self._counters[(name, tuple(sorted(labels.items())))] += value
+
+    def counters(self):
+        with self._lock:
+            return {(name, labels): value for (name, labels), value in self._counters.items()}
+
+    def _finish(self, span):
+        with self._lock:
+            stats = self._durations[span.name]
+            stats[0] += 1
+            stats[1] += span.duration_ms
+            turn = self._turns.get(span.trace_id)
+            if turn is not None:
+                turn.spans.append(span)
+        for exporter in self.exporters:
+            try:
+                exporter(span)
+            except Exception as e:
+                print(f"Loi khi ghi span {span.name}: {e}")
+
+    @contextmanager
+    def span(self, name, **attrs):
+        """Đo một đoạn code: with tracer.span("vector_store.query", backend="pinecone") as span: ..."""
+        parent = _current_span.get()
+        span = Span(name, parent.trace_id if parent else None, parent.span_id if parent else None, attrs)
+        token = _current_span.set(span)
+        start = time.perf_counter()
+        try:
+            yield span
+        except BaseException as e:
+            span.attrs["error"] = type(e).__name__
+            raise
+        finally:
+            span.duration_ms = (time.perf_counter() - start) * 1000
+            _current_span.reset(token)
+            self._finish(span)
+
+    def record_span(self, name, start, duration_ms, **attrs):
+        """Ghi một span đã được đo ở nơi khác (ví dụ từ sự kiện bắt đầu/kết thúc của LlamaIndex)."""
+        parent = _current_span.get()
+        span = Span(name, parent.trace_id if parent else None, parent.span_id if parent else None, attrs, start)
+        span.duration_ms = duration_ms
+        self._finish(span)
+        return span
+
+    @contextmanager
+    def turn(self, name, **attrs):
+        """
+        Span gốc của một lượt; mọi span con (kể cả trong task/thread tạo ra bên trong) được gom lại.
+
+        Yields:
+            TurnTrace: Gọi breakdown() sau khi lượt kết thúc.
+        """
+        root = Span(name, attrs=attrs)
+        trace = TurnTrace(root)
+        with self._lock:
+            self._turns[root.trace_id] = trace
+        token = _current_span.set(root)
+        start = time.perf_counter()
+        try:
+            yield trace
+        finally:
+            root.duration_ms = (time.perf_counter() - start) * 1000
+            _current_span.reset(token)
+            with self._lock:
+                self._turns.pop(root.trace_id, None)
+            self._finish(root)
+            self.write_prometheus()
+
+    def write_prometheus(self, path=None):
+        """Ghi counter và tổng thời gian theo span ra file Prometheus text format (ghi đè)."""
+        path = path or self.metrics_path
+        if not path:
+            return
+        lines = []
+        with self._lock:
+            names = sorted({name for name, _ in self._counters})
+            for name in names:
+                lines.append(f"# TYPE {name} counter")
+                for (counter, labels), value in sorted(self._counters.items()):
+                    if counter == name:
+                        label_str = ",".join(f'{k}="{v}"' for k, v in labels)
+                        lines.append(f"{name}{{{label_str}}} {value:g}" if label_str else f"{name} {value:g}")
+            lines.append("# TYPE span_duration_ms summary")
+            for span_name, (count, total) in sorted(self._durations.items()):
+                lines.append(f'span_duration_ms_count{{span="{span_name}"}} {count}')
+                lines.append(f'span_duration_ms_sum{{span="{span_name}"}} {total:.3f}')
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(tmp_path, path)
+
+
+tracer = Tracer()
+
+
+def traced(name=None, **attrs):
+    """Decorator đo thời gian mỗi lần gọi hàm (đồng bộ hoặc async) bằng tracer.span."""
+    def decorator(fn):
+        span_name = name or fn.__qualname__
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                with tracer.span(span_name, **attrs):
+                    return await fn(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with tracer.span(span_name, **attrs):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def _token_usage(response, messages_text, tokenizer):
+    """Số token vào/ra: lấy từ usage của Gemini nếu có, không thì ước lượng bằng tokenizer."""
+    raw = getattr(response, "raw", None) or {}
+    if not isinstance(raw, dict):
+        raw = getattr(raw, "__dict__", {}) or {}
+    usage = raw.get("usage_metadata") or raw.get("usage") or {}
+    if not isinstance(usage, dict):
+        usage = getattr(usage, "__dict__", {}) or {}
+    tokens_in = usage.get("prompt_token_count") or usage.get("prompt_tokens")
+    tokens_out = usage.get("candidates_token_count") or usage.get("completion_tokens")
+    if tokens_in is not None and tokens_out is not None:
+        return int(tokens_in), int(tokens_out), False
+    text_out = ""
+    if response is not None:
+        message = getattr(response, "message", None)
+        text_out = (message.content if message is not None else getattr(response, "text", "")) or ""
+    return len(tokenizer(messages_text)), len(tokenizer(text_out)), True
+
+
+class LlamaIndexEventHandler(BaseEventHandler):
+    """
+    Chuyển sự kiện instrumentation của LlamaIndex thành span/counter của Tracer:
+    gọi LLM (token vào/ra), embedding, retrieval và tổng hợp câu trả lời.
+    """
+
+    _tracer: Any = PrivateAttr()
+    _open: Any = PrivateAttr(default_factory=dict)
+    _tokenizer: Any = PrivateAttr(default=None)
+
+    def __init__(self, tracer, **kwargs: Any):
+        super().__init__(**kwargs)
+        self._tracer = tracer
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "LlamaIndexEventHandler"
+
+    def _tokens(self, text):
+        if self._tokenizer is None:
+            from llama_index.core.utils import get_tokenizer
+            self._tokenizer = get_tokenizer()
+        return self._tokenizer(text)
+
+    def handle(self, event, **kwargs: Any) -> Any:
+        name = event.class_name()
+        if not name.endswith(("StartEvent", "EndEvent")) or "InProgress" in name:
+            return
+        kind = name.replace("StartEvent", "").replace("EndEvent", "")
+        key = (kind, event.span_id)
+        if name.endswith("StartEvent"):
+            # CachedEmbedding bọc model thật: chỉ đo lần gọi model thật (cache hit/miss đã có counter riêng)
+            if kind == "Embedding" and event.model_dict.get("class_name") == "CachedEmbedding":
+                return
+            self._open[key] = (time.time(), time.perf_counter())
+            return
+        started = self._open.pop(key, None)
+        if started is None:
+            return
+        start, start_perf = started
+        duration_ms = (time.perf_counter() - start_perf) * 1000
+        if kind in ("LLMChat", "LLMCompletion"):
+            prompt = event.prompt if kind == "LLMCompletion" else "\n".join(str(m.content or "") for m in event.messages)
+            tokens_in, tokens_out, estimated = _token_usage(event.response, prompt, self._tokens)
+            self._tracer.record_span("llm", start, duration_ms, tokens_in=tokens_in, tokens_out=tokens_out,
+                                     estimated=estimated)
+            self._tracer.incr("llm_calls_total")
+            self._tracer.incr("llm_tokens_total", tokens_in, direction="in")
+            self._tracer.incr("llm_tokens_total", tokens_out, direction="out")
+        elif kind == "Embedding":
+            self._tracer.record_span("embedding", start, duration_ms, texts=len(event.chunks))
+            self._tracer.incr("embedding_calls_total")
+            self._tracer.incr("embedding_texts_total", len(event.chunks))
+        elif kind == "Retrieval":
+            self._tracer.record_span("retrieval", start, duration_ms, nodes=len(event.nodes))
+        elif kind == "Synthesize":
+            self._tracer.record_span("synthesize", start, duration_ms)
+
+
+_setup_done = False
+
+
+def setup_instrumentation(trace_path=DEFAULT_TRACE_PATH, metrics_path=DEFAULT_METRICS_PATH):
+    """
+    Bật ghi span ra file JSONL, counter ra file Prometheus text và đăng ký handler sự kiện
+    của LlamaIndex (gọi một lần khi khởi động app/script; gọi lại không có tác dụng).
+
+    Args:
+        trace_path (str): File JSONL nhận mỗi span (None = không ghi).
+        metrics_path (str): File Prometheus text, được ghi lại sau mỗi lượt (None = không ghi).
+    """
+    global _setup_done
+    if _setup_done:
+        return tracer
+    if trace_path:
+        tracer.add_exporter(JSONLExporter(trace_path))
+    tracer.metrics_path = metrics_path
+    get_dispatcher().add_event_handler(LlamaIndexEventHandler(tracer))
+    _setup_done = True
+    return tracer
@@ -0,0 +1,108 @@
+import asyncio
+from typing import Any, Sequence
+
+from llama_index.core.base.llms.types import ChatMessage, LLMMetadata
+from llama_index.core.bridge.pydantic import PrivateAttr
+from llama_index.core.llms import LLM
+
+from instrumentation import tracer
+
+
+class ConcurrencyLimitedLLM(LLM):
+    """
+    Bọc một LLM (ví dụ Gemini) để giới hạn số lời gọi async chạy cùng lúc (asyncio.Semaphore).
+
+    Agent dùng chung cho mọi phiên: khi nhiều người dùng hỏi cùng lúc, các lời gọi vượt giới hạn
+    phải chờ lượt thay vì cùng dồn lên API (dễ bị lỗi quota 429). Lời gọi stream giữ chỗ đến khi
+    stream kết thúc. Lời gọi đồng bộ không bị giới hạn (Agent và server chỉ gọi async).
+    Sự kiện instrumentation (token, thời gian) vẫn do LLM bên trong phát ra.
+    """
+
+    max_concurrency: int = 8
+
+    _inner: LLM = PrivateAttr()
+    _semaphore: asyncio.Semaphore = PrivateAttr()
+    _stats: dict = PrivateAttr()
+
+    def __init__(self, inner: LLM, max_concurrency: int = 8, **kwargs: Any):
+        super().__init__(max_concurrency=max_concurrency, **kwargs)
+        self._inner = inner
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._stats = {"calls": 0, "waited": 0, "in_flight": 0, "max_in_flight": 0}
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "ConcurrencyLimitedLLM"
+
+    @property
+    def inner(self) -> LLM:
+        return self._inner
+
+    @property
+    def metadata(self) -> LLMMetadata:
+        return self._inner.metadata
+
+    def stats(self):
+        """Số lời gọi async, số lời gọi phải chờ lượt, số đang chạy và số chạy cùng lúc nhiều nhất."""
+        return dict(self._stats)
+
+    async def _acquire(self):
+        self._stats["calls"] += 1
+        if self._semaphore.locked():
+            self._stats["waited"] += 1
+            tracer.incr("llm_concurrency_waits_total")
+        await self._semaphore.acquire()
+        self._stats["in_flight"] += 1
+        self._stats["max_in_flight"] = max(self._stats["max_in_flight"], self._stats["in_flight"])
+
+    def _release(self):
+        self._stats["in_flight"] -= 1
+        self._semaphore.release()
+
+    async def _limited(self, coro_fn, *args, **kwargs):
+        await self._acquire()
+        try:
+            return await coro_fn(*args, **kwargs)
+        finally:
+            self._release()
+
+    async def _limited_stream(self, coro_fn, *args, **kwargs):
+        await self._acquire()
+        try:
+            stream = await coro_fn(*args, **kwargs)
+        except BaseException:
+            self._release()
+            raise
+
+        async def gen():
+            try:
+                async for response in stream:
+                    yield response
+            finally:
+                self._release()
+
+        return gen()
+
+    def chat(self, messages: Sequence[ChatMessage], **kwargs: Any):
+        return self._inner.chat(messages, **kwargs)
+
+    def complete(self, prompt: str, formatted: bool = False, **kwargs: Any):
+        return self._inner.complete(prompt, formatted=formatted, **kwargs)
+
+    def stream_chat(self, messages: Sequence[ChatMessage], **kwargs: Any):
+        return self._inner.stream_chat(messages, **kwargs)
+
+    def stream_complete(self, prompt: str, formatted: bool = False, **kwargs: Any):
+        return self._inner.stream_complete(prompt, formatted=formatted, **kwargs)
+
+    async def achat(self, messages: Sequence[ChatMessage], **kwargs: Any):
+        return await self._limited(self._inner.achat, messages, **kwargs)
+
+    async def acomplete(self, prompt: str, formatted: bool = False, **kwargs: Any):
+        return await self._limited(self._inner.acomplete, prompt, formatted=formatted, **kwargs)
+
+    async def astream_chat(self, messages: Sequence[ChatMessage], **kwargs: Any):
+        return await self._limited_stream(self._inner.astream_chat, messages, **kwargs)
+
+    async def astream_complete(self, prompt: str, formatted: bool = False, **kwargs: Any):
+        return await self._limited_stream(self._inner.astream_complete, prompt, formatted=formatted, **kwargs)
@@ -0,0 +1,448 @@
+import json
+import os
+import sqlite3
+import threading
+from typing import Any, List, Optional
+
+import numpy as np
+from llama_index.core.bridge.pydantic import PrivateAttr
+from llama_index.core.schema import BaseNode
+from llama_index.core.vector_stores.types import (
+    BasePydanticVectorStore,
+    VectorStoreQuery,
+    VectorStoreQueryResult,
+)
+from llama_index.core.vector_stores.utils import (
+    build_metadata_filter_fn,
+    metadata_dict_to_node,
+    node_to_metadata_dict,
+)
+
+from instrumentation import traced
+
+SCAN_BLOCK_ROWS = 65536   # Số vector đọc mỗi lần khi quét toàn bộ (giới hạn RAM khi tìm kiếm)
+IVF_TRAIN_THRESHOLD = 4096  # Từ số vector này trở lên mới dựng chỉ mục IVF
+IVF_TRAIN_SAMPLE = 50000   # Số vector tối đa dùng để huấn luyện k-means
+
+
+def normalize_rows(matrix):
+    """Chuẩn hóa L2 từng hàng (để tích vô hướng = cosine similarity)."""
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def spherical_kmeans(vectors, n_clusters, n_iter=10, seed=0):
+    """K-means theo cosine trên các vector đã chuẩn hóa. Trả về ma trận tâm cụm (đã chuẩn hóa)."""
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), n_clusters, replace=False)].copy()
+    for _ in range(n_iter):
+        assign = np.argmax(vectors @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, vectors)
+        empty = np.bincount(assign, minlength=n_clusters) == 0
+        # Cụm rỗng được gán lại một vector ngẫu nhiên
+        sums[empty] = vectors[rng.choice(len(vectors), int(empty.sum()))]
+        centroids = normalize_rows(sums)
+    return centroids
+
+
+class MmapVectorStore(BasePydanticVectorStore):
+    """
+    Vector store lưu trên ổ cứng, không cần mạng:
+        - vectors.f32: ma trận float32 (đã chuẩn hóa) chỉ ghi nối thêm, đọc bằng np.memmap. Chỉ count hàng đầu
+          (lưu trong bảng config, commit cùng các dòng nodes) là hợp lệ; phần thừa ở cuối là vector của
+          lần add chưa commit (đang ghi ở process khác, hoặc bị ngắt giữa chừng) và bị bỏ qua.
+          Sau mỗi lần compact() là file mới vectors-<generation>.f32 (generation lưu trong bảng config).
+        - meta.sqlite: node (text + metadata), trạng thái xóa và cụm IVF của từng vector.
+        - centroids.npy: tâm cụm của chỉ mục IVF (khi số vector đủ lớn).
+
+    Tìm kiếm chỉ đọc các vector thuộc nprobe cụm gần nhất (hoặc quét theo từng khối
+    khi chưa có IVF), nên không cần nạp toàn bộ dữ liệu lên RAM.
+    """
+
+    stores_text: bool = True
+    flat_metadata: bool = False
+
+    persist_dir: str
+    nprobe: int = 8
+
+    _conn: Any = PrivateAttr()
+    _lock: Any = PrivateAttr(default_factory=threading.RLock)
+    _dim: Optional[int] = PrivateAttr(default=None)
+    _count: int = PrivateAttr(default=0)
+    _mmap: Any = PrivateAttr(default=None)
+    _centroids: Any = PrivateAttr(default=None)
+    _trained_count: int = PrivateAttr(default=0)
+    _generation: int = PrivateAttr(default=0)
+    _data_version: Any = PrivateAttr(default=None)
+
+    def __init__(self, persist_dir: str = "local_index", nprobe: int = 8, **kwargs: Any):
+        super().__init__(persist_dir=persist_dir, nprobe=nprobe, **kwargs)
+        os.makedirs(persist_dir, exist_ok=True)
+        self._conn = sqlite3.connect(os.path.join(persist_dir, "meta.sqlite"), check_same_thread=False)
+        self._conn.executescript(
+            """
+            PRAGMA journal_mode=WAL;
+            CREATE TABLE IF NOT EXISTS config (key TEXT PRIMARY KEY, value TEXT);
+            CREATE TABLE IF NOT EXISTS nodes (
+                row INTEGER PRIMARY KEY,
+                node_id TEXT NOT NULL,
+                ref_doc_id TEXT,
+                list_id INTEGER,
+                deleted INTEGER NOT NULL DEFAULT 0,
+                node_json TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_nodes_node_id ON nodes(node_id);
+            CREATE INDEX IF NOT EXISTS idx_nodes_ref_doc_id ON nodes(ref_doc_id);
+            CREATE INDEX IF NOT EXISTS idx_nodes_list ON nodes(list_id, deleted);
+            """
+        )
+        self._data_version = None
+        self._refresh()
+
+    def _refresh(self):
+        """Đọc lại số vector, số chiều và IVF nếu process khác (ví dụ ingest_worker.py) đã ghi vào index."""
+        version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+        if version == self._data_version:
+            return
+        config = dict(self._conn.execute("SELECT key, value FROM config").fetchall())
+        generation = int(config.get("generation", 0))
+        if generation != self._generation:
+            # Process khác đã compact(): số thứ tự vector trong meta.sqlite ứng với file vector mới
+            self._generation = generation
+            self._mmap = None
+        if "dim" in config:
+            self._dim = int(config["dim"])
+            if "count" in config:
+                committed = int(config["count"])
+            else:
+                # Index tạo trước khi có config "count": số hàng đã commit suy ra từ bảng nodes
+                committed = self._conn.execute("SELECT COALESCE(MAX(row), -1) + 1 FROM nodes").fetchone()[0]
+            file_rows = 0
+            if os.path.exists(self._vectors_path):
+                file_rows = os.path.getsize(self._vectors_path) // (4 * self._dim)
+            self._count = min(file_rows, committed)
+        trained_count = int(config.get("trained_count", 0))
+        if trained_count != self._trained_count or self._centroids is None:
+            self._centroids = np.load(self._centroids_path) if os.path.exists(self._centroids_path) else None
+        self._trained_count = trained_count
+        self._data_version = version
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "MmapVectorStore"
+
+    @property
+    def client(self) -> Any:
+        return self._conn
+
+    def _generation_path(self, generation):
+        return os.path.join(self.persist_dir, f"vectors-{generation}.f32" if generation else "vectors.f32")
+
+    @property
+    def _vectors_path(self):
+        return self._generation_path(self._generation)
+
+    @property
+    def _centroids_path(self):
+        return os.path.join(self.persist_dir, "centroids.npy")
+
+    def __len__(self):
+        """Số vector còn hiệu lực (chưa bị xóa)."""
+        return self._conn.execute("SELECT COUNT(*) FROM nodes WHERE deleted = 0").fetchone()[0]
+
+    def _matrix(self):
+        """Ma trận vector dạng memmap (chỉ đọc), tạo lại khi file được ghi thêm."""
+        if self._count == 0:
+            return np.zeros((0, self._dim or 0), dtype=np.float32)
+        if self._mmap is None or self._mmap.shape[0] != self._count:
+            self._mmap = np.memmap(self._vectors_path, dtype=np.float32, mode="r", shape=(self._count, self._dim))
+        return self._mmap
+
+    @traced("vector_store.add", backend="local")
+    def add(self, nodes: List[BaseNode], **add_kwargs: Any) -> List[str]:
+        """Ghi nối thêm vector và metadata. Node trùng node_id sẽ thay thế bản cũ."""
+        if not nodes:
+            return []
+        vectors = normalize_rows(np.asarray([node.get_embedding() for node in nodes], dtype=np.float32))
+        with self._lock:
+            self._refresh()
+            if self._dim is None:
+                self._dim = vectors.shape[1]
+                self._conn.execute("INSERT OR REPLACE INTO config VALUES ('dim', ?)", (str(self._dim),))
+            elif vectors.shape[1] != self._dim:
+                raise ValueError(f"Embedding co {vectors.shape[1]} chieu, index dang dung {self._dim} chieu.")
+
+            ids = [node.node_id for node in nodes]
+            self._mark_deleted("node_id", ids)
+            lists = self._assign(vectors) if self._centroids is not None else [None] * len(nodes)
+            start = self._count
+            with open(self._vectors_path, "ab") as f:
+                # Bỏ vector thừa của lần add trước bị ngắt trước khi commit, để hàng mới khớp với số thứ tự trong nodes
+                f.truncate(start * 4 * self._dim)
+                f.write(vectors.tobytes())
+            self._conn.executemany(
+                "INSERT INTO nodes (row, node_id, ref_doc_id, list_id, node_json) VALUES (?, ?, ?, ?, ?)",
+                [
+                    (
+                        start + i,
+                        node.node_id,
+                        node.ref_doc_id,
+                        None if lists[i] is None else int(lists[i]),
+                        json.dumps(node_to_metadata_dict(node, remove_text=False, flat_metadata=False)),
+                    )
+                    for i, node in enumerate(nodes)
+                ],
+            )
+            self._conn.execute("INSERT OR REPLACE INTO config VALUES ('count', ?)", (str(start + len(nodes)),))
+            self._conn.commit()
+            self._count += len(nodes)
+            if self._count >= IVF_TRAIN_THRESHOLD and self._count >= 4 * max(self._trained_count, 1):
+                self.build_ivf()
+        return ids
+
+    def delete(self, ref_doc_id: str, **delete_kwargs: Any) -> None:
+        """Xóa (đánh dấu) toàn bộ node thuộc document ref_doc_id."""
+        with self._lock:
+            self._mark_deleted("ref_doc_id", [ref_doc_id])
+            self._conn.commit()
+
+    def delete_nodes(self, node_ids: Optional[List[str]] = None, filters=None, **delete_kwargs: Any) -> None:
+        with self._lock:
+            if node_ids:
+                self._mark_deleted("node_id", node_ids)
+            if filters is not None:
+                rows = [row for row, _ in self._iter_filtered(self._alive_rows(), filters)]
+                self._conn.executemany("UPDATE nodes SET deleted = 1 WHERE row = ?", [(r,) for r in rows])
+            self._conn.commit()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM nodes")
+            self._conn.execute("DELETE FROM config WHERE key IN ('trained_count', 'count')")
+            self._conn.commit()
+            self._mmap = None
+            open(self._vectors_path, "wb").close()
+            if os.path.exists(self._centroids_path):
+                os.remove(self._centroids_path)
+            self._count = 0
+            self._centroids = None
+            self._trained_count = 0
+
+    def _mark_deleted(self, column, values):
+        for start in range(0, len(values), 500):
+            batch = values[start:start + 500]
+            placeholders = ",".join("?" * len(batch))
+            self._conn.execute(
+                f"UPDATE nodes SET deleted = 1 WHERE deleted = 0 AND {column} IN ({placeholders})", batch
+            )
+
+    def _alive_rows(self, column=None, values=None):
+        if column is None:
+            rows = self._conn.execute("SELECT row FROM nodes WHERE deleted = 0").fetchall()
+        else:
+            rows = []
+            for start in range(0, len(values), 500):
+                batch = list(values[start:start + 500])
+                placeholders = ",".join("?" * len(batch))
+                rows += self._conn.execute(
+                    f"SELECT row FROM nodes WHERE deleted = 0 AND {column} IN ({placeholders})", batch
+                ).fetchall()
+        return np.array(sorted(r for (r,) in rows), dtype=np.int64)
+
+    def build_ivf(self, n_lists=None):
+        """
+        (Re)build chỉ mục IVF: huấn luyện k-means trên một mẫu vector rồi gán cụm cho mọi vector.
+        Được gọi tự động khi số vector tăng gấp 4 lần so với lần huấn luyện trước.
+        """
+        with self._lock:
+            matrix = self._matrix()
+            n = matrix.shape[0]
+            if n == 0:
+                return
+            n_lists = n_lists or int(min(4096, max(16, 4 * np.sqrt(n))))
+            rng = np.random.default_rng(0)
+            sample_rows = np.sort(rng.choice(n, min(n, IVF_TRAIN_SAMPLE), replace=False))
+            centroids = spherical_kmeans(np.asarray(matrix[sample_rows]), min(n_lists, len(sample_rows)))
+            self._centroids = centroids
+            for start in range(0, n, SCAN_BLOCK_ROWS):
+                block = np.asarray(matrix[start:start + SCAN_BLOCK_ROWS])
+                lists = self._assign(block)
+                self._conn.executemany(
+                    "UPDATE nodes SET list_id = ? WHERE row = ?",
+                    [(int(lists[i]), start + i) for i in range(len(block))],
+                )
+            np.save(self._centroids_path, centroids)
+            self._trained_count = n
+            self._conn.execute("INSERT OR REPLACE INTO config VALUES ('trained_count', ?)", (str(n),))
+            self._conn.commit()
+
+    def _assign(self, vectors):
+        return np.argmax(vectors @ self._centroids.T, axis=1)
+
+    def _candidate_rows(self, query_vector, query):
+        """Các hàng cần chấm điểm: theo node_ids/doc_ids nếu có, theo IVF nếu đã dựng, nếu không thì None (quét hết)."""
+        if query.node_ids:
+            return self._alive_rows("node_id", query.node_ids)
+        if query.doc_ids:
+            return self._alive_rows("ref_doc_id", query.doc_ids)
+        if self._centroids is None:
+            return None
+        nprobe = min(self.nprobe, len(self._centroids))
+        lists = np.argpartition(-(self._centroids @ query_vector), nprobe - 1)[:nprobe]
+        return self._alive_rows("list_id", [int(x) for x in lists])
+
+    def _score(self, query_vector, rows, limit):
+        """Trả về (rows, scores) của limit vector có điểm cao nhất, sắp xếp giảm dần."""
+        matrix = self._matrix()
+        if rows is None:
+            deleted = {r for (r,) in self._conn.execute("SELECT row FROM nodes WHERE deleted = 1")}
+            best_rows = np.zeros(0, dtype=np.int64)
+            best_scores = np.zeros(0, dtype=np.float32)
+            for start in range(0, matrix.shape[0], SCAN_BLOCK_ROWS):
+                scores = np.asarray(matrix[start:start + SCAN_BLOCK_ROWS]) @ query_vector
+                block_rows = np.arange(start, start + len(scores))
+                if deleted:
+                    alive = ~np.isin(block_rows, list(deleted))
+                    scores, block_rows = scores[alive], block_rows[alive]
+                best_rows = np.concatenate([best_rows, block_rows])
+                best_scores = np.concatenate([best_scores, scores])
+                if len(best_scores) > limit:
+                    keep = np.argpartition(-best_scores, limit - 1)[:limit]
+                    best_rows, best_scores = best_rows[keep], best_scores[keep]
+        else:
+            # Hàng do process khác vừa commit sau lần _refresh() của truy vấn này: chưa có trong ma trận
+            best_rows = rows[rows < matrix.shape[0]]
+            rows = best_rows
+            best_scores = np.asarray(matrix[rows]) @ query_vector if len(rows) else np.zeros(0, dtype=np.float32)
+            if len(best_scores) > limit:
+                keep = np.argpartition(-best_scores, limit - 1)[:limit]
+                best_rows, best_scores = best_rows[keep], best_scores[keep]
+        order = np.argsort(-best_scores)
+        return best_rows[order], best_scores[order]
+
+    def _load_nodes(self, rows):
+        """
+        Đọc node từ sqlite theo danh sách hàng.
+
+        Returns:
+            dict: row -> node, theo thứ tự của rows; hàng không có trong nodes (vector chưa commit) bị bỏ qua.
+        """
+        found = {}
+        rows = [int(r) for r in rows]
+        for start in range(0, len(rows), 500):
+            batch = rows[start:start + 500]
+            placeholders = ",".join("?" * len(batch))
+            for row, node_json in self._conn.execute(
+                f"SELECT row, node_json FROM nodes WHERE row IN ({placeholders})", batch
+            ):
+                found[row] = metadata_dict_to_node(json.loads(node_json))
+        return {r: found[r] for r in rows if r in found}
+
+    def _iter_filtered(self, rows, filters):
+        """Lọc các hàng theo MetadataFilters, trả về (row, node)."""
+        nodes = self._load_nodes(rows)
+        keep = build_metadata_filter_fn(lambda row: nodes[row].metadata, filters)
+        return [(row, node) for row, node in nodes.items() if keep(row)]
+
+    @traced("vector_store.query", backend="local")
+    def query(self, query: VectorStoreQuery, **kwargs: Any) -> VectorStoreQueryResult:
+        with self._lock:
+            self._refresh()
+        if query.query_embedding is None or self._count == 0:
+            return VectorStoreQueryResult(nodes=[], similarities=[], ids=[])
+        query_vector = normalize_rows(np.asarray([query.query_embedding], dtype=np.float32))[0]
+        top_k = query.similarity_top_k
+        with self._lock:
+            candidates = self._candidate_rows(query_vector, query)
+            # Khi có bộ lọc metadata thì lấy dư ứng viên rồi lọc lại
+            limit = top_k * 10 if query.filters is not None else top_k
+            rows, scores = self._score(query_vector, candidates, limit)
+            if query.filters is not None:
+                kept = dict(self._iter_filtered(rows, query.filters))
+                pairs = [(r, s) for r, s in zip(rows, scores) if int(r) in kept][:top_k]
+                nodes = [kept[int(r)] for r, _ in pairs]
+                scores = [s for _, s in pairs]
+            else:
+                found = self._load_nodes(rows)
+                pairs = [(r, s) for r, s in zip(rows, scores) if int(r) in found]
+                nodes = [found[int(r)] for r, _ in pairs]
+                scores = [s for _, s in pairs]
+        return VectorStoreQueryResult(
+            nodes=nodes,
+            similarities=[float(s) for s in scores],
+            ids=[node.node_id for node in nodes],
+        )
+
+    def iter_records(self, batch_size=SCAN_BLOCK_ROWS):
+        """
+        Đọc lần lượt mọi node còn hiệu lực kèm vector (đã chuẩn hóa), dùng để xuất snapshot.
+
+        Yields:
+            tuple: (ids, records, vectors) - list node_id, list JSON node, ma trận float32 (n, dim).
+        """
+        with self._lock:
+            self._refresh()
+            alive = self._alive_rows()
+            alive = alive[alive < self._count]
+        for start in range(0, len(alive), batch_size):
+            rows = alive[start:start + batch_size]
+            with self._lock:
+                matrix = self._matrix()
+                vectors = np.asarray(matrix[rows])
+                found = {}
+                for offset in range(0, len(rows), 500):
+                    batch = [int(r) for r in rows[offset:offset + 500]]
+                    placeholders = ",".join("?" * len(batch))
+                    for row, node_id, node_json in self._conn.execute(
+                        f"SELECT row, node_id, node_json FROM nodes WHERE row IN ({placeholders})", batch
+                    ):
+                        found[row] = (node_id, node_json)
+            ids = [found[int(r)][0] for r in rows]
+            records = [found[int(r)][1] for r in rows]
+            yield ids, records, vectors
+
+    def compact(self):
+        """
+        Ghi lại file vector, bỏ hẳn các vector đã bị xóa, rồi dựng lại IVF nếu cần.
+
+        Vector còn hiệu lực được ghi sang file của generation mới; việc đánh lại số thứ tự trong meta.sqlite
+        và chuyển sang generation mới nằm trong cùng một transaction. Dừng giữa chừng thì index vẫn dùng
+        file cũ và meta.sqlite cũ (file mới dở dang bị xóa ở lần compact sau).
+        """
+        with self._lock:
+            self._refresh()
+            old_path = self._vectors_path
+            new_path = self._generation_path(self._generation + 1)
+            for name in os.listdir(self.persist_dir):
+                path = os.path.join(self.persist_dir, name)
+                if name.startswith("vectors") and name.endswith(".f32") and path != old_path:
+                    os.remove(path)
+            alive = self._alive_rows()
+            matrix = self._matrix()
+            with open(new_path, "wb") as f:
+                for start in range(0, len(alive), SCAN_BLOCK_ROWS):
+                    f.write(np.asarray(matrix[alive[start:start + SCAN_BLOCK_ROWS]]).tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+            try:
+                self._conn.execute("DELETE FROM nodes WHERE deleted = 1")
+                self._conn.executemany(
+                    "UPDATE nodes SET row = ? WHERE row = ?", [(i, int(r)) for i, r in enumerate(alive)]
+                )
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO config VALUES ('generation', ?)", (str(self._generation + 1),)
+                )
+                self._conn.execute("INSERT OR REPLACE INTO config VALUES ('count', ?)", (str(len(alive)),))
+                self._conn.commit()
+            except BaseException:
+                self._conn.rollback()
+                raise
+            self._generation += 1
+            self._mmap = None
+            self._count = len(alive)
+            if os.path.exists(old_path):
+                os.remove(old_path)
+            if self._centroids is not None:
+                self.build_ivf()
@@ -0,0 +1,256 @@
+import os
+import re
+import sqlite3
+import threading
+import unicodedata
+
+from llama_index.core.vector_stores.types import FilterOperator, MetadataFilter, MetadataFilters
+
+DEFAULT_METADATA_INDEX_PATH = os.path.join(".cache", "metadata.sqlite")
+FILTER_KEYS = ("category", "author", "published_after", "published_before", "arxiv_id")
+# Metadata không cần đưa vào văn bản được embed (vẫn lưu trên node để lọc/hiển thị)
+EMBED_EXCLUDED_KEYS = ["arxiv_id", "categories", "published_day", "pdf_url", "arxiv_url", "doi"]
+_NEW_STYLE_ID_RE = re.compile(r"^(\d{2})(\d{2})\.\d{4,5}$")
+
+
+def base_arxiv_id(arxiv_id):
+    """'2401.01234v2' -> '2401.01234'"""
+    return re.sub(r"v\d+$", "", (arxiv_id or "").strip())
+
+
+def author_key(name):
+    """Khóa so khớp tác giả: họ (từ cuối của tên), viết thường, bỏ dấu ("Chun-Xiao Liu" -> "liu")."""
+    name = unicodedata.normalize("NFKD", name or "").encode("ascii", "ignore").decode()
+    words = re.findall(r"[a-z][a-z'\-]*", name.lower())
+    return words[-1] if words else ""
+
+
+def day_number(value):
+    """
+    Đổi ngày dạng "2026-01-28", "2026-01", "2026" hoặc ISO datetime thành số nguyên YYYYMMDD
+    (kiểu số để Pinecone lọc được theo khoảng $gte/$lte).
+    """
+    match = re.match(r"^\s*(\d{4})(?:-(\d{1,2}))?(?:-(\d{1,2}))?", str(value or ""))
+    if not match:
+        raise ValueError(f"Ngay khong hop le: {value!r} (dung dang YYYY-MM-DD)")
+    year, month, day = match.group(1), match.group(2) or 1, match.group(3) or 1
+    return int(year) * 10000 + int(month) * 100 + int(day)
+
+
+def day_from_arxiv_id(arxiv_id):
+    """Ngày (YYYYMM01) suy ra từ arXiv ID kiểu mới ("2601.20263" -> 20260101), None nếu không suy ra được."""
+    match = _NEW_STYLE_ID_RE.match(base_arxiv_id(arxiv_id))
+    if not match:
+        return None
+    return (2000 + int(match.group(1))) * 10000 + int(match.group(2)) * 100 + 1
+
+
+def paper_metadata(paper):
+    """
+    Metadata phẳng (chỉ str/int, để Pinecone lưu được) của một bài báo arXiv (dict từ ArxivFetcher).
+    Danh sách tác giả/category được nối thành chuỗi; lọc theo chúng dùng MetadataIndex.
+    """
+    published = (paper.get("published") or "")[:10]
+    metadata = {
+        "arxiv_id": base_arxiv_id(paper.get("arxiv_id", "")),
+        "title": paper.get("title", ""),
+        "authors": "; ".join(paper.get("authors", [])),
+        "primary_category": paper.get("primary_category") or "",
+        "categories": " ".join(paper.get("categories") or [paper.get("primary_category") or ""]).strip(),
+        "published": published,
+        "pdf_url": paper.get("pdf_url") or "",
+        "arxiv_url": paper.get("arxiv_url") or "",
+        "doi": paper.get("doi") or "",
+    }
+    if published:
+        metadata["published_day"] = day_number(published)
+    return metadata
+
+
+def enrich_metadata(nodes, store=None):
+    """
+    Bổ sung metadata cho chunk có arxiv_id (ví dụ PDF trong papers/): tác giả, category, ngày đăng
+    lấy từ kho metadata arXiv (PaperStore) nếu đã có; nếu không thì ngày đăng suy ra từ arXiv ID.
+
+    Args:
+        nodes (list): Các node cần bổ sung (sửa trực tiếp).
+        store (PaperStore): Kho metadata arXiv (None = không tra cứu).
+    Returns:
+        list: Chính danh sách nodes.
+    """
+    papers = {}
+    for node in nodes:
+        arxiv_id = base_arxiv_id(node.metadata.get("arxiv_id"))
+        if not arxiv_id or "published_day" in node.metadata:
+            continue
+        if store is not None and arxiv_id not in papers:
+            papers[arxiv_id] = store.get_latest(arxiv_id)
+        paper = papers.get(arxiv_id)
+        extra = paper_metadata(paper) if paper else {}
+        if "published_day" not in extra and day_from_arxiv_id(arxiv_id):
+            extra["published_day"] = day_from_arxiv_id(arxiv_id)
+        for key, value in extra.items():
+            node.metadata.setdefault(key, value)
+        node.excluded_embed_metadata_keys = list(dict.fromkeys(node.excluded_embed_metadata_keys + EMBED_EXCLUDED_KEYS))
+    return nodes
+
+
+def normalize_filters(filters):
+    """Bỏ các bộ lọc rỗng, kiểm tra tên bộ lọc và định dạng ngày."""
+    result = {}
+    for key, value in (filters or {}).items():
+        if key not in FILTER_KEYS:
+            raise ValueError(f"Bo loc khong hop le: {key} (ho tro: {', '.join(FILTER_KEYS)})")
+        if value is None or str(value).strip() == "":
+            continue
+        value = str(value).strip()
+        if key in ("published_after", "published_before"):
+            day_number(value)
+        result[key] = value
+    return result
+
+
+def to_metadata_filters(filters, ref_doc_ids=None):
+    """
+    Chuyển bộ lọc của tool RAG thành MetadataFilters để đẩy xuống vector store.
+
+    Ngày đăng và arXiv ID là trường số/chuỗi đơn nên lọc trực tiếp được (cả Pinecone).
+    Tác giả và category là danh sách: nếu có ref_doc_ids (đã lọc sẵn bằng MetadataIndex) thì
+    dùng "ref_doc_id IN ..." thay thế, nếu không thì khớp chuỗi (chỉ vector store trong bộ nhớ hỗ trợ).
+
+    Args:
+        filters (dict): {"category", "author", "published_after", "published_before", "arxiv_id"}.
+        ref_doc_ids (list): Các document thỏa bộ lọc, tính từ MetadataIndex (optional).
+    Returns:
+        MetadataFilters: Hoặc None nếu không có bộ lọc nào.
+    """
+    filters = normalize_filters(filters)
+    items = []
+    if "published_after" in filters:
+        items.append(MetadataFilter(key="published_day", value=day_number(filters["published_after"]),
+                                    operator=FilterOperator.GTE))
+    if "published_before" in filters:
+        items.append(MetadataFilter(key="published_day", value=day_number(filters["published_before"]),
+                                    operator=FilterOperator.LTE))
+    if "arxiv_id" in filters:
+        items.append(MetadataFilter(key="arxiv_id", value=base_arxiv_id(filters["arxiv_id"])))
+    if ref_doc_ids is not None:
+        items.append(MetadataFilter(key="ref_doc_id", value=list(ref_doc_ids), operator=FilterOperator.IN))
+    else:
+        if "category" in filters:
+            items.append(MetadataFilter(key="categories", value=filters["category"], operator=FilterOperator.TEXT_MATCH))
+        if "author" in filters:
+            items.append(MetadataFilter(key="authors", value=author_key(filters["author"]),
+                                        operator=FilterOperator.TEXT_MATCH))
+    return MetadataFilters(filters=items) if items else None
+
+
+class MetadataIndex:
+    def __init__(self, path=DEFAULT_METADATA_INDEX_PATH):
+        """
+        Chỉ mục metadata của các chunk (SQLite) để lọc trước khi tìm kiếm vector/BM25:
+        mỗi chunk một dòng (arxiv_id, category chính, ngày đăng) cùng bảng phụ các giá trị
+        danh sách (họ tác giả, category) có index, nên lọc chỉ là vài truy vấn theo index.
+
+        Args:
+            path (str): File SQLite chứa chỉ mục.
+        """
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.executescript(
+            """
+            PRAGMA journal_mode=WAL;
+            CREATE TABLE IF NOT EXISTS chunks (
+                node_id TEXT PRIMARY KEY,
+                ref_doc_id TEXT,
+                arxiv_id TEXT,
+                published_day INTEGER
+            );
+            CREATE INDEX IF NOT EXISTS idx_chunks_ref_doc_id ON chunks(ref_doc_id);
+            CREATE INDEX IF NOT EXISTS idx_chunks_arxiv_id ON chunks(arxiv_id);
+            CREATE INDEX IF NOT EXISTS idx_chunks_published ON chunks(published_day);
+            CREATE TABLE IF NOT EXISTS chunk_values (
+                node_id TEXT NOT NULL, kind TEXT NOT NULL, value TEXT NOT NULL);
+            CREATE INDEX IF NOT EXISTS idx_values ON chunk_values(kind, value);
+            CREATE INDEX IF NOT EXISTS idx_values_node ON chunk_values(node_id);
+            """
+        )
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+
+    def add(self, nodes):
+        """Thêm (hoặc thay thế theo node_id) metadata của các chunk."""
+        rows, values = [], []
+        for node in nodes:
+            metadata = node.metadata
+            arxiv_id = base_arxiv_id(metadata.get("arxiv_id")) or None
+            published_day = metadata.get("published_day") or day_from_arxiv_id(arxiv_id)
+            rows.append((node.node_id, node.ref_doc_id, arxiv_id, published_day))
+            authors = [a for a in str(metadata.get("authors") or "").split(";") if a.strip()]
+            values += [(node.node_id, "author", key) for key in {author_key(a) for a in authors} if key]
+            categories = set(str(metadata.get("categories") or "").split())
+            if metadata.get("primary_category"):
+                categories.add(metadata["primary_category"])
+            values += [(node.node_id, "category", c.lower()) for c in categories]
+        with self._lock:
+            self._delete_nodes([row[0] for row in rows])
+            self._conn.executemany("INSERT INTO chunks VALUES (?, ?, ?, ?)", rows)
+            self._conn.executemany("INSERT INTO chunk_values VALUES (?, ?, ?)", values)
+            self._conn.commit()
+
+    def _delete_nodes(self, node_ids):
+        for start in range(0, len(node_ids), 500):
+            batch = node_ids[start:start + 500]
+            placeholders = ",".join("?" * len(batch))
+            self._conn.execute(f"DELETE FROM chunks WHERE node_id IN ({placeholders})", batch)
+            self._conn.execute(f"DELETE FROM chunk_values WHERE node_id IN ({placeholders})", batch)
+
+    def delete(self, ref_doc_id):
+        """Xóa metadata của mọi chunk thuộc document ref_doc_id."""
+        with self._lock:
+            node_ids = [n for (n,) in self._conn.execute("SELECT node_id FROM chunks WHERE ref_doc_id = ?", (ref_doc_id,))]
+            self._delete_nodes(node_ids)
+            self._conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM chunks")
+            self._conn.execute("DELETE FROM chunk_values")
+            self._conn.commit()
+
+    def match(self, filters):
+        """
+        Tìm các chunk thỏa mọi bộ lọc.
+
+        Args:
+            filters (dict): {"category", "author" (so theo họ), "published_after",
+                "published_before" (YYYY-MM-DD), "arxiv_id"}.
+        Returns:
+            list: [(node_id, ref_doc_id), ...]
+        """
+        filters = normalize_filters(filters)
+        where, params = [], []
+        if "published_after" in filters:
+            where.append("published_day >= ?")
+            params.append(day_number(filters["published_after"]))
+        if "published_before" in filters:
+            where.append("published_day <= ?")
+            params.append(day_number(filters["published_before"]))
+        if "arxiv_id" in filters:
+            where.append("arxiv_id = ?")
+            params.append(base_arxiv_id(filters["arxiv_id"]))
+        for kind, value in (("category", filters.get("category", "").lower()),
+                            ("author", author_key(filters.get("author", "")))):
+            if value:
+                where.append("node_id IN (SELECT node_id FROM chunk_values WHERE kind = ? AND value = ?)")
+                params += [kind, value]
+        sql = "SELECT node_id, ref_doc_id FROM chunks"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
@@ -0,0 +1,94 @@
+import hashlib
+import re
+
+import numpy as np
+
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+_MAX_HASH = np.uint64((1 << 32) - 1)
+_WORD_RE = re.compile(r"\w+")
+
+
+def shingles(text, size=5):
+    """Tập các cụm size từ liên tiếp (đã viết thường) của văn bản."""
+    tokens = _WORD_RE.findall(text.lower())
+    if len(tokens) < size:
+        return {" ".join(tokens)} if tokens else set()
+    return {" ".join(tokens[i:i + size]) for i in range(len(tokens) - size + 1)}
+
+
+class MinHashDeduper:
+    def __init__(self, threshold=0.9, num_perm=128, bands=32, shingle_size=5, seed=1):
+        """
+        Loại chunk gần trùng lặp (boilerplate, đoạn lặp giữa các phiên bản bài báo...) trước khi embed.
+
+        Mỗi chunk được tóm tắt bằng chữ ký MinHash (num_perm giá trị), chia thành bands dải
+        để tìm nhanh ứng viên (LSH); chunk bị coi là trùng khi độ tương đồng Jaccard ước lượng
+        với một chunk đã giữ >= threshold.
+
+        Args:
+            threshold (float): Ngưỡng Jaccard (trên tập cụm shingle_size từ) để coi là trùng.
+            num_perm (int): Số hàm băm của chữ ký MinHash.
+            bands (int): Số dải LSH (num_perm phải chia hết cho bands).
+            shingle_size (int): Số từ mỗi cụm.
+            seed (int): Seed sinh hàm băm (cố định để kết quả tất định).
+        """
+        if num_perm % bands:
+            raise ValueError("num_perm phai chia het cho bands")
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_size = shingle_size
+        rng = np.random.RandomState(seed)
+        self._a = rng.randint(1, 1 << 61, num_perm, dtype=np.uint64)
+        self._b = rng.randint(0, 1 << 61, num_perm, dtype=np.uint64)
+        self._buckets = [{} for _ in range(bands)]
+        self._signatures = []
+        self.dropped = 0
+
+    def reset(self):
+        """Quên các chunk đã gặp (giữ bộ đếm dropped), dùng khi chỉ lọc trùng trong từng file."""
+        self._buckets = [{} for _ in range(self.bands)]
+        self._signatures = []
+
+    def signature(self, text):
+        """Chữ ký MinHash của văn bản (None nếu văn bản không có từ nào)."""
+        grams = shingles(text, self.shingle_size)
+        if not grams:
+            return None
+        hashes = np.fromiter(
+            (int.from_bytes(hashlib.blake2b(g.encode(), digest_size=4).digest(), "little") for g in grams),
+            dtype=np.uint64,
+            count=len(grams),
+        )
+        with np.errstate(over="ignore"):
+            values = (np.outer(hashes, self._a) + self._b) % _MERSENNE_PRIME
+        return np.bitwise_and(values, _MAX_HASH).min(axis=0)
+
+    def is_duplicate(self, text):
+        """
+        Kiểm tra văn bản có gần trùng với văn bản đã thấy trước đó không; nếu không thì ghi nhớ nó.
+
+        Returns:
+            bool: True nếu là bản trùng (nên bỏ qua).
+        """
+        signature = self.signature(text)
+        if signature is None:
+            return False
+        keys = [signature[i * self.rows:(i + 1) * self.rows].tobytes() for i in range(self.bands)]
+        candidates = set()
+        for bucket, key in zip(self._buckets, keys):
+            candidates.update(bucket.get(key, ()))
+        for i in candidates:
+            if np.mean(self._signatures[i] == signature) >= self.threshold:
+                self.dropped += 1
+                return True
+        index = len(self._signatures)
+        self._signatures.append(signature)
+        for bucket, key in zip(self._buckets, keys):
+            bucket.setdefault(key, []).append(index)
+        return False
+
+    def filter(self, nodes):
+        """Giữ lại các node không trùng với node đã thấy (theo thứ tự đưa vào)."""
+        return [node for node in nodes if not self.is_duplicate(node.get_content())]
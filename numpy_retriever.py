@@ -0,0 +1,166 @@
+import asyncio
+from typing import List
+
+import numpy as np
+from llama_index.core.retrievers import BaseRetriever
+from llama_index.core.schema import NodeWithScore, QueryBundle
+
+BLOCK_ROWS = 16384  # Số hàng giải lượng tử hóa mỗi lần (giữ RAM tạm thời nhỏ khi dùng float16/int8)
+
+
+class QuantizedMatrix:
+    def __init__(self, vectors, dtype="float32"):
+        """
+        Ma trận embedding liền khối đã chuẩn hóa L2, lưu ở float32, float16 hoặc int8.
+
+        Với int8, mỗi hàng được lượng tử hóa đối xứng với một hệ số scale riêng
+        (x ≈ q * scale), giảm bộ nhớ 4 lần so với float32; float16 giảm 2 lần.
+
+        Args:
+            vectors (array-like): Ma trận (n, dim) các embedding.
+            dtype (str): "float32", "float16" hoặc "int8".
+        """
+        if dtype not in ("float32", "float16", "int8"):
+            raise ValueError(f"dtype khong hop le: {dtype}")
+        matrix = np.asarray(vectors, dtype=np.float32)
+        if matrix.ndim != 2:
+            matrix = matrix.reshape(len(matrix), -1)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        matrix = matrix / norms
+        self.dtype = dtype
+        self.scale = None
+        if dtype == "int8":
+            scale = np.abs(matrix).max(axis=1, keepdims=True) / 127.0
+            scale[scale == 0] = 1.0
+            self.data = np.round(matrix / scale).astype(np.int8)
+            self.scale = scale.astype(np.float32).ravel()
+        else:
+            self.data = np.ascontiguousarray(matrix.astype(dtype))
+
+    def __len__(self):
+        return self.data.shape[0]
+
+    @property
+    def nbytes(self):
+        return self.data.nbytes + (self.scale.nbytes if self.scale is not None else 0)
+
+    def scores(self, queries):
+        """Điểm cosine giữa các câu hỏi (m, dim) và mọi hàng: trả về ma trận (m, n)."""
+        if self.dtype == "float32":
+            return queries @ self.data.T
+        out = np.empty((queries.shape[0], len(self)), dtype=np.float32)
+        for start in range(0, len(self), BLOCK_ROWS):
+            block = self.data[start:start + BLOCK_ROWS].astype(np.float32)
+            out[:, start:start + len(block)] = queries @ block.T
+        if self.scale is not None:
+            out *= self.scale
+        return out
+
+
+def top_k(scores, k):
+    """Chọn k cột có điểm cao nhất cho từng hàng bằng argpartition. Trả về (indices, scores) đã sắp xếp."""
+    k = min(k, scores.shape[1])
+    if k == 0:
+        empty = np.zeros((scores.shape[0], 0))
+        return empty.astype(np.int64), empty
+    if k < scores.shape[1]:
+        part = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    else:
+        part = np.tile(np.arange(scores.shape[1]), (scores.shape[0], 1))
+    part_scores = np.take_along_axis(scores, part, axis=1)
+    order = np.argsort(-part_scores, axis=1)
+    return np.take_along_axis(part, order, axis=1), np.take_along_axis(part_scores, order, axis=1)
+
+
+class NumpyVectorRetriever(BaseRetriever):
+    def __init__(self, embed_model, node_ids, embeddings, docstore, similarity_top_k=5, dtype="float32"):
+        """
+        Retriever brute-force dùng NumPy: một phép nhân ma trận + argpartition cho mỗi (lô) câu hỏi.
+
+        Args:
+            embed_model (BaseEmbedding): Model embedding để mã hóa câu hỏi.
+            node_ids (list): id của node tương ứng với từng hàng của embeddings.
+            embeddings (array-like): Ma trận embedding (n, dim).
+            docstore: Docstore chứa nội dung node (index.docstore).
+            similarity_top_k (int): Số node trả về mỗi câu hỏi.
+            dtype (str): Kiểu lưu trữ vector: "float32", "float16" hoặc "int8".
+        """
+        super().__init__()
+        self.embed_model = embed_model
+        self.node_ids = list(node_ids)
+        self.matrix = QuantizedMatrix(embeddings, dtype=dtype)
+        self.docstore = docstore
+        self.similarity_top_k = similarity_top_k
+
+    @classmethod
+    def from_index(cls, index, similarity_top_k=5, dtype="float32", embed_model=None):
+        """Tạo retriever từ VectorStoreIndex dùng SimpleVectorStore (index trong RAM hoặc load từ index/)."""
+        embedding_dict = index.vector_store.data.embedding_dict
+        node_ids = list(embedding_dict.keys())
+        embeddings = [embedding_dict[node_id] for node_id in node_ids]
+        return cls(
+            embed_model or index._embed_model,
+            node_ids,
+            embeddings,
+            index.docstore,
+            similarity_top_k=similarity_top_k,
+            dtype=dtype,
+        )
+
+    def search(self, query_embeddings, k=None):
+        """
+        Tìm kiếm theo lô.
+
+        Args:
+            query_embeddings (array-like): Ma trận (m, dim) embedding câu hỏi.
+            k (int): Số kết quả mỗi câu hỏi (mặc định similarity_top_k).
+        Returns:
+            tuple: (indices, scores), mỗi mảng có kích thước (m, k).
+        """
+        queries = np.atleast_2d(np.asarray(query_embeddings, dtype=np.float32))
+        norms = np.linalg.norm(queries, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return top_k(self.matrix.scores(queries / norms), k or self.similarity_top_k)
+
+    def _to_nodes(self, indices, scores):
+        ids = [self.node_ids[i] for i in indices]
+        nodes = self.docstore.get_nodes(ids)
+        return [NodeWithScore(node=node, score=float(score)) for node, score in zip(nodes, scores)]
+
+    def _retrieve(self, query_bundle: QueryBundle) -> List[NodeWithScore]:
+        embedding = query_bundle.embedding
+        if embedding is None:
+            embedding = self.embed_model.get_query_embedding(query_bundle.query_str)
+        indices, scores = self.search([embedding])
+        return self._to_nodes(indices[0], scores[0])
+
+    async def _aretrieve(self, query_bundle: QueryBundle) -> List[NodeWithScore]:
+        embedding = query_bundle.embedding
+        if embedding is None:
+            embedding = await self.embed_model.aget_query_embedding(query_bundle.query_str)
+        indices, scores = await asyncio.to_thread(self.search, [embedding])
+        return self._to_nodes(indices[0], scores[0])
+
+    def retrieve_batch(self, queries):
+        """Truy vấn nhiều câu hỏi cùng lúc: embed theo lô và chấm điểm bằng một phép nhân ma trận."""
+        if hasattr(self.embed_model, "get_query_embedding_batch"):
+            # Một lời gọi batch (CachedEmbedding), thay vì một lời gọi API cho mỗi câu hỏi
+            embeddings = self.embed_model.get_query_embedding_batch(list(queries))
+        else:
+            embeddings = [self.embed_model.get_query_embedding(q) for q in queries]
+        indices, scores = self.search(embeddings)
+        return [self._to_nodes(i, s) for i, s in zip(indices, scores)]
+
+
+def recall_at_k(retriever, exact_retriever, query_embeddings, k=5):
+    """
+    Đo recall@k của retriever (ví dụ bản int8/float16) so với kết quả chính xác float32.
+
+    Returns:
+        float: Tỉ lệ trung bình số node trong top-k chính xác được retriever tìm thấy.
+    """
+    found, _ = retriever.search(query_embeddings, k)
+    exact, _ = exact_retriever.search(query_embeddings, k)
+    hits = [len(set(f) & set(e)) / max(len(e), 1) for f, e in zip(found.tolist(), exact.tolist())]
+    return float(np.mean(hits)) if hits else 1.0
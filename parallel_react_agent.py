@@ -0,0 +1,62 @@
+import re
+import uuid
+
+from llama_index.core.agent import ReActAgent
+from llama_index.core.agent.react.output_parser import parse_action_reasoning_step
+from llama_index.core.llms.llm import ToolSelection
+
+# ReActAgent gốc chỉ đọc một "Action:" mỗi bước, nên các tool độc lập (tải 3 PDF, hỏi RAG + tìm arXiv)
+# chạy lần lượt, mỗi lần thêm một lượt gọi LLM. Ở đây một bước có thể có nhiều cặp Action/Action Input:
+# workflow gửi một ToolCall cho mỗi cặp và bước call_tool (4 worker) chạy chúng đồng thời.
+
+_ACTION_RE = re.compile(r"^\s*Action:", re.MULTILINE)
+_TOOL_ORDER_KEY = "parallel_tool_ids"
+
+
+def parse_actions(output):
+    """
+    Tách đầu ra của LLM thành các bước Action (mỗi cặp Action/Action Input một bước, dùng chung Thought).
+
+    Returns:
+        list: Các ActionReasoningStep theo thứ tự xuất hiện (rỗng nếu không có Action nào).
+    """
+    starts = [match.start() for match in _ACTION_RE.finditer(output)]
+    if not starts:
+        return []
+    thought = output[:starts[0]].strip()
+    if thought.startswith("Thought:"):
+        thought = thought[len("Thought:"):].strip()
+    steps = []
+    for start, end in zip(starts, starts[1:] + [len(output)]):
+        steps.append(parse_action_reasoning_step(f"Thought: {thought or '(none)'}\n{output[start:end].strip()}"))
+    return steps
+
+
+class ParallelReActAgent(ReActAgent):
+    """ReActAgent cho phép gọi nhiều tool độc lập trong cùng một bước và chạy chúng đồng thời."""
+
+    async def take_step(self, ctx, llm_input, tools, memory):
+        output = await super().take_step(ctx, llm_input, tools, memory)
+        if not output.tool_calls:
+            return output
+        try:
+            steps = parse_actions(output.response.content or "")
+        except ValueError:
+            steps = []
+        if len(steps) > 1:
+            # Thay bước Action (chỉ đọc được cặp đầu tiên) bằng một bước cho mỗi cặp Action/Action Input
+            current_reasoning = await ctx.store.get(self.reasoning_key, default=[])
+            current_reasoning[-1:] = steps
+            await ctx.store.set(self.reasoning_key, current_reasoning)
+            output.tool_calls = [
+                ToolSelection(tool_id=str(uuid.uuid4()), tool_name=step.action, tool_kwargs=step.action_input)
+                for step in steps
+            ]
+        await ctx.store.set(_TOOL_ORDER_KEY, [call.tool_id for call in output.tool_calls])
+        return output
+
+    async def handle_tool_call_results(self, ctx, results, memory):
+        # Kết quả về theo thứ tự tool nào xong trước; xếp lại theo thứ tự Action để Observation khớp Action
+        order = {tool_id: i for i, tool_id in enumerate(await ctx.store.get(_TOOL_ORDER_KEY, default=[]))}
+        results = sorted(results, key=lambda result: order.get(result.tool_id, len(order)))
+        await super().handle_tool_call_results(ctx, results, memory)
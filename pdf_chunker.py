@@ -0,0 +1,269 @@
+import bisect
+import os
+import re
+from collections import Counter
+
+from llama_index.core import Document
+
+# Đọc PDF bài báo theo cấu trúc thay vì theo trang:
+#   - bỏ dòng lặp lại trên nhiều trang (header/footer, số trang, dấu arXiv bên lề)
+#   - bỏ danh sách tài liệu tham khảo (giữ lại phụ lục phía sau nếu có)
+#   - cắt theo mục (heading), mỗi mục thành một Document có metadata title/section/page/arxiv_id
+# Sau đó SentenceSplitter chỉ chia tiếp bên trong từng mục, chunk không còn cắt ngang hai mục.
+
+ARXIV_ID_RE = re.compile(r"arXiv:\s*(\d{4}\.\d{4,5}|[a-z\-]+(?:\.[A-Z]{2})?/\d{7})(v\d+)?", re.IGNORECASE)
+_ARXIV_STAMP_RE = re.compile(r"^arXiv:\S+\s+\[[^\]]+\]\s+\d{1,2}\s+\w{3}\s+\d{4}$")
+_PAGE_NUMBER_RE = re.compile(r"^(page\s+)?\d{1,4}(\s+of\s+\d{1,4})?$", re.IGNORECASE)
+_NUMBERED_HEADING_RE = re.compile(r"^(\d{1,2}(?:\.\d{1,2})*)\s+[A-Z]")
+_LETTERED_HEADING_RE = re.compile(r"^([IVX]{1,5}|[A-H])\.\s+[A-Z]")
+_APPENDIX_RE = re.compile(r"^(appendix|supplementary (material|information))\b", re.IGNORECASE)
+_NAMED_HEADINGS = {
+    "abstract", "introduction", "background", "related work", "preliminaries", "method", "methods",
+    "results", "discussion", "conclusion", "conclusions", "summary", "outlook", "acknowledgments",
+    "acknowledgements", "acknowledgment", "acknowledgement", "references", "bibliography",
+}
+_REFERENCE_HEADINGS = {"references", "bibliography"}
+_REFERENCE_ITEM_RE = re.compile(r"^\[(\d{1,3})\]\s")
+CHUNKER_VERSION = "structured-v1"  # Ghi vào fingerprint của manifest: đổi cách cắt thì các file được nạp lại
+FRONT_MATTER = "Front matter"  # Tên mục cho phần trước heading đầu tiên (tiêu đề, tác giả, tóm tắt)
+
+
+def normalize_line(line):
+    """Chuẩn hóa một dòng để so sánh header/footer giữa các trang (bỏ chữ số, khoảng trắng, hoa/thường)."""
+    return re.sub(r"\s+", " ", re.sub(r"\d+", "#", line)).strip().lower()
+
+
+def find_boilerplate(pages, min_pages=3, min_ratio=0.5):
+    """
+    Tìm các dòng ngắn lặp lại trên nhiều trang (header/footer, tên tạp chí, bản quyền...).
+
+    Args:
+        pages (list): Danh sách trang, mỗi trang là danh sách dòng.
+        min_pages (int): Số trang tối thiểu một dòng phải xuất hiện.
+        min_ratio (float): Tỉ lệ số trang tối thiểu một dòng phải xuất hiện.
+    Returns:
+        set: Các dòng (đã chuẩn hóa) cần bỏ.
+    """
+    counts = Counter()
+    for lines in pages:
+        counts.update({normalize_line(line) for line in lines if 0 < len(line) <= 120})
+    threshold = max(min_pages, min_ratio * len(pages))
+    return {line for line, count in counts.items() if count >= threshold}
+
+
+def heading_name(line):
+    """
+    Trả về tên mục nếu dòng trông giống heading ("2.1 Boson Sampling", "III. COHERENT ERRORS",
+    "Appendix A: ...", "References"), ngược lại trả về None.
+    """
+    line = line.strip()
+    if not line or len(line) > 90 or line.endswith((".", ",", ";", ":")) and not _APPENDIX_RE.match(line):
+        return None
+    bare = line.rstrip(".:").strip().lower()
+    if bare in _NAMED_HEADINGS:
+        return line.rstrip(".:").strip()
+    if "," in line or len(line.split()) > 14:
+        return None
+    if _APPENDIX_RE.match(line):
+        return line
+    match = _NUMBERED_HEADING_RE.match(line)
+    if match and int(match.group(1).split(".")[0]) <= 30:
+        return line
+    if _LETTERED_HEADING_RE.match(line):
+        return line
+    return None
+
+
+def join_lines(lines):
+    """Nối các dòng của một đoạn thành văn bản liền, gộp lại các từ bị ngắt bằng dấu gạch nối cuối dòng."""
+    text = ""
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        if text.endswith("-") and len(text) > 1 and text[-2].isalpha() and line[:1].islower():
+            text = text[:-1] + line
+        elif text:
+            text += " " + line
+        else:
+            text = line
+    return text
+
+
+def read_pdf_lines(path):
+    """
+    Đọc văn bản từng trang của PDF.
+
+    Returns:
+        tuple: (danh sách trang (mỗi trang là danh sách dòng), tiêu đề trong metadata PDF hoặc None)
+    """
+    from pypdf import PdfReader
+
+    reader = PdfReader(path)
+    pages = [(page.extract_text() or "").splitlines() for page in reader.pages]
+    title = None
+    if reader.metadata and reader.metadata.get("/Title"):
+        title = str(reader.metadata.get("/Title")).strip() or None
+    return pages, title
+
+
+def split_sections(pages, boilerplate=()):
+    """
+    Cắt văn bản bài báo thành các mục, bỏ header/footer và danh sách tài liệu tham khảo.
+
+    Args:
+        pages (list): Danh sách trang, mỗi trang là danh sách dòng.
+        boilerplate (set): Các dòng (đã chuẩn hóa) cần bỏ, xem find_boilerplate.
+    Returns:
+        list: Danh sách dict {"section", "text", "pages": [(vị trí ký tự, số trang), ...]}
+            ("pages" cho biết mỗi đoạn văn bản của mục bắt đầu ở trang nào, đánh số từ 1).
+    """
+    sections = []
+    current = {"section": FRONT_MATTER, "lines": [], "pages": []}
+    in_references = False
+    has_abstract = any(line.strip().lower() == "abstract" for line in pages[0]) if pages else False
+    seen_abstract = False
+
+    def start_section(name):
+        nonlocal current
+        sections.append(current)
+        current = {"section": name, "lines": [], "pages": []}
+
+    for page_number, lines in enumerate(pages, 1):
+        for line in lines:
+            stripped = line.strip()
+            if (not stripped or _PAGE_NUMBER_RE.match(stripped) or _ARXIV_STAMP_RE.match(stripped)
+                    or normalize_line(stripped) in boilerplate):
+                continue
+            name = heading_name(stripped)
+            if name and name.lower() == "abstract":
+                seen_abstract = True
+            # Trang đầu có mục Abstract: các dòng trước đó (tác giả, cơ quan "1 Institute of ...") không phải heading
+            if name and has_abstract and not seen_abstract:
+                name = None
+            if in_references:
+                if name and _APPENDIX_RE.match(name):
+                    in_references = False
+                    start_section(name)
+                continue
+            if name and name.lower() in _REFERENCE_HEADINGS:
+                in_references = True
+                continue
+            # Bài không có heading "References" (kiểu revtex): danh sách bắt đầu bằng dòng "[1] ..."
+            reference = _REFERENCE_ITEM_RE.match(stripped)
+            if reference and reference.group(1) == "1" and page_number > 1:
+                in_references = True
+                continue
+            if name:
+                start_section(name)
+            if not current["pages"] or current["pages"][-1][1] != page_number:
+                current["pages"].append((len(current["lines"]), page_number))
+            current["lines"].append(stripped)
+    sections.append(current)
+
+    result = []
+    for section in sections:
+        # Đổi chỉ số dòng sang vị trí ký tự trong văn bản đã nối
+        text, page_offsets, line_index = "", [], 0
+        for line_start, page_number in section["pages"]:
+            piece = join_lines(section["lines"][line_index:line_start])
+            text = f"{text} {piece}".strip() if piece else text
+            page_offsets.append((len(text) + 1 if text else 0, page_number))
+            line_index = line_start
+        piece = join_lines(section["lines"][line_index:])
+        text = f"{text} {piece}".strip() if piece else text
+        if text:
+            result.append({"section": section["section"], "text": text, "pages": page_offsets})
+    return result
+
+
+def _concat_sections(first, second):
+    shift = len(first["text"]) + 1
+    return {
+        "section": second["section"] if first["section"] == FRONT_MATTER else first["section"],
+        "text": first["text"] + " " + second["text"],
+        "pages": first["pages"] + [(offset + shift, page) for offset, page in second["pages"]],
+    }
+
+
+def merge_small_sections(sections, min_chars=400):
+    """
+    Gộp mục quá ngắn (thường chỉ có heading cha) vào mục liền sau, giữ tên mục đầu tiên
+    (riêng phần đầu bài - tiêu đề, tác giả - lấy tên mục liền sau, thường là Abstract).
+    """
+    merged = []
+    carry = None
+    for section in sections:
+        if carry is not None:
+            section, carry = _concat_sections(carry, section), None
+        if len(section["text"]) < min_chars:
+            carry = section
+        else:
+            merged.append(section)
+    if carry is not None:
+        merged.append(_concat_sections(merged.pop(), carry) if merged else carry)
+    return merged
+
+
+def page_at(page_offsets, char_index):
+    """Số trang chứa ký tự thứ char_index của một mục."""
+    if not page_offsets:
+        return None
+    offsets = [offset for offset, _ in page_offsets]
+    return page_offsets[max(0, bisect.bisect_right(offsets, char_index or 0) - 1)][1]
+
+
+def load_pdf_documents(path, doc_id_prefix, min_section_chars=400):
+    """
+    Đọc một PDF bài báo thành các Document theo mục (thay cho một Document mỗi trang).
+
+    Args:
+        path (str): Đường dẫn file PDF.
+        doc_id_prefix (str): Tiền tố doc_id (xem ingest_manifest.doc_id_prefix).
+        min_section_chars (int): Mục ngắn hơn sẽ được gộp vào mục liền sau.
+    Returns:
+        list: Các Document, metadata gồm file_name, title, section, arxiv_id và
+            "page_offsets" (dùng để gán số trang cho từng chunk, xem assign_pages).
+    """
+    pages, title = read_pdf_lines(path)
+    first_page = "\n".join(pages[0]) if pages else ""
+    match = ARXIV_ID_RE.search(first_page) or ARXIV_ID_RE.search(os.path.basename(path))
+    arxiv_id = match.group(1) if match else ""
+    if not title:
+        title = next((line.strip() for line in pages[0] if len(line.split()) >= 3), "") if pages else ""
+    sections = merge_small_sections(split_sections(pages, find_boilerplate(pages)), min_chars=min_section_chars)
+    file_name = os.path.basename(path)
+    docs = []
+    for i, section in enumerate(sections):
+        docs.append(Document(
+            id_=f"{doc_id_prefix}_part_{i}",
+            text=section["text"],
+            metadata={
+                "file_name": file_name,
+                "title": title,
+                "section": section["section"],
+                "arxiv_id": arxiv_id,
+                "page_offsets": section["pages"],
+            },
+            excluded_embed_metadata_keys=["file_name", "arxiv_id", "page_offsets"],
+            excluded_llm_metadata_keys=["page_offsets"],
+        ))
+    return docs
+
+
+def assign_pages(nodes):
+    """
+    Gán "page_label" (trang bắt đầu của chunk) từ page_offsets của Document gốc,
+    rồi bỏ page_offsets khỏi metadata của chunk.
+    """
+    for node in nodes:
+        page_offsets = node.metadata.pop("page_offsets", None)
+        if page_offsets is None:
+            continue
+        page = page_at(page_offsets, node.start_char_idx)
+        if page is not None:
+            node.metadata["page_label"] = str(page)
+        node.excluded_embed_metadata_keys = [k for k in node.excluded_embed_metadata_keys if k != "page_offsets"]
+        node.excluded_llm_metadata_keys = [k for k in node.excluded_llm_metadata_keys if k != "page_offsets"]
+        node.excluded_embed_metadata_keys.append("page_label")
+    return nodes
@@ -0,0 +1,121 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+# Đo thời gian khởi động nguội (process mới) đến câu trả lời đầu tiên, theo từng giai đoạn:
+#   import module -> tạo model/kết nối vector store (build_runtime) -> câu trả lời đầu tiên,
+# kèm các package import tốn thời gian nhất (python -X importtime) của app và ingest_local_pdfs.
+# Chạy: python profile_startup.py [--fake] [--question "..."] [--runs 3]
+#   --fake: LLM/embedding giả và index local tạm thời (không cần API key, không gọi mạng)
+
+FAKE_RESPONSES = [
+    'Thought: I should check the local database first.\n'
+    'Action: research_paper_query_tool\nAction Input: {"query": "quantum error correction"}',
+    "Surface codes protect logical qubits.",
+    "Thought: I can answer without using any more tools.\nAnswer: Surface codes protect logical qubits.",
+]
+
+
+def child(fake, question):
+    """Chạy trong process mới: đo từng giai đoạn khởi động rồi in kết quả dạng JSON."""
+    stages = {}
+    start = time.perf_counter()
+    from agent_runtime import build_runtime
+
+    stages["import"] = time.perf_counter() - start
+    mark = time.perf_counter()
+    if fake:
+        from fakes import FakeEmbedding, FakeLLM
+        from index_manager_local import IndexManagerLocal
+        from llama_index.core.schema import TextNode
+
+        embed_model = FakeEmbedding()
+        manager = IndexManagerLocal(embed_model, index_dir=tempfile.mkdtemp())
+        nodes = [TextNode(text=f"Paper {i} on quantum error correction topic {i % 7}.", id_=f"n{i}") for i in range(50)]
+        for node in nodes:
+            node.embedding = embed_model.embed(node.text)
+        manager.vector_store.add(nodes)
+        runtime = build_runtime(FakeLLM(responses=FAKE_RESPONSES), embed_model, manager)
+    else:
+        runtime = build_runtime()
+    stages["build_runtime"] = time.perf_counter() - mark
+    mark = time.perf_counter()
+    from llama_index.core.memory import ChatMemoryBuffer
+
+    runtime.chat(question, ChatMemoryBuffer.from_defaults(token_limit=20000))
+    stages["first_answer"] = time.perf_counter() - mark
+    stages["total"] = time.perf_counter() - start
+    runtime.close()
+    print("STARTUP " + json.dumps(stages))
+
+
+def import_profile(statement, top=8):
+    """
+    Thời gian import (cộng dồn theo package gốc) của một câu lệnh, đo bằng python -X importtime.
+
+    Returns:
+        tuple: (tổng số giây, [(package, số giây), ...] tốn nhất), None nếu import lỗi.
+    """
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", statement],
+                            capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+    if result.returncode != 0:
+        return None
+    by_package = defaultdict(float)
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line or "self [us]" in line:
+            continue
+        self_us, _, name = line[len("import time:"):].split("|")
+        by_package[name.strip().split(".")[0]] += int(self_us) / 1e6
+    total = sum(by_package.values())
+    return total, sorted(by_package.items(), key=lambda item: -item[1])[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Do thoi gian khoi dong nguoi den cau tra loi dau tien.")
+    parser.add_argument("--fake", action="store_true", help="Dung LLM/embedding gia va index local tam thoi")
+    parser.add_argument("--question", default="What is quantum error correction?")
+    parser.add_argument("--runs", type=int, default=3, help="So lan khoi dong nguoi")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        child(args.fake, args.question)
+        return
+
+    print("Thoi gian import (python -X importtime):")
+    for label, statement in (
+        ("constants", "import constants"),
+        ("app (truoc load_runtime)", "import streamlit, instrumentation, ingest_jobs, ingest_worker"),
+        ("ingest_local_pdfs --local", "import ingest_local_pdfs, index_manager_local"),
+        ("agent_runtime", "import agent_runtime"),
+    ):
+        profile = import_profile(statement)
+        if profile is None:
+            print(f"- {label:28s} loi import (thieu thu vien?)")
+            continue
+        total, packages = profile
+        print(f"- {label:28s} {total:6.2f}s  ({', '.join(f'{name} {sec:.2f}s' for name, sec in packages[:5])})")
+
+    print(f"\nKhoi dong nguoi -> cau tra loi dau tien ({args.runs} lan, moi lan mot process moi):")
+    command = [sys.executable, os.path.abspath(__file__), "--child", "--question", args.question]
+    if args.fake:
+        command.append("--fake")
+    samples = []
+    for _ in range(args.runs):
+        result = subprocess.run(command, capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+        line = next((l for l in result.stdout.splitlines() if l.startswith("STARTUP ")), None)
+        if line is None:
+            print(result.stderr[-2000:])
+            return
+        samples.append(json.loads(line[len("STARTUP "):]))
+    for stage in ("import", "build_runtime", "first_answer", "total"):
+        values = sorted(sample[stage] for sample in samples)
+        print(f"- {stage:14s} trung vi {values[len(values) // 2]:6.2f}s | min {values[0]:6.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,195 @@
+import asyncio
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any
+
+import numpy as np
+from llama_index.core.base.response.schema import Response
+from llama_index.core.query_engine import CustomQueryEngine
+
+from instrumentation import tracer
+
+DEFAULT_VERSION_PATH = os.path.join(".cache", "index_version")
+
+
+def bump_index_version(path=DEFAULT_VERSION_PATH):
+    """
+    Đánh dấu index vừa thay đổi (nạp thêm hoặc xóa dữ liệu). Mọi QueryResultCache (kể cả ở process khác)
+    sẽ tự xóa kết quả cũ ở lần tra cứu tiếp theo.
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    version = read_index_version(path) + 1
+    # Ghi file tạm rồi rename: process khác không bao giờ đọc phải file rỗng/ghi dở (sẽ bị hiểu là version 0)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        f.write(str(version))
+    os.replace(tmp_path, path)
+    return version
+
+
+def read_index_version(path=DEFAULT_VERSION_PATH):
+    try:
+        with open(path) as f:
+            return int(f.read().strip() or 0)
+    except (OSError, ValueError):
+        return 0
+
+
+def normalize_query(query):
+    """Chuẩn hóa câu hỏi cho cache khớp chính xác: chữ thường, gộp khoảng trắng, bỏ dấu câu ở cuối."""
+    return re.sub(r"\s+", " ", query.strip().lower()).rstrip(" ?.!")
+
+
+_QUOTED_RE = re.compile(r'"([^"]+)"|“([^”]+)”')
+_IDENTIFIER_RE = re.compile(r"[\w.\-]+")
+
+
+def query_identifiers(query):
+    """
+    Các "định danh" trong câu hỏi: từ có chữ số (arXiv ID, năm, phiên bản mô hình), cụm trong ngoặc kép
+    và từ viết hoa không đứng đầu câu (tên tác giả, tên riêng). Hai câu hỏi chỉ khác nhau ở các từ này
+    ("summarize 2401.00001" / "summarize 2401.00002") có embedding rất gần nhau nhưng là hai câu hỏi khác.
+    """
+    found = set()
+    for match in _QUOTED_RE.finditer(query):
+        found.add('"' + " ".join(next(g for g in match.groups() if g).lower().split()) + '"')
+    for i, token in enumerate(_IDENTIFIER_RE.findall(query)):
+        token = token.strip(".-_")
+        if any(c.isdigit() for c in token) or (i > 0 and token[:1].isupper()):
+            found.add(token.lower())
+    return frozenset(found)
+
+
+class QueryResultCache:
+    def __init__(self, embed_model=None, similarity_threshold=0.95, ttl=3600, max_entries=512,
+                 version_path=DEFAULT_VERSION_PATH):
+        """
+        Cache câu trả lời RAG hai tầng:
+            1. Khớp chính xác (sau khi chuẩn hóa câu hỏi).
+            2. Khớp ngữ nghĩa: cosine giữa embedding câu hỏi >= similarity_threshold và hai câu hỏi có
+               cùng các định danh (arXiv ID, năm, tên riêng, cụm trong ngoặc kép - xem query_identifiers).
+
+        Args:
+            embed_model (BaseEmbedding): Model embedding cho tầng ngữ nghĩa (None = chỉ dùng tầng 1).
+            similarity_threshold (float): Ngưỡng cosine để coi hai câu hỏi là một.
+            ttl (float): Thời gian sống của mỗi kết quả (giây).
+            max_entries (int): Số kết quả tối đa (bỏ bớt kết quả lâu không dùng nhất - LRU).
+            version_path (str): File version của index, dùng để tự xóa cache khi có dữ liệu mới.
+        """
+        self.embed_model = embed_model
+        self.similarity_threshold = similarity_threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.version_path = version_path
+        self._entries = OrderedDict()  # query chuẩn hóa -> (response, embedding, thời điểm tạo, định danh)
+        self._version = read_index_version(version_path)
+        self._lock = threading.Lock()
+        self.stats = {"exact_hits": 0, "semantic_hits": 0, "misses": 0}
+
+    def _check_version(self):
+        version = read_index_version(self.version_path)
+        if version != self._version:
+            self._entries.clear()
+            self._version = version
+
+    def _expire(self, now):
+        expired = [key for key, (_, _, created, _) in self._entries.items() if now - created > self.ttl]
+        for key in expired:
+            del self._entries[key]
+
+    def embed(self, query):
+        if self.embed_model is None:
+            return None
+        vector = np.asarray(self.embed_model.get_query_embedding(query), dtype=np.float32)
+        return vector / (np.linalg.norm(vector) or 1.0)
+
+    def lookup(self, query):
+        """
+        Tìm câu trả lời đã cache cho câu hỏi. Chỉ embed câu hỏi khi tầng khớp chính xác bị miss.
+
+        Returns:
+            tuple: (response hoặc None, loại hit: "exact" / "semantic" / None,
+                embedding của câu hỏi và version của index lúc tra cứu, để truyền lại cho store())
+        """
+        key = normalize_query(query)
+        with self._lock:
+            self._check_version()
+            version = self._version
+            self._expire(time.time())
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.stats["exact_hits"] += 1
+                tracer.incr("query_cache_lookups_total", result="exact")
+                return self._entries[key][0], "exact", None, version
+        embedding = self.embed(query)
+        identifiers = query_identifiers(query)
+        with self._lock:
+            # Chỉ so với các câu hỏi có cùng định danh (khác arXiv ID/năm/tác giả thì không bao giờ dùng lại)
+            keys = [k for k, entry in self._entries.items() if entry[1] is not None and entry[3] == identifiers]
+            if embedding is not None and keys:
+                scores = np.stack([self._entries[k][1] for k in keys]) @ embedding
+                best = int(np.argmax(scores))
+                if scores[best] >= self.similarity_threshold:
+                    self._entries.move_to_end(keys[best])
+                    self.stats["semantic_hits"] += 1
+                    tracer.incr("query_cache_lookups_total", result="semantic")
+                    return self._entries[keys[best]][0], "semantic", embedding, version
+            self.stats["misses"] += 1
+            tracer.incr("query_cache_lookups_total", result="miss")
+            return None, None, embedding, version
+
+    def store(self, query, response, embedding=None, version=None):
+        """
+        Lưu câu trả lời vào cache.
+
+        Args:
+            query (str): Câu hỏi.
+            response (str): Câu trả lời.
+            embedding (np.ndarray): Embedding của câu hỏi (từ lookup()).
+            version (int): Version của index lúc lookup(). Nếu index đã đổi version trong lúc tính câu trả lời
+                thì câu trả lời có thể đã cũ nên không được lưu. None = lưu theo version hiện tại.
+        """
+        key = normalize_query(query)
+        with self._lock:
+            self._check_version()
+            if version is not None and version != self._version:
+                return
+            self._entries[key] = (response, embedding, time.time(), query_identifiers(query))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self):
+        """Xóa toàn bộ cache của process hiện tại."""
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class CachedQueryEngine(CustomQueryEngine):
+    """Query engine bọc một query engine khác bằng QueryResultCache."""
+
+    query_engine: Any
+    cache: Any
+
+    def custom_query(self, query_str: str):
+        cached, hit, embedding, version = self.cache.lookup(query_str)
+        if cached is not None:
+            return Response(cached, metadata={"cache": hit})
+        response = self.query_engine.query(query_str)
+        self.cache.store(query_str, str(response), embedding, version)
+        return response
+
+    async def acustom_query(self, query_str: str):
+        # lookup có thể phải embed câu hỏi (gọi API đồng bộ): chạy trong thread để không chặn event loop
+        cached, hit, embedding, version = await asyncio.to_thread(self.cache.lookup, query_str)
+        if cached is not None:
+            return Response(cached, metadata={"cache": hit})
+        response = await self.query_engine.aquery(query_str)
+        self.cache.store(query_str, str(response), embedding, version)
+        return response
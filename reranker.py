@@ -0,0 +1,126 @@
+import math
+import re
+from collections import Counter
+from typing import List, Optional
+
+from llama_index.core.postprocessor.types import BaseNodePostprocessor
+from llama_index.core.schema import NodeWithScore, QueryBundle
+
+from bm25_index import tokenize
+
+_SENTENCE_RE = re.compile(r"(?<=[.!?])\s+(?=[A-Z0-9(\[])|\n{2,}")
+
+
+def bm25_scores(query_tokens, docs_tokens, k1=1.2, b=0.75):
+    """Điểm BM25 của câu hỏi với từng văn bản, idf tính ngay trên tập văn bản đưa vào."""
+    if not docs_tokens:
+        return []
+    n_docs = len(docs_tokens)
+    avgdl = sum(len(tokens) for tokens in docs_tokens) / n_docs or 1.0
+    counts = [Counter(tokens) for tokens in docs_tokens]
+    df = Counter(term for c in counts for term in c)
+    terms = set(query_tokens)
+    scores = []
+    for c, tokens in zip(counts, docs_tokens):
+        norm = k1 * (1 - b + b * len(tokens) / avgdl)
+        score = 0.0
+        for term in terms:
+            tf = c.get(term, 0)
+            if tf:
+                idf = math.log(1 + (n_docs - df[term] + 0.5) / (df[term] + 0.5))
+                score += idf * tf * (k1 + 1) / (tf + norm)
+        scores.append(score)
+    return scores
+
+
+class LexicalReranker(BaseNodePostprocessor):
+    """
+    Reranker rất nhẹ chạy trên CPU, không cần model: chấm BM25 giữa câu hỏi và các ứng viên
+    rồi gộp với thứ hạng của bước truy vấn trước bằng RRF, giữ lại top_n node tốt nhất.
+    """
+
+    top_n: int = 3
+    first_stage_weight: float = 0.5  # Trọng số thứ hạng của bước truy vấn đầu (vector/hybrid)
+    rrf_k: int = 10
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "LexicalReranker"
+
+    def _postprocess_nodes(
+        self, nodes: List[NodeWithScore], query_bundle: Optional[QueryBundle] = None
+    ) -> List[NodeWithScore]:
+        if query_bundle is None or len(nodes) <= 1:
+            return nodes[:self.top_n]
+        scores = bm25_scores(tokenize(query_bundle.query_str), [tokenize(n.node.get_content()) for n in nodes])
+        lexical_rank = {i: rank for rank, i in enumerate(sorted(range(len(nodes)), key=lambda i: -scores[i]), 1)}
+        fused = [
+            1.0 / (self.rrf_k + lexical_rank[i]) + self.first_stage_weight / (self.rrf_k + i + 1)
+            for i in range(len(nodes))
+        ]
+        best = sorted(range(len(nodes)), key=lambda i: -fused[i])[:self.top_n]
+        return [NodeWithScore(node=nodes[i].node, score=fused[i]) for i in best]
+
+
+class SentenceCompressor(BaseNodePostprocessor):
+    """
+    Rút gọn từng chunk: chỉ giữ các câu liên quan nhất tới câu hỏi (theo BM25, giữ nguyên thứ tự câu)
+    và bỏ các câu không chứa từ nào của câu hỏi. Giảm số token gửi cho LLM.
+    """
+
+    max_sentences: int = 6   # Số câu tối đa giữ lại mỗi chunk
+    context_window: int = 1  # Giữ thêm các câu liền kề câu được chọn
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "SentenceCompressor"
+
+    def compress(self, text, query_tokens):
+        sentences = [s for s in _SENTENCE_RE.split(text) if s and s.strip()]
+        if len(sentences) <= self.max_sentences:
+            return text
+        scores = bm25_scores(query_tokens, [tokenize(s) for s in sentences])
+        ranked = [i for i in sorted(range(len(sentences)), key=lambda i: -scores[i]) if scores[i] > 0]
+        if not ranked:
+            return text  # Không câu nào khớp: giữ nguyên để không làm mất ngữ cảnh
+        keep = set()
+        for i in ranked:
+            window = range(max(0, i - self.context_window), min(len(sentences), i + self.context_window + 1))
+            if keep and len(keep | set(window)) > self.max_sentences:
+                break
+            keep.update(window)
+        return " ... ".join(sentences[i].strip() for i in sorted(keep))
+
+    def _postprocess_nodes(
+        self, nodes: List[NodeWithScore], query_bundle: Optional[QueryBundle] = None
+    ) -> List[NodeWithScore]:
+        if query_bundle is None:
+            return nodes
+        query_tokens = tokenize(query_bundle.query_str)
+        result = []
+        for n in nodes:
+            node = n.node.model_copy()
+            node.set_content(self.compress(n.node.get_content(), query_tokens))
+            result.append(NodeWithScore(node=node, score=n.score))
+        return result
+
+
+def build_reranker(kind="lexical", top_n=3, model="cross-encoder/ms-marco-MiniLM-L-6-v2"):
+    """
+    Tạo reranker cho bước "lấy nhiều - chọn ít".
+
+    Args:
+        kind (str): "lexical" (BM25 + RRF, không cần model) hoặc "cross-encoder"
+            (model nhỏ chạy local trên CPU, cần cài sentence-transformers).
+        top_n (int): Số node giữ lại để gửi cho LLM.
+        model (str): Tên model cross-encoder.
+    """
+    if kind == "cross-encoder":
+        try:
+            from llama_index.core.postprocessor import SentenceTransformerRerank
+            return SentenceTransformerRerank(model=model, top_n=top_n, device="cpu")
+        except ImportError as e:
+            print(f"Khong dung duoc cross-encoder ({e}), chuyen sang reranker lexical.")
+    elif kind != "lexical":
+        raise ValueError(f"Reranker khong hop le: {kind}")
+    return LexicalReranker(top_n=top_n)
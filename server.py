@@ -0,0 +1,138 @@
+import argparse
+import asyncio
+import os
+import time
+import uuid
+from collections import OrderedDict, defaultdict
+
+from aiohttp import web
+
+from instrumentation import setup_instrumentation, tracer
+from session_memory import SessionMemory, SessionStore
+
+# Server HTTP (aiohttp) cho nhiều người dùng cùng lúc, dùng chung một AgentRuntime (LLM, index, tool):
+#   POST   /chat              {"message": "...", "session_id": "..." (optional)} -> {"session_id", "answer", "latency_ms"}
+#   GET    /sessions/{id}     lịch sử hội thoại của phiên
+#   DELETE /sessions/{id}     xóa phiên
+#   GET    /stats             số request, số lời gọi được gộp (single-flight), số lời gọi LLM đang chạy/chờ
+# Mỗi phiên có bộ nhớ riêng (SessionMemory lưu trong .cache/sessions.sqlite); các lượt của cùng một phiên
+# chạy lần lượt, các phiên khác nhau chạy song song (số lời gọi LLM cùng lúc bị giới hạn bởi LLM_MAX_CONCURRENCY).
+# Chạy: python server.py [--port 8080] [--local]
+
+
+class ChatServer:
+    def __init__(self, runtime, store=None, max_sessions=1000, **memory_kwargs):
+        """
+        Args:
+            runtime (AgentRuntime): Agent dùng chung cho mọi phiên.
+            store (SessionStore): Nơi lưu các phiên (mặc định .cache/sessions.sqlite).
+            max_sessions (int): Số phiên giữ trong RAM (phiên lâu không dùng bị bỏ khỏi RAM, vẫn còn trong store).
+            **memory_kwargs: Tham số cho SessionMemory (token_limit, recent_turns...).
+        """
+        self.runtime = runtime
+        self.store = store if store is not None else SessionStore()
+        self.max_sessions = max_sessions
+        self.memory_kwargs = memory_kwargs
+        self._sessions = OrderedDict()  # session_id -> (SessionMemory, asyncio.Lock)
+        self.stats = {"requests": 0, "errors": 0, "active": 0, "max_active": 0}
+
+    def session(self, session_id):
+        """Bộ nhớ và khóa của một phiên (nạp lại từ store nếu chưa có trong RAM)."""
+        if session_id in self._sessions:
+            self._sessions.move_to_end(session_id)
+            return self._sessions[session_id]
+        entry = (SessionMemory.from_defaults(session_id, self.store, **self.memory_kwargs), asyncio.Lock())
+        self._sessions[session_id] = entry
+        while len(self._sessions) > self.max_sessions:
+            oldest, (_, lock) = next(iter(self._sessions.items()))
+            if lock.locked():
+                break  # Phiên cũ nhất đang chạy: để lần sau
+            del self._sessions[oldest]
+        return entry
+
+    async def handle_chat(self, request):
+        try:
+            body = await request.json()
+        except ValueError:
+            raise web.HTTPBadRequest(text="Body phai la JSON")
+        message = str(body.get("message") or "").strip()
+        if not message:
+            raise web.HTTPBadRequest(text="Thieu message")
+        session_id = str(body.get("session_id") or uuid.uuid4().hex)
+        memory, lock = self.session(session_id)
+        self.stats["requests"] += 1
+        start = time.perf_counter()
+        # Các lượt của cùng một phiên phải chạy lần lượt (dùng chung bộ nhớ hội thoại)
+        async with lock:
+            self.stats["active"] += 1
+            self.stats["max_active"] = max(self.stats["max_active"], self.stats["active"])
+            try:
+                answer = await self.runtime.achat(message, memory)
+            except Exception as e:
+                self.stats["errors"] += 1
+                tracer.incr("server_errors_total")
+                print(f"Loi khi tra loi phien {session_id}: {e}")
+                raise web.HTTPInternalServerError(text=f"Loi khi tra loi: {e}")
+            finally:
+                self.stats["active"] -= 1
+        latency_ms = (time.perf_counter() - start) * 1000
+        return web.json_response({"session_id": session_id, "answer": answer, "latency_ms": round(latency_ms, 1)})
+
+    async def handle_history(self, request):
+        memory, _ = self.session(request.match_info["session_id"])
+        return web.json_response({"session_id": memory.session_id, "messages": memory.transcript()})
+
+    async def handle_reset(self, request):
+        memory, lock = self.session(request.match_info["session_id"])
+        async with lock:
+            memory.reset()
+        return web.json_response({"session_id": memory.session_id, "reset": True})
+
+    async def handle_stats(self, request):
+        coalescing = defaultdict(dict)
+        for (name, labels), value in tracer.counters().items():
+            if name == "singleflight_calls_total":
+                labels = dict(labels)
+                coalescing[labels["flight"]][labels["result"]] = int(value)
+        llm = self.runtime.llm_model
+        return web.json_response({
+            "server": {**self.stats, "sessions_in_memory": len(self._sessions)},
+            "singleflight": coalescing,
+            "llm": llm.stats() if hasattr(llm, "stats") else None,
+        })
+
+    def build_app(self):
+        app = web.Application()
+        app.add_routes([
+            web.post("/chat", self.handle_chat),
+            web.get("/sessions/{session_id}", self.handle_history),
+            web.delete("/sessions/{session_id}", self.handle_reset),
+            web.get("/stats", self.handle_stats),
+        ])
+        return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Server HTTP cho Agent (nhieu nguoi dung cung luc).")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--local", action="store_true", default=os.getenv("INDEX_BACKEND", "pinecone") == "local",
+                        help="Dung index local (local_index/) thay vi Pinecone")
+    parser.add_argument("--max-llm-concurrency", type=int, default=None,
+                        help="So loi goi LLM cung luc toi da (mac dinh LLM_MAX_CONCURRENCY hoac 8)")
+    args = parser.parse_args()
+
+    setup_instrumentation()
+    from agent_runtime import build_runtime
+    from constants import get_index_manager
+
+    runtime = build_runtime(index_manager=get_index_manager("local" if args.local else "pinecone"),
+                            max_llm_concurrency=args.max_llm_concurrency)
+    try:
+        web.run_app(ChatServer(runtime).build_app(), host=args.host, port=args.port)
+    finally:
+        runtime.close()
+
+
+if __name__ == "__main__":
+    main()
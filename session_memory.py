@@ -0,0 +1,325 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, List, Optional
+
+from llama_index.core.base.llms.types import ChatMessage, MessageRole
+from llama_index.core.bridge.pydantic import PrivateAttr
+from llama_index.core.memory.types import BaseMemory
+from llama_index.core.utils import get_tokenizer
+
+DEFAULT_SESSION_PATH = os.path.join(".cache", "sessions.sqlite")
+SUMMARY_PREFIX = "Summary of the earlier conversation:\n"
+# Observation trong bước suy luận ReAct: từ "Observation:" đến dòng Thought/Action/Answer tiếp theo
+_OBSERVATION_RE = re.compile(r"^Observation:[ \t]*(.*?)(?=^(?:Thought|Action|Answer):|\Z)", re.DOTALL | re.MULTILINE)
+_REF_RE = re.compile(r"\[stored output (mem-[0-9a-f]{12})")
+
+SUMMARY_PROMPT = (
+    "Update the running summary of a conversation between a user and a research assistant.\n"
+    "Keep the papers, authors, arXiv IDs, decisions and open questions that may matter later; "
+    "drop small talk. Answer with the new summary only, at most {max_words} words.\n\n"
+    "Current summary:\n{summary}\n\nNew turns:\n{turns}\n\nNew summary:"
+)
+
+
+def final_answer(text):
+    """Câu trả lời cuối trong bước suy luận ReAct ("... Answer: ..."), hoặc cả văn bản nếu không có."""
+    marker = text.rfind("Answer:")
+    return text[marker + len("Answer:"):].strip() if marker >= 0 else text.strip()
+
+
+def shorten(text, max_chars):
+    text = " ".join(text.split())
+    return text if len(text) <= max_chars else text[:max_chars - 3].rstrip() + "..."
+
+
+def split_turns(messages):
+    """Tách lịch sử thành các lượt, mỗi lượt bắt đầu bằng một tin nhắn của người dùng."""
+    turns = []
+    for message in messages:
+        if message.role == MessageRole.USER or not turns:
+            turns.append([])
+        turns[-1].append(message)
+    return turns
+
+
+class SessionStore:
+    def __init__(self, path=DEFAULT_SESSION_PATH):
+        """
+        Lưu các phiên chat trên SQLite: tin nhắn, tóm tắt các lượt cũ và các output lớn của tool
+        (lưu theo phiên + hash nội dung, tin nhắn chỉ giữ tham chiếu "mem-...").
+
+        Args:
+            path (str): File SQLite (":memory:" = không lưu ra ổ cứng).
+        """
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.executescript(
+            """
+            PRAGMA journal_mode=WAL;
+            CREATE TABLE IF NOT EXISTS messages (
+                session_id TEXT NOT NULL, seq INTEGER NOT NULL, message_json TEXT NOT NULL,
+                PRIMARY KEY (session_id, seq));
+            CREATE TABLE IF NOT EXISTS summaries (
+                session_id TEXT PRIMARY KEY, summary TEXT NOT NULL, summarized INTEGER NOT NULL,
+                updated_at REAL NOT NULL);
+            """
+        )
+        with self._lock:
+            self._migrate_artifacts()
+
+    def _migrate_artifacts(self):
+        """
+        Output của tool được lưu theo (phiên, tham chiếu): cùng nội dung ở hai phiên là hai bản riêng,
+        xóa phiên này không làm hỏng tham chiếu của phiên kia và phiên này không đọc được output của phiên khác.
+        Bảng cũ (khóa chỉ theo tham chiếu) được chuyển sang bảng mới.
+        """
+        primary_key = {row[1]: row[5] for row in self._conn.execute("PRAGMA table_info(artifacts)")}
+        old_schema = bool(primary_key) and not primary_key.get("session_id")
+        if old_schema:
+            self._conn.execute("ALTER TABLE artifacts RENAME TO artifacts_old")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS artifacts (
+                session_id TEXT NOT NULL, ref TEXT NOT NULL, content TEXT NOT NULL, created_at REAL NOT NULL,
+                PRIMARY KEY (session_id, ref));
+            """
+        )
+        if old_schema:
+            self._conn.execute(
+                "INSERT OR IGNORE INTO artifacts SELECT session_id, ref, content, created_at FROM artifacts_old"
+                " WHERE session_id IS NOT NULL"
+            )
+            self._conn.execute("DROP TABLE artifacts_old")
+            self._conn.execute("DROP INDEX IF EXISTS idx_artifacts_session")
+            self._conn.commit()
+
+    def messages(self, session_id):
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT message_json FROM messages WHERE session_id = ? ORDER BY seq", (session_id,)
+            ).fetchall()
+        return [ChatMessage.model_validate(json.loads(row)) for (row,) in rows]
+
+    def append(self, session_id, seq, message):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO messages VALUES (?, ?, ?)",
+                (session_id, seq, json.dumps(message.model_dump(mode="json"))),
+            )
+            self._conn.commit()
+
+    def summary(self, session_id):
+        """Returns: tuple (tóm tắt, số tin nhắn đầu tiên đã được tóm tắt)."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT summary, summarized FROM summaries WHERE session_id = ?", (session_id,)
+            ).fetchone()
+        return row if row else ("", 0)
+
+    def set_summary(self, session_id, summary, summarized):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO summaries VALUES (?, ?, ?, ?)", (session_id, summary, summarized, time.time())
+            )
+            self._conn.commit()
+
+    def put_artifact(self, session_id, content):
+        """Lưu một output lớn của phiên, trả về tham chiếu (cùng nội dung trong một phiên -> cùng tham chiếu)."""
+        ref = "mem-" + hashlib.sha1(content.encode()).hexdigest()[:12]
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR IGNORE INTO artifacts VALUES (?, ?, ?, ?)", (session_id, ref, content, time.time())
+            )
+            self._conn.commit()
+        return ref
+
+    def get_artifact(self, session_id, ref):
+        """Nội dung của tham chiếu ref, chỉ khi nó thuộc phiên session_id."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT content FROM artifacts WHERE session_id = ? AND ref = ?", (session_id, ref)
+            ).fetchone()
+        return row[0] if row else None
+
+    def delete(self, session_id):
+        """Xóa toàn bộ tin nhắn, tóm tắt và output đã lưu của một phiên."""
+        with self._lock:
+            for table in ("messages", "summaries", "artifacts"):
+                self._conn.execute(f"DELETE FROM {table} WHERE session_id = ?", (session_id,))
+            self._conn.commit()
+
+
+class SessionMemory(BaseMemory):
+    """
+    Bộ nhớ hội thoại có ngân sách token, thay cho ChatMemoryBuffer(token_limit=20000):
+        - giữ nguyên văn recent_turns lượt gần nhất,
+        - các lượt cũ hơn được gộp vào một bản tóm tắt cuốn chiếu (câu hỏi + câu trả lời cuối, không
+          giữ các bước Thought/Action/Observation); dùng LLM nếu truyền `llm`, nếu không thì tóm tắt trích xuất,
+        - Observation lớn của tool (danh sách bài arXiv, câu trả lời RAG) được lưu riêng, tin nhắn chỉ giữ
+          đoạn đầu và tham chiếu (Agent đọc lại bằng tool read_stored_output),
+        - mọi thứ được lưu trong SessionStore nên phiên chat dùng tiếp được sau khi khởi động lại.
+    """
+
+    session_id: str
+    token_limit: int = 3000        # Ngân sách token của lịch sử gửi cho LLM (tóm tắt + các lượt gần nhất)
+    recent_turns: int = 2          # Số lượt gần nhất giữ nguyên văn
+    summary_token_limit: int = 600
+    max_inline_chars: int = 1200   # Observation dài hơn thì lưu riêng, chỉ giữ tham chiếu
+    preview_chars: int = 300
+    llm: Optional[Any] = None      # LLM dùng để tóm tắt (None = tóm tắt trích xuất, không gọi API)
+
+    _store: Any = PrivateAttr()
+    _messages: List[ChatMessage] = PrivateAttr(default_factory=list)
+    _summary: str = PrivateAttr(default="")
+    _summarized: int = PrivateAttr(default=0)
+    _tokenizer: Any = PrivateAttr()
+    _lock: Any = PrivateAttr(default_factory=threading.RLock)
+
+    def __init__(self, store=None, **kwargs: Any):
+        super().__init__(**kwargs)
+        self._store = store if store is not None else SessionStore(":memory:")
+        self._tokenizer = get_tokenizer()
+        self._messages = self._store.messages(self.session_id)
+        self._summary, self._summarized = self._store.summary(self.session_id)
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "SessionMemory"
+
+    @classmethod
+    def from_defaults(cls, session_id=None, store=None, **kwargs: Any) -> "SessionMemory":
+        """
+        Tạo (hoặc mở lại) một phiên.
+
+        Args:
+            session_id (str): ID phiên (None = phiên mới). Cùng ID và cùng store thì nạp lại lịch sử đã lưu.
+            store (SessionStore): Nơi lưu phiên (None = chỉ trong bộ nhớ).
+            **kwargs: token_limit, recent_turns, summary_token_limit, max_inline_chars, llm...
+        """
+        return cls(session_id=session_id or uuid.uuid4().hex, store=store, **kwargs)
+
+    @property
+    def summary(self):
+        return self._summary
+
+    def _tokens(self, messages):
+        return sum(len(self._tokenizer(str(message.content or ""))) for message in messages)
+
+    def _externalize(self, message):
+        """Thay các Observation (hoặc tin nhắn tool) quá dài bằng đoạn đầu + tham chiếu tới bản lưu đầy đủ."""
+        content = message.content
+        if not isinstance(content, str) or len(content) <= self.max_inline_chars:
+            return message
+
+        def reference(text):
+            ref = self._store.put_artifact(self.session_id, text)
+            return (f"[stored output {ref}, {len(text)} chars; call read_stored_output with ref=\"{ref}\" "
+                    f"for the full text] {shorten(text, self.preview_chars)}")
+
+        if message.role == MessageRole.TOOL:
+            content = reference(content)
+        elif message.role == MessageRole.ASSISTANT and "Observation:" in content:
+            def replace(match):
+                body = match.group(1).rstrip()
+                if len(body) <= self.max_inline_chars or _REF_RE.match(body):
+                    return match.group(0)
+                return f"Observation: {reference(body)}\n"
+
+            content = _OBSERVATION_RE.sub(replace, content)
+        else:
+            return message
+        return ChatMessage(role=message.role, content=content, additional_kwargs=message.additional_kwargs)
+
+    def resolve(self, ref):
+        """Nội dung đầy đủ của một output đã lưu trong phiên này (None nếu không có hoặc thuộc phiên khác)."""
+        return self._store.get_artifact(self.session_id, ref)
+
+    def _summarize(self, summary, messages):
+        turns = split_turns(messages)
+        if self.llm is not None:
+            text = "\n".join(
+                f"User: {shorten(str(turn[0].content or ''), 1000)}\n"
+                f"Assistant: {shorten(final_answer(str(turn[-1].content or '')), 1500)}"
+                for turn in turns if len(turn) > 1
+            )
+            prompt = SUMMARY_PROMPT.format(max_words=int(self.summary_token_limit * 0.7),
+                                           summary=summary or "(empty)", turns=text)
+            return str(self.llm.complete(prompt)).strip()
+        lines = summary.splitlines() if summary else []
+        for turn in turns:
+            question = shorten(str(turn[0].content or ""), 200)
+            answer = shorten(final_answer(str(turn[-1].content or "")), 300) if len(turn) > 1 else "(no answer)"
+            lines.append(f"- User: {question} | Assistant: {answer}")
+        # Giữ tóm tắt trong ngân sách: bỏ các dòng cũ nhất
+        while len(lines) > 1 and len(self._tokenizer("\n".join(lines))) > self.summary_token_limit:
+            lines.pop(0)
+        return "\n".join(lines)
+
+    def _compact(self):
+        """Gộp các lượt cũ vào tóm tắt cho đến khi còn recent_turns lượt và lịch sử nằm trong ngân sách token."""
+        starts = [i for i in range(self._summarized, len(self._messages))
+                  if self._messages[i].role == MessageRole.USER]
+        if starts and starts[0] != self._summarized:
+            starts.insert(0, self._summarized)
+        changed = False
+        budget = self.token_limit - len(self._tokenizer(self._summary))
+        while len(starts) > 1 and (
+            len(starts) > self.recent_turns or self._tokens(self._messages[starts[0]:]) > budget
+        ):
+            self._summary = self._summarize(self._summary, self._messages[starts[0]:starts[1]])
+            self._summarized = starts[1]
+            starts.pop(0)
+            budget = self.token_limit - len(self._tokenizer(self._summary))
+            changed = True
+        if changed:
+            self._store.set_summary(self.session_id, self._summary, self._summarized)
+
+    def get(self, input: Optional[str] = None, **kwargs: Any) -> List[ChatMessage]:
+        with self._lock:
+            self._compact()
+            messages = list(self._messages[self._summarized:])
+            if self._summary:
+                messages.insert(0, ChatMessage(role=MessageRole.SYSTEM, content=SUMMARY_PREFIX + self._summary))
+            return messages
+
+    def get_all(self) -> List[ChatMessage]:
+        with self._lock:
+            return list(self._messages)
+
+    def put(self, message: ChatMessage) -> None:
+        with self._lock:
+            message = self._externalize(message)
+            self._store.append(self.session_id, len(self._messages), message)
+            self._messages.append(message)
+
+    def set(self, messages: List[ChatMessage]) -> None:
+        with self._lock:
+            self.reset()
+            for message in messages:
+                self.put(message)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._store.delete(self.session_id)
+            self._messages = []
+            self._summary, self._summarized = "", 0
+
+    def transcript(self):
+        """Lịch sử để hiển thị: câu hỏi của người dùng và câu trả lời cuối của mỗi lượt."""
+        with self._lock:
+            history = []
+            for turn in split_turns(self._messages):
+                if turn[0].role == MessageRole.USER:
+                    history.append({"role": "user", "content": str(turn[0].content or "")})
+                if len(turn) > 1:
+                    history.append({"role": "assistant", "content": final_answer(str(turn[-1].content or ""))})
+            return history
@@ -0,0 +1,81 @@
+import asyncio
+import threading
+from concurrent.futures import Future
+
+from instrumentation import tracer
+
+
+class SingleFlight:
+    def __init__(self, name):
+        """
+        Gộp các lời gọi async giống nhau đang chạy cùng lúc: lời gọi đầu tiên với một khóa thực sự
+        chạy, các lời gọi trùng khóa đến sau (từ phiên khác) chỉ chờ và nhận chung kết quả/lỗi.
+        Khác với cache, kết quả không được giữ lại sau khi lời gọi xong. Có hai dạng: do() cho hàm
+        async và call() cho hàm đồng bộ gọi từ nhiều thread.
+
+        Lời gọi chạy trong một task riêng: người chờ bị hủy (hết thời gian tool, người dùng dừng)
+        không làm hủy lời gọi của những người chờ khác. Chỉ gộp các lời gọi trên cùng event loop.
+
+        Args:
+            name (str): Tên (dùng trong metric singleflight_calls_total).
+        """
+        self.name = name
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._sync_calls = {}  # khóa -> Future của lời gọi đồng bộ đang chạy
+        self.stats = {"calls": 0, "coalesced": 0}
+
+    def _forget(self, key, task):
+        with self._lock:
+            if self._calls.get(key) is task:
+                del self._calls[key]
+        # Đánh dấu lỗi đã được xử lý (khi mọi người chờ đều đã bị hủy)
+        if not task.cancelled():
+            task.exception()
+
+    async def do(self, key, fn, *args, **kwargs):
+        """
+        Chạy fn(*args, **kwargs) (hàm async), hoặc chờ lời gọi cùng khóa đang chạy.
+
+        Args:
+            key (hashable): Khóa của lời gọi (ví dụ câu hỏi đã chuẩn hóa).
+        Returns:
+            Kết quả của lời gọi.
+        """
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            task = self._calls.get(key)
+            coalesced = task is not None and task.get_loop() is loop
+            if not coalesced:
+                task = loop.create_task(fn(*args, **kwargs))
+                self._calls[key] = task
+                task.add_done_callback(lambda t: self._forget(key, t))
+            self.stats["coalesced" if coalesced else "calls"] += 1
+        tracer.incr("singleflight_calls_total", flight=self.name, result="coalesced" if coalesced else "leader")
+        return await asyncio.shield(task)
+
+    def call(self, key, fn, *args, **kwargs):
+        """Giống do() nhưng cho hàm đồng bộ: thread gọi trùng khóa chờ kết quả của thread đang chạy."""
+        with self._lock:
+            future = self._sync_calls.get(key)
+            coalesced = future is not None
+            if not coalesced:
+                future = self._sync_calls[key] = Future()
+            self.stats["coalesced" if coalesced else "calls"] += 1
+        tracer.incr("singleflight_calls_total", flight=self.name, result="coalesced" if coalesced else "leader")
+        if coalesced:
+            return future.result()
+        try:
+            result = fn(*args, **kwargs)
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                del self._sync_calls[key]
+
+    def in_flight(self):
+        with self._lock:
+            return len(self._calls) + len(self._sync_calls)
@@ -0,0 +1,55 @@
+import argparse
+import os
+import time
+
+from instrumentation import setup_instrumentation
+
+# Xuất/khôi phục snapshot nhị phân của index (vector float16 + node, xem index_snapshot.py) để chuyển dữ liệu
+# giữa Pinecone và index local, hoặc khởi động lại/khôi phục sau sự cố mà không phải gọi lại API embedding.
+#   python snapshot.py export snapshots/arxiv --backend pinecone   # Pinecone -> snapshot
+#   python snapshot.py import snapshots/arxiv --backend local      # snapshot -> local_index/
+#   python snapshot.py export snapshots/arxiv --backend memory     # index/ (JSON của LlamaIndex) -> snapshot
+# Chạy: python snapshot.py {export,import} DIR [--backend local|pinecone|memory] [--dtype float32] [--replace] [--force]
+
+
+def get_manager(backend):
+    from constants import get_embed_model, get_index_manager
+
+    if backend == "memory":
+        from index_manager import IndexManager
+
+        return IndexManager(get_embed_model())
+    return get_index_manager(backend)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Xuat/khoi phuc snapshot cua index (khong goi API embedding).")
+    parser.add_argument("action", choices=["export", "import"])
+    parser.add_argument("path", help="Thu muc snapshot")
+    parser.add_argument("--backend", choices=["local", "pinecone", "memory"],
+                        default=os.getenv("INDEX_BACKEND", "pinecone"),
+                        help="Index nguon (export) hoac dich (import); memory = thu muc index/ (chi export)")
+    parser.add_argument("--dtype", choices=["float16", "float32"], default="float16",
+                        help="Kieu luu vector khi export (float16 nho bang mot nua)")
+    parser.add_argument("--chunk-rows", type=int, default=10000, help="So node moi file chunk")
+    parser.add_argument("--replace", action="store_true", help="Xoa du lieu hien co cua index dich truoc khi import")
+    parser.add_argument("--force", action="store_true", help="Van import khi snapshot dung embed model khac")
+    args = parser.parse_args()
+
+    if args.action == "import" and args.backend == "memory":
+        parser.error("import chi ho tro --backend local hoac pinecone")
+    setup_instrumentation()
+    manager = get_manager(args.backend)
+    start = time.perf_counter()
+    if args.action == "export":
+        manifest = manager.export_snapshot(args.path, dtype=args.dtype, chunk_rows=args.chunk_rows)
+        count = manifest["count"]
+    else:
+        stats = manager.import_snapshot(args.path, force=args.force, replace=args.replace)
+        count = stats["nodes"]
+    elapsed = time.perf_counter() - start
+    print(f"Xong trong {elapsed:.1f}s ({count / elapsed if elapsed else 0:.0f} node/s).")
+
+
+if __name__ == "__main__":
+    main()
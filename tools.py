@@ -1,41 +1,116 @@
-import arxiv
+import asyncio
+import contextvars
+import functools
 import requests
 import os
+from concurrent.futures import ThreadPoolExecutor
+from arxiv_fetcher import ArxivFetcher, normalize_topic
+from downloader import DownloadManager
+from instrumentation import traced, tracer
+from singleflight import SingleFlight
 
-client = arxiv.Client()
+# Số thread tối đa cho các tool blocking (gọi arXiv, tải PDF) để chúng không chặn event loop của Agent
+TOOL_MAX_WORKERS = int(os.getenv("TOOL_MAX_WORKERS", "4"))
+# Thời gian tối đa (giây) của mỗi tool; quá thời gian thì Agent nhận thông báo lỗi thay vì chờ mãi
+TOOL_TIMEOUTS = {
+    "research_paper_query_tool": 90.0,
+    "fetch_from_arxiv": 60.0,
+    "download_pdf_file_tool": 120.0,
+}
 
+_fetcher = None
+_tool_executor = None
+# Nhiều phiên cùng hỏi một chủ đề trong lúc lời gọi arXiv đầu tiên chưa xong thì dùng chung lời gọi đó
+_arxiv_flight = SingleFlight("arxiv")
+
+
+def get_tool_executor():
+    """Thread pool dùng chung (giới hạn TOOL_MAX_WORKERS thread) cho phần I/O blocking của các tool."""
+    global _tool_executor
+    if _tool_executor is None:
+        _tool_executor = ThreadPoolExecutor(max_workers=TOOL_MAX_WORKERS, thread_name_prefix="agent-tool")
+    return _tool_executor
+
+
+async def run_blocking(fn, *args, **kwargs):
+    """
+    Chạy hàm blocking trong thread pool của tools và chờ kết quả mà không chặn event loop.
+    ContextVar được chép sang thread, nên span của hàm (@traced) vẫn thuộc lượt chat đang chạy.
+    """
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(get_tool_executor(), functools.partial(context.run, fn, *args, **kwargs))
+
+
+def with_timeout(async_fn, name, timeout=None):
+    """
+    Bọc hàm async của một tool bằng giới hạn thời gian.
+
+    Args:
+        async_fn (callable): Hàm async của tool.
+        name (str): Tên tool (dùng trong thông báo và metric tool_timeouts_total).
+        timeout (float): Số giây tối đa (None = lấy theo TOOL_TIMEOUTS, không có thì không giới hạn).
+    Returns:
+        callable: Hàm async cùng chữ ký; quá thời gian thì trả về thông báo lỗi cho Agent.
+            Thread đang chạy phần blocking không dừng được, nó chạy tiếp trong pool đến khi xong.
+    """
+    timeout = timeout if timeout is not None else TOOL_TIMEOUTS.get(name)
+
+    @functools.wraps(async_fn)
+    async def wrapper(*args, **kwargs):
+        try:
+            return await asyncio.wait_for(async_fn(*args, **kwargs), timeout)
+        except asyncio.TimeoutError:
+            tracer.incr("tool_timeouts_total", tool=name)
+            return f"Tool {name} timed out after {timeout:g} seconds. Try again later or with a smaller request."
+
+    return wrapper
+
+
+def get_arxiv_fetcher():
+    """ArxivFetcher dùng chung (cache metadata tại .cache/arxiv.sqlite)."""
+    global _fetcher
+    if _fetcher is None:
+        _fetcher = ArxivFetcher()
+    return _fetcher
+
+@traced("arxiv.fetch")
 def fetch_arxiv_papers(title: str,paper_count: int):
-    search_query = f'all:"{title}"'
-    search = arxiv.Search(
-    query=search_query,
-    max_results=paper_count,
-    sort_by=arxiv.SortCriterion.SubmittedDate,
-    )
-    papers = []
-    results = client.results(search)
-    for result in results:
-        paper_info = {
-            "title": result.title,
-            "authors": [author.name for author in result.authors],
-            "summary": result.summary,
-            "journal_ref": result.journal_ref,
-            "primary_category": result.primary_category,
-            "doi": result.doi,
-            "pdf_url": result.pdf_url,
-            "arxiv_url": result.entry_id,
-
-        }
-        papers.append(paper_info)
-    return papers
+    # Kết quả được cache theo chủ đề (TTL 6 giờ) và theo arXiv ID, nên gọi lại cùng chủ đề sẽ trả về ngay
+    return get_arxiv_fetcher().fetch(title, paper_count)
+
+
+async def afetch_arxiv_papers(title: str, paper_count: int):
+    """
+    Bản async của fetch_arxiv_papers (gọi arXiv trong thread pool của tools).
+    Các yêu cầu trùng chủ đề đang chạy cùng lúc được gộp thành một lời gọi.
+    """
+    return await _arxiv_flight.do((normalize_topic(title), int(paper_count)),
+                                  run_blocking, fetch_arxiv_papers, title, paper_count)
+
+_downloader = None
 
+
+def get_downloader():
+    """DownloadManager dùng chung (giữ connection pool giữa các lần tải)."""
+    global _downloader
+    if _downloader is None:
+        _downloader = DownloadManager("papers")
+    return _downloader
+
+@traced("pdf.download")
 def download_pdf(pdf_url: str, output_file_name: str):
     try:
-        os.makedirs("papers", exist_ok=True)
-        full_output_path = os.path.join("papers", output_file_name)
-        response = requests.get(pdf_url)
-        response.raise_for_status()
-        with open(full_output_path, 'wb') as file:
-            file.write(response.content)
-        return f"PDF downloaded successfully and saved as : {full_output_path}"
-    except requests.exceptions.RequestException as e:
-        return f"An error occurred while downloading the PDF: {e}"
\ No newline at end of file
+        result = get_downloader().download(pdf_url, output_file_name)
+        if result["status"] == "exists":
+            return f"PDF already exists at : {result['path']}"
+        if result["status"] == "deduplicated":
+            return f"PDF with the same content already exists at : {result['path']}"
+        return f"PDF downloaded successfully and saved as : {result['path']}"
+    except (requests.exceptions.RequestException, OSError) as e:
+        return f"An error occurred while downloading the PDF: {e}"
+
+
+async def adownload_pdf(pdf_url: str, output_file_name: str):
+    """Bản async của download_pdf (tải trong thread pool của tools)."""
+    return await run_blocking(download_pdf, pdf_url, output_file_name)